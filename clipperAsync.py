@@ -0,0 +1,325 @@
+''' -----------------------------------------
+    This is the many files runner of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    Amplicon and single cell projects come as thousands of tiny fastq files,
+    for which starting magicClipper once per file (and opening every file
+    three times to find its phred encoding) takes longer than the trimming.
+    Here, all files are trimmed in one process, with asyncio:
+
+        magicClipper.py reads_dir -MF -CF 16
+
+    Up to CONCURRENTFILES files are streamed at the same time, in chunks. The
+    (de)compression and the file reads and writes are done in a thread pool,
+    so that the event loop trims the reads of one file while others are read
+    or written. The phred encoding of a file is found from its first chunk,
+    so every file is only opened once, and there is a single question before
+    overwriting output files, not one per file.
+
+    The trimming core is shared: one Trimmer per phred encoding, with its
+    compiled plan and trim cache, is used for all files. Only its stats are
+    swapped for the ones of the file whose chunk is trimmed. Files named like
+    NAME_1/NAME_2 (or NAME_R1/NAME_R2) are trimmed as read pairs.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import asyncio
+import concurrent.futures
+import copy
+import lzma
+import os
+import re
+import zlib
+
+import clipperFunctions as cf
+import clipperTrimmer as ct
+
+
+CHUNK_SIZE = 1 << 20                    # Bytes read from a file at once (after decompression)
+
+## Characters of each phred encoding (as in cf.phred_autodetect)
+PHRED33_BYTES = bytes(range(33, 75))
+PHRED64_BYTES = bytes(range(64, 105))
+
+## Forward and reverse file names of a read pair: NAME_1.fastq and NAME_2.fastq, or _R1/_R2
+PAIR_NAME = re.compile(r'^(.*_R?)([12])(\.fastq.*)$')
+
+
+def find_input_files(path):
+    """
+    This function returns the fastq files of a many files run, as a list of
+    (forward,) or (forward, reverse) tuples. The path is a directory, or a text
+    file listing fastq files, one per line. Files with a _1/_2 (or _R1/_R2)
+    name are paired if both are there.
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                 if name.endswith(cf.FASTQ_EXTENSIONS) and ('_trimmed.' not in name) and ('_unpaired.' not in name)]
+    else:
+        with open(path) as infile:
+            files = [line.strip() for line in infile if line.strip() != '']
+    for in_file in files:
+        if not in_file.endswith(cf.FASTQ_EXTENSIONS):
+            raise ValueError('not a fastq file: {}'.format(in_file))
+
+    found = set(files)
+    jobs = []
+    for in_file in files:
+        match = PAIR_NAME.match(in_file)
+        if match is not None:
+            start, number, end = match.groups()
+            mate = start + ('2' if number == '1' else '1') + end
+            if mate in found:
+                if number == '1':
+                    jobs.append((in_file, mate))
+                continue                        # Reverse files go with their forward file
+        jobs.append((in_file,))
+    return jobs
+
+
+def detect_phred(records):
+    """
+    This function finds the phred encoding ('33' or '64') from the quality strings
+    of a list of FastqRecords. Returns None if all of them fit both encodings.
+    """
+    for record in records:
+        is_phred33 = not record.qual.translate(None, PHRED33_BYTES)
+        is_phred64 = not record.qual.translate(None, PHRED64_BYTES)
+        if is_phred33 and not is_phred64:
+            return '33'
+        if is_phred64 and not is_phred33:
+            return '64'
+    return None
+
+
+class ChunkReader:
+    """
+    Reads the FastqRecords of an open fastq file (binary mode) chunk by chunk,
+    the blocking reads being done by a given function (see ManyFilesRunner).
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.rest = b''                         # Start of a record cut by the end of the last chunk
+        self.eof = False
+
+    async def read(self, blocking):
+        """
+        Returns the complete records of the next chunk(s), or [] at the end of the file.
+        As in ct.read_fastq, an incomplete record at the end of the file is ignored,
+        and reads without bases are given to the trimmer like the others.
+        """
+        while not self.eof:
+            data = await blocking(self.stream.read, CHUNK_SIZE)
+            if not data:
+                self.eof = True
+                lines = self.rest.split(b'\n')
+                if lines[-1] == b'':
+                    lines.pop()                 # Nothing after the last line break
+                count = len(lines) // 4 * 4
+            else:
+                lines = (self.rest + data).split(b'\n')
+                count = (len(lines) - 1) // 4 * 4     # The last line may not be complete
+            self.rest = b'\n'.join(lines[count:])
+            records = [ct.FastqRecord(lines[i].strip(), lines[i+1].strip(), lines[i+3].strip())
+                       for i in range(0, count, 4)]
+            if records:
+                return records
+        return []
+
+
+class FileJob:
+    """
+    One input file (or pair of files) of a many files run, with its output files
+    and stats. error is set if the file could not be trimmed.
+    """
+
+    def __init__(self, in_files, compression=None, keep_unpaired=False):
+        self.in_files = in_files
+        self.out_files = [cf.output_file_name(in_file, '_trimmed', compression) for in_file in in_files]
+        if keep_unpaired and (len(in_files) == 2):
+            self.out_files += [cf.output_file_name(in_file, '_unpaired', compression) for in_file in in_files]
+        self.compressions = [compression if compression is not None else cf.detect_compression(in_file)
+                             for in_file in in_files]
+        self.stats = ct.TrimStats()
+        self.phred = None
+        self.error = None
+
+
+def check_output_files(jobs):
+    """
+    This function makes sure that no two FileJobs write the same output file, and
+    that no output file is one of the input files. A ValueError is raised otherwise.
+    """
+    in_files = {os.path.abspath(in_file) for job in jobs for in_file in job.in_files}
+    seen = {}
+    for job in jobs:
+        for out_file in job.out_files:
+            path = os.path.abspath(out_file)
+            if path in seen:
+                raise ValueError('{} and {} would both be written to {}'.format(
+                    ' + '.join(seen[path].in_files), ' + '.join(job.in_files), out_file))
+            if path in in_files:
+                raise ValueError('output file {} is also an input file'.format(out_file))
+            seen[path] = job
+
+
+class ManyFilesRunner:
+    """
+    Trims many fastq files (or pairs of files) concurrently in one process, with
+    the same settings.
+    """
+
+    def __init__(self, config, user_phred='', concurrency=16):
+        if config.dedup:
+            raise ValueError('the duplicate filter cannot be used with many files')
+        self.config = config
+        self.user_phred = user_phred
+        self.concurrency = concurrency
+        self.trimmers = {}                      # One Trimmer per phred encoding, shared by all files
+
+    def trimmer(self, phred):
+        if phred not in self.trimmers:
+            config = copy.copy(self.config)
+            config.phred = phred
+            self.trimmers[phred] = ct.Trimmer(config)
+        return self.trimmers[phred]
+
+    def run(self, jobs):
+        """
+        Trims all FileJobs, and returns them with their stats (or error).
+        """
+        asyncio.run(self._run_all(jobs))
+        return jobs
+
+    async def _run_all(self, jobs):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+            await asyncio.gather(*(self._run(job, semaphore, executor) for job in jobs))
+
+    async def _run(self, job, semaphore, executor):
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+
+            def blocking(function, *args):
+                return loop.run_in_executor(executor, function, *args)
+
+            streams = []
+            try:
+                await self._trim_file(job, blocking, streams)
+            # Corrupt gzip and xz data raise their own errors, and only fail this file
+            except (IOError, EOFError, ValueError, zlib.error, lzma.LZMAError) as err:
+                job.error = str(err)
+            finally:
+                for stream in streams:
+                    await blocking(stream.close)
+
+    async def _trim_file(self, job, blocking, streams):
+        readers = []
+        for in_file in job.in_files:
+            stream = await blocking(cf.open_input_file, in_file)
+            streams.append(stream)
+            readers.append(ChunkReader(stream))
+
+        ## Determine Phred encoding type from the first reads, and check whether all files have the same encoding
+        pending = [[] for reader in readers]    # Records read but not trimmed yet
+        phreds = [None for reader in readers]
+        while (None in phreds) and not all(reader.eof for reader in readers):
+            for i, reader in enumerate(readers):
+                if phreds[i] is None:
+                    pending[i] += await reader.read(blocking)
+                    phreds[i] = detect_phred(pending[i])
+        phreds = [phred if phred is not None else self.user_phred for phred in phreds]
+        if not any(pending):
+            phreds = [self.user_phred or '33' for phred in phreds]     # Empty files: any encoding will do
+        if '' in phreds:
+            raise ValueError('the phred encoding type could not be determined, please specify it (-PH)')
+        if len(set(phreds)) > 1:
+            raise ValueError('the files do not have the same phred encoding type')
+        job.phred = phreds[0]
+        trimmer = self.trimmer(job.phred)
+
+        for out_file, compression in zip(job.out_files, job.compressions * 2):
+            streams.append(await blocking(cf.CODECS[compression], out_file, 'wb'))
+        out_streams = streams[len(readers):]
+
+        ## Trim and write the records read so far, and read more
+        while True:
+            count = min(len(records) for records in pending)
+            if count > 0:
+                outputs = self._trim_chunk(job, trimmer, [records[:count] for records in pending])
+                pending = [records[count:] for records in pending]
+                for output, out_stream in zip(outputs, out_streams):
+                    if output:
+                        await blocking(out_stream.write, b''.join(output))
+            if all(reader.eof for reader in readers):
+                break
+            for reader, records in zip(readers, pending):
+                records += await reader.read(blocking)
+
+        if any(pending):
+            raise ct.UnequalReadCountError()
+
+    def _trim_chunk(self, job, trimmer, chunks):
+        """
+        Trims the records of one chunk (a list per input file). Returns the lines
+        to write, as a list per output file. No other file can use the shared
+        trimmer in the meantime, as nothing is awaited here.
+        """
+        trimmer.stats = job.stats
+        outputs = [[] for out_file in job.out_files]
+        if len(chunks) == 1:
+            trim, output = trimmer.trim, outputs[0]
+            for record in chunks[0]:
+                trimmed = trim(record)
+                if trimmed is not None:
+                    output.append(trimmed.to_bytes())
+        elif len(outputs) == 4:
+            # Pairs where only one mate survives go to the unpaired outputs
+            for record_fw, record_rev in zip(*chunks):
+                trimmed_fw, trimmed_rev = trimmer.trim_pair_unpaired(record_fw, record_rev)
+                paired = (trimmed_fw is not None) and (trimmed_rev is not None)
+                if trimmed_fw is not None:
+                    outputs[0 if paired else 2].append(trimmed_fw.to_bytes())
+                if trimmed_rev is not None:
+                    outputs[1 if paired else 3].append(trimmed_rev.to_bytes())
+        else:
+            trim_pair = trimmer.trim_pair
+            for record_fw, record_rev in zip(*chunks):
+                trimmed = trim_pair(record_fw, record_rev)
+                if trimmed is not None:
+                    outputs[0].append(trimmed[0].to_bytes())
+                    outputs[1].append(trimmed[1].to_bytes())
+        return outputs
+
+
+def summary_lines(jobs):
+    """
+    This function returns the lines of the summary of a many files run: one line
+    per file (or pair of files), and the totals.
+    """
+    lines = ['{:<50} {:>5} {:>10} {:>10} {:>10} {:>10}'.format('File', 'Phred', 'Reads', 'Kept', 'Dropped', 'Trimmed')]
+    total_reads, total_kept, failed = 0, 0, 0
+    for job in jobs:
+        name = ' + '.join(job.in_files)
+        if job.error is not None:
+            failed += 1
+            lines.append('{:<50} ERROR: {}'.format(name, job.error))
+            continue
+        stats = job.stats
+        kept = stats.read_count - stats.dropped_reads
+        total_reads += stats.read_count
+        total_kept += kept
+        lines.append('{:<50} {:>5} {:>10} {:>10} {:>10} {:>10}'.format(
+            name, job.phred, stats.read_count, kept, stats.dropped_reads, stats.trimmed_reads))
+    lines.append('')
+    lines.append('Files trimmed: {} (failed: {})'.format(len(jobs) - failed, failed))
+    lines.append('Reads (or read pairs): {}, kept: {}'.format(total_reads, total_kept))
+    return lines
@@ -0,0 +1,176 @@
+''' -----------------------------------------
+    This is the duplicate read filter of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    Exact duplicate reads (or read pairs, in paired end mode) are recognised by
+    a 64-bit hash of their sequence. The hashes are stored in a compact
+    open-addressing hash set (8 bytes per slot), which may use up to half of
+    the user given memory cap. When the number of distinct reads no longer
+    fits in it, the hash set is swapped for a Bloom filter made of the rest of
+    the cap (the hash set is still there while its hashes are moved to the
+    filter), which keeps memory bounded at the cost of a small false-positive
+    rate. The filter is designed for the given false-positive rate, and the
+    rate expected at its final fill is reported, as it grows past the given
+    one when more distinct reads than the design capacity of the filter are
+    stored.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import array
+import hashlib
+import math
+
+
+MAX_LOAD = 0.7              # Maximum fill ratio of the open-addressing table
+START_SLOTS = 1 << 16       # Initial number of slots (512 kB)
+
+
+def sequence_hash(seq, seq_rev=None):
+    """
+    This function returns a 64-bit hash of a read sequence, or of both
+    sequences of a read pair. The hash is stable between runs, so the same
+    input always gives the same output.
+    """
+    if isinstance(seq, str):
+        seq = seq.encode()
+    if seq_rev is not None:
+        if isinstance(seq_rev, str):
+            seq_rev = seq_rev.encode()
+        seq = seq + b'\n' + seq_rev
+
+    value = int.from_bytes(hashlib.blake2b(seq, digest_size=8).digest(), 'little')
+    return value or 1                       # 0 marks an empty slot in the table
+
+
+class DuplicateFilter:
+    """
+    Remembers the hashes of the reads seen so far. is_duplicate() returns True
+    for a read that was seen before, and stores it otherwise.
+    """
+
+    def __init__(self, memory_mb=1024, fpr=0.001):
+        self.memory_bytes = int(memory_mb * 1024 * 1024)
+        self.fpr = fpr
+
+        self.mode = 'hash set'
+        self.distinct = 0                   # Distinct reads stored so far
+        self.duplicates = 0                 # Duplicates found so far
+
+        # Open-addressing hash set (linear probing), in half of the memory cap at most
+        self.table_bytes = self.memory_bytes // 2
+        slots = START_SLOTS
+        while slots * 8 > self.table_bytes and slots > 1:
+            slots //= 2
+        self.table = array.array('Q', bytes(slots * 8))
+        self.mask = slots - 1
+
+        # Bloom filter, only allocated when the memory cap is reached
+        self.bits = None
+        self.n_bits = 0
+        self.n_hashes = 0
+
+    def is_duplicate(self, value):
+        if self.bits is not None:
+            found = self._bloom_add(value)
+        else:
+            found = self._table_add(value)
+
+        if found:
+            self.duplicates += 1
+        else:
+            self.distinct += 1
+        return found
+
+    def _table_add(self, value):
+        table, mask = self.table, self.mask
+        i = value & mask
+        slot = table[i]
+        while slot != 0:                    # Probe until an empty slot or the value itself
+            if slot == value:
+                return True
+            i = (i + 1) & mask
+            slot = table[i]
+        table[i] = value
+
+        if self.distinct + 1 > MAX_LOAD * len(table):
+            self._grow()
+        return False
+
+    def _grow(self):
+        slots = len(self.table) * 2
+        if slots * 8 > self.table_bytes:    # Next table does not fit, switch to Bloom filter
+            self._switch_to_bloom()
+            return
+
+        old_table = self.table
+        self.table = array.array('Q', bytes(slots * 8))
+        self.mask = slots - 1
+        table, mask = self.table, self.mask
+        for value in old_table:
+            if value != 0:
+                i = value & mask
+                while table[i] != 0:
+                    i = (i + 1) & mask
+                table[i] = value
+
+    def _switch_to_bloom(self):
+        # The filter gets the memory cap left next to the table, as both are there until the table is emptied
+        self.mode = 'Bloom filter'
+        self.n_bits = max((self.memory_bytes - len(self.table) * 8) * 8, 64)
+        self.n_hashes = max(1, round(-math.log2(self.fpr)))     # Optimal for the given false-positive rate
+        self.bits = bytearray(self.n_bits // 8 + 1)
+
+        old_table = self.table
+        self.table = None
+        for value in old_table:
+            if value != 0:
+                self._bloom_add(value)
+
+    def _bloom_add(self, value):
+        # Double hashing: the k bit positions are derived from the 64-bit hash
+        bits, n_bits = self.bits, self.n_bits
+        step = (value >> 32) | 1
+        found = True
+        for i in range(self.n_hashes):
+            pos = (value + i * step) % n_bits
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & bit:
+                found = False
+                bits[byte] |= bit
+        return found
+
+    def estimated_fpr(self):
+        """
+        Expected false-positive rate of the filter at its current fill.
+        Always 0 while the exact hash set is in use.
+        """
+        if self.bits is None:
+            return 0.0
+        return (1 - math.exp(-self.n_hashes * self.distinct / self.n_bits)) ** self.n_hashes
+
+    def capacity(self):
+        """
+        Distinct reads the Bloom filter can hold within the given false-positive
+        rate (None while the exact hash set is in use).
+        """
+        if self.bits is None:
+            return None
+        return int(self.n_bits * math.log(2) ** 2 / -math.log(self.fpr))
+
+    def fpr_warning(self):
+        """
+        Returns a warning if the expected false-positive rate of the Bloom filter
+        is over the given one, None otherwise.
+        """
+        if self.estimated_fpr() <= self.fpr:
+            return None
+        return ('WARNING: the duplicate filter holds {} distinct reads, more than the {} it was designed for. '
+                'Its expected false-positive rate ({:.6f}) is over the given one ({}); give it more memory (-DM).'
+                ).format(self.distinct, self.capacity(), self.estimated_fpr(), self.fpr)
@@ -13,10 +13,13 @@
 
 ## Required modules
 import argparse
+import bz2
 import gzip
+import lzma
 import sys
 import os
 
+
 def run_arg_parser():
     """
     This is an argparser function that returns arguments given in the command line.
@@ -43,11 +46,15 @@ def run_arg_parser():
 
     parser.add_argument('-L', '--LEADING', default='0', metavar='',
                         help = "Number of bases to be trimmed from 3' end of all reads, \
-                        regardless of quality. Default is 0.")
+                        regardless of quality. Default is 0. Given as Q<quality> (e.g. Q20), \
+                        bases are instead trimmed from the 3' end while their quality is below \
+                        <quality>, before the sliding window trimming.")
 
     parser.add_argument('-T', '--TRAILING', default='0', metavar='',
                         help = "Number of bases to be trimmed from 5' end of all reads, \
-                        regardless of quality. Default is 0.")
+                        regardless of quality. Default is 0. Given as Q<quality> (e.g. Q20), \
+                        bases are instead trimmed from the 5' end while their quality is below \
+                        <quality>, before the sliding window trimming.")
 
     parser.add_argument('-W', '--WINDOWSIZE', default='4', metavar='',   
                         help = 'Window size for sliding window trimming approach. Default is 4. \
@@ -67,80 +74,142 @@ def run_arg_parser():
     parser.add_argument('-N', '--MAXN', default='15', metavar='',
                         help = 'Maximum number of unknown bases allowed in a read. Default is 15.')
 
-    return parser.parse_args()
-
+    parser.add_argument('-NT', '--NTRIM', default='', metavar='',
+                        help = "Unknown base trimming, done before all other trimming: 'ends' removes \
+                        the runs of N bases at both ends of the reads, and 'split' keeps the longest \
+                        part of the read without N bases. MAXN is then checked on the trimmed read. \
+                        Default is no unknown base trimming.")
+
+    parser.add_argument('-PX', '--POLYX', default='', metavar='',
+                        help = "Bases of the poly-X tails to remove from the 3' end of the reads, \
+                        e.g. 'G' for the poly-G tails of two-color chemistry (NovaSeq, NextSeq) or \
+                        'GA'. Done before all other trimming, as these tails have high quality. \
+                        Default is no poly-X trimming.")
+
+    parser.add_argument('-PXL', '--POLYXLENGTH', default='10', metavar='',
+                        help = "Minimum length of a poly-X tail. Default is 10.")
+
+    parser.add_argument('-PXM', '--POLYXMISMATCHES', default='1', metavar='',
+                        help = "Other bases allowed per 10 bases of a poly-X tail. Default is 1.")
+
+    parser.add_argument('-DD', '--DEDUP', action='store_true',
+                        help = "Remove exact duplicate reads (or exact duplicate read pairs \
+                        in paired end mode). Only the first copy of each read is kept.")
+
+    parser.add_argument('-DM', '--DEDUPMEMORY', default='1024', metavar='',
+                        help = "Memory cap (in MB) for the duplicate filter. The exact filter \
+                        uses up to half of it. When the distinct reads do not fit anymore, a Bloom \
+                        filter of the rest of the cap is used instead. Default is 1024.")
+
+    parser.add_argument('-DF', '--DEDUPFPR', default='0.001', metavar='',
+                        help = "False-positive rate aimed for by the Bloom filter of the \
+                        duplicate filter. The log gives the expected rate at the end of the run, \
+                        with a warning if it is over this one. Default is 0.001.")
+
+    parser.add_argument('-BIN', '--BINQUALITIES', '--bin-qualities', dest='BINQUALITIES',
+                        nargs='?', const='illumina', default='', metavar='',
+                        help = "Bin the quality scores of the written reads. Without a value, \
+                        the Illumina 8-level binning is used. A comma separated list of bin \
+                        edges (e.g. 0,10,20,30) can be given instead, and each bin is then \
+                        written as its middle value. Trimming is always done on unbinned scores.")
+
+    parser.add_argument('-C', '--CACHE', default='0', metavar='',
+                        help = "Number of quality strings for which the trimming result is \
+                        remembered. Useful for binned data, where the same quality strings come \
+                        back over and over. Default is 0 (no cache).")
+
+    parser.add_argument('-S', '--STEPS', default='', metavar='',
+                        help = "Ordered list of trimming steps in Trimmomatic syntax, e.g. \
+                        'LEADING:3 TRAILING:3 SLIDINGWINDOW:4:15 MINLEN:36'. When given, it is used \
+                        instead of LEADING, TRAILING, WINDOWSIZE, AVGQUALITY, BASEQUALITY, MINLEN \
+                        and MAXN. See clipperPlan.py for the supported steps.")
+
+    parser.add_argument('-U', '--UNPAIRED', action='store_true',
+                        help = "In paired end mode, keep the surviving read of pairs where only \
+                        one mate is dropped, in FILE1_unpaired.fastq and FILE2_unpaired.fastq.")
+
+    parser.add_argument('-M', '--METRICS', default='', metavar='',
+                        help = "Prometheus textfile (e.g. /var/lib/node_exporter/trim.prom) where \
+                        the progress of the trimming is written regularly: reads processed, kept and \
+                        dropped by reason, bytes in and out, reads per second and estimated time to \
+                        completion. Cannot be used in the many files, preview and sweep modes. \
+                        Default is no metrics.")
+
+    parser.add_argument('-MI', '--METRICSINTERVAL', default='10', metavar='',
+                        help = "Seconds between two writes of the metrics file. Default is 10.")
+
+    parser.add_argument('-MM', '--MAXMEMORY', '--max-memory', dest='MAXMEMORY', default='0', metavar='',
+                        help = "Memory budget in MB. The duplicate filter, the trim cache and the \
+                        batches of reads handed to worker processes are sized to fit in it, and the \
+                        cache is emptied and the batches made smaller when the memory use of the program \
+                        goes above it. Must be above the memory used at start by all processes. Cannot \
+                        be used in the many files, preview and sweep modes. Default is 0 (no budget).")
+
+    parser.add_argument('-P', '--PROCESSES', default='1', metavar='',
+                        help = "Number of worker processes. Uncompressed single end files are split \
+                        into byte ranges (using the index of clipperIndex.py if there is one), and so \
+                        are gzip files whose index has a restart point for every worker; other compressed \
+                        and paired end files are read by the main process, which hands the reads to the \
+                        workers through shared memory. Cannot be used together with DEDUP. Default is 1.")
+
+    parser.add_argument('-OC', '--OUTPUTCOMPRESSION', default='same', metavar='',
+                        help = "Compression of the output files: 'gz', 'bz2', 'xz', 'none', or 'same' \
+                        for the compression of the input files. Input compression is always detected \
+                        from the file itself. Default is same.")
+
+    parser.add_argument('-R', '--REJECTED', action='store_true',
+                        help = "Write the dropped reads (or read pairs), before trimming, to \
+                        FILE1_rejected.fastq (and FILE2_rejected.fastq), with the reason why they \
+                        were dropped in their header.")
+
+    parser.add_argument('-RS', '--REJECTEDSAMPLE', default='0', metavar='',
+                        help = "Only write a random sample of at most REJECTEDSAMPLE dropped reads \
+                        (or read pairs) per reason to the rejected reads output. The sample is \
+                        seeded with SEED. Default is 0 (all dropped reads).")
+
+    parser.add_argument('-PV', '--PREVIEW', default='0', metavar='',
+                        help = "Preview mode: only trim the first PREVIEW reads (or read pairs), and \
+                        print the projected stats of the full run, with the length and quality \
+                        distributions of the kept reads. No output files are written. Default is 0 (off).")
+
+    parser.add_argument('-FR', '--FRACTION', default='0', metavar='',
+                        help = "Preview mode on a random subset: every read (or read pair) is trimmed \
+                        with probability FRACTION (0-1), and the others are skipped. Can be combined \
+                        with PREVIEW to stop after PREVIEW reads. Without PREVIEW, compressed and paired \
+                        end inputs are only read up to their first million reads. Default is 0 (off).")
+
+    parser.add_argument('-SD', '--SEED', default='1', metavar='',
+                        help = "Seed of the random subset of FRACTION. Default is 1.")
+
+    parser.add_argument('-SW', '--SWEEP', default='', metavar='',
+                        help = "Parameter sweep: grid of average qualities, window sizes and minimum \
+                        lengths, e.g. 'AQ=10,15,20 W=4,5 ML=30,36'. The reads are trimmed once for all \
+                        combinations, and the reads kept, bases kept and average quality of each one \
+                        are printed. No output files are written. Can be combined with PREVIEW and \
+                        FRACTION. Default is no sweep.")
+
+    parser.add_argument('-MF', '--MANYFILES', action='store_true',
+                        help = "Many files mode: FILE1 is a directory, or a text file listing fastq files \
+                        (one per line). All of them are trimmed concurrently in one process, and files \
+                        named like NAME_1/NAME_2 (or NAME_R1/NAME_R2) are trimmed as read pairs. \
+                        A summary of all files is written to FILE1.log. Cannot be used together with \
+                        DEDUP, REJECTED, PROCESSES, MAXMEMORY, METRICS, or the preview and sweep modes.")
+
+    parser.add_argument('-CF', '--CONCURRENTFILES', default='16', metavar='',
+                        help = "Number of files trimmed at the same time in many files mode. Default is 16.")
 
-def quality_trim(read, qual_str, qual_score, WIN_SIZE, AVG_QUALITY, BASE_QUALITY):
-    """
-    This function removes 5' and 3' based on their quality.
-    If WIN_SIZE > 1, it takes the sliding window approach, with AVG_QUALITY as threshold.
-    If WIN_SIZE = 1, it takes the single base approach, with BASE_QUALITY as threshold.
-    """
-    
-    trimmed = False                         # With this flag we keep track of the trimmed reads
-    
-    ## LEADING TRIM 
-    window = qual_score[:WIN_SIZE]          # Read first window 
-    if WIN_SIZE > 1:                        # Slide     
-        while (len(window) != 0) and (sum(window)/len(window) < AVG_QUALITY):
-            trimmed = True
-            
-            qual_score = qual_score[1:]     # Remove 3' end base
-            qual_str = qual_str[1:]
-            read = read[1:]
-            
-            window = qual_score[:WIN_SIZE]  # Read new window
-    
-    elif WIN_SIZE == 1:                     # Slide
-        while (len(window) != 0) and (sum(window)/len(window) < BASE_QUALITY):
-            trimmed = True
-            
-            qual_score = qual_score[1:]     # Remove 3' end base
-            qual_str = qual_str[1:]
-            read = read[1:]
-            
-            window = qual_score[:WIN_SIZE]  # Read new window   
-
-    ## TRAILING TRIM
-    window = qual_score[-WIN_SIZE:]         # Read first window
-    if WIN_SIZE > 1:                        # Slide
-        while (len(window) != 0) and (sum(window)/len(window) < AVG_QUALITY):
-            trimmed = True
-            
-            qual_score = qual_score[:-1]    # Remove 5' end base
-            qual_str = qual_str[:-1]
-            read = read[:-1]
-            
-            window = qual_score[-WIN_SIZE:] # Read new window
-    
-    elif WIN_SIZE == 1:                     # Slide
-        while (len(window) != 0) and (sum(window)/len(window) < BASE_QUALITY):
-            trimmed = True
-            
-            qual_score = qual_score[:-1]    # Remove 5' end base
-            qual_str = qual_str[:-1]
-            read = read[:-1]
-            
-            window = qual_score[-WIN_SIZE:] # Read new window      
-
-    return read, qual_str, qual_score, trimmed
+    return parser.parse_args()
 
 
-def global_trim(DNA_str,quality_str, quality_score, LEADING, TRAILING): 
+def parse_end_trim(value):
     """
-    This function removes leading and trailing bases in all reads, if user says so.
+    This function reads a LEADING or TRAILING setting, which is either a number of
+    bases (e.g. '5') or a quality threshold (e.g. 'Q20'). It returns the tuple
+    (bases, quality), where the setting that is not used is 0.
     """
-    if TRAILING != 0:
-        quality_score = quality_score[LEADING:-TRAILING]
-        quality_str = quality_str[LEADING:-TRAILING]
-        DNA_str = DNA_str[LEADING:-TRAILING]
-    
-    else: 
-        quality_score = quality_score[LEADING:]
-        quality_str = quality_str[LEADING:]
-        DNA_str = DNA_str[LEADING:]
-
-    return DNA_str, quality_str, quality_score
+    if value.upper().startswith('Q'):
+        return 0, int(value[1:])
+    return int(value), 0
 
 
 def phred_autodetect(input_file, USER_PHRED):
@@ -148,10 +217,7 @@ def phred_autodetect(input_file, USER_PHRED):
     This function detects if a file is encoded using phred33 or phred64
     """
 
-    if input_file.endswith('.gz'):              # Open file
-        infile = gzip.open(input_file, 'rt')
-    else:    
-        infile = open(input_file, 'r')               
+    infile = CODECS[detect_compression(input_file)](input_file, 'rt')      # Open file
 
     # Phred sets
     phred64_set = set("@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\]^_`abcdefgh")
@@ -195,85 +261,125 @@ def phred_autodetect(input_file, USER_PHRED):
         return USER_PHRED  
 
 
-def quality_score(quality_str, phred):
+## Illumina 8-level quality binning: (lowest score, highest score, binned score)
+ILLUMINA_BINS = [(2, 9, 6), (10, 19, 15), (20, 24, 22), (25, 29, 27),
+                 (30, 34, 33), (35, 39, 37), (40, 41, 40)]
 
-    # Controlling if line contains unknown character 
-    phred64_set = set("@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\]^_`abcdefgh")
-    phred33_set = set("!\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJ")
-    qual_set = set(quality_str)
-
-    phred64_dict = {'@': 0,'A': 1,'B': 2,'C': 3, 'D': 4,'E': 5,'F': 6,'G': 7,'H': 8,'I': 9,
-        'J': 10,'K': 11,'L': 12,'M': 13,'N': 14,'O': 15,'P': 16,'Q': 17,'R': 18,
-        'S': 19,'T': 20,'U': 21,'V': 22,'W': 23,'X': 24,'Y': 25,'Z': 26,'[': 27,
-        '\\': 28,']': 29,'^': 30,'_': 31,'`': 32,'a': 33,'b': 34,'c': 35,'d': 36,
-        'e': 37, 'f': 38,'g': 39,'h': 40,'i': 41}
-
-    phred33_dict = {'!': 0,'"': 1,'#': 2,'$': 3,'%': 4,'&': 5,"'": 6,'(': 7,')': 8,
-        '*': 9,'+': 10,',': 11,'-': 12,'.': 13,'/': 14,'0': 15,'1': 16,
-        '2': 17,'3': 18,'4': 19,'5': 20,'6': 21,'7': 22,'8': 23,'9': 24,
-        ':': 25,';': 26,'<': 27,'=': 28,'>': 29,'?': 30,'@': 31,'A': 32,
-        'B': 33,'C': 34,'D': 35,'E': 36,'F': 37,'G': 38,'H': 39,'I': 40,
-        'J': 41}
-
-    quality_scores = []  
-    
-    if phred == '64':
-        for i in range(len(quality_str)):
-            try:
-                quality_scores.append(int(phred64_dict[quality_str[i]]))
-            except KeyError:                        # If unknown character is found, return 'unknown'. This read will be removed in the main body of the program.
-                quality_scores='unknown'
-                break
-        return quality_scores
-
-    #If Phred33
-    elif phred == '33':
-        for i in range(len(quality_str)):
-            try:
-                quality_scores.append(int(phred33_dict[quality_str[i]]))
-            except KeyError:
-                quality_scores='unknown'
-                break
-        return quality_scores  
-  
-
-def print_read(ID, seq, qual_str, file):
-    print(ID, file=file)
-    print(seq, file=file)
-    print('+', file=file)
-    print(qual_str, file=file)
-
-
-def controling_output_file(input_file):
-    if input_file.endswith('.gz'):
-        base = input_file.split('.')[0]
-        file_name = base + '_trimmed.fastq.gz'
-        if os.path.exists(os.getcwd() + '/' + file_name):
-            answer = None
-            while  answer not in ['y','n']:
-                answer = input("{} will be overwritten. Do you want to continue? y/n: ".format(file_name))
-                if answer == 'y':
-                    return(gzip.open(file_name, 'wt'))
-                elif answer == 'n':
-                    print('Exiting program')
-                    sys.exit(1)
-                else:
-                    print('Invalid input')
-        else:
-            return(gzip.open(file_name, 'wt'))
+
+def parse_bin_edges(BIN_QUALITIES):
+    """
+    This function turns the user input for quality binning into a list of bins
+    (lowest score, highest score, binned score). 'illumina' gives the Illumina
+    8-level bins, a comma separated list of edges gives one bin per edge.
+    """
+    if BIN_QUALITIES == 'illumina':
+        return ILLUMINA_BINS
+
+    edges = [int(edge) for edge in BIN_QUALITIES.split(',')]
+    if edges != sorted(set(edges)) or edges[0] < 0 or edges[-1] > 41:
+        raise ValueError('bin edges must be increasing scores between 0 and 41: ' + BIN_QUALITIES)
+
+    bins = []
+    for i in range(len(edges)):
+        low = edges[i]
+        high = edges[i+1] - 1 if i+1 < len(edges) else 41
+        bins.append((low, high, (low + high) // 2))
+    return bins
+
+
+def quality_bin_table(phred, bins):
+    """
+    This function builds a translation table that maps every encoded quality
+    character onto the character of its bin. It can be used with both
+    str.translate and bytes.translate on encoded quality strings.
+    """
+    offset = int(phred)
+    source, target = bytearray(), bytearray()
+    for low, high, binned in bins:
+        for score in range(low, high + 1):
+            source.append(score + offset)
+            target.append(binned + offset)
+    return bytes.maketrans(bytes(source), bytes(target))
+
+
+## Compression formats: first bytes of the file, and function to open it
+COMPRESSION_MAGIC = [(b'\x1f\x8b', 'gz'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz')]
+CODECS = {'': open, 'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+## Accepted input file extensions
+FASTQ_EXTENSIONS = ('.fastq', '.fastq.gz', '.fastq.bz2', '.fastq.xz')
+
+
+def detect_compression(input_file):
+    """
+    This function finds out from its first bytes if a file is compressed with gzip,
+    bzip2 or xz. Returns 'gz', 'bz2', 'xz', or '' for a not compressed file.
+    """
+    with open(input_file, 'rb') as infile:
+        start = infile.read(6)
+    for magic, compression in COMPRESSION_MAGIC:
+        if start.startswith(magic):
+            return compression
+    return ''
+
+
+def open_input_file(input_file):
+    """
+    This function opens a (compressed or not) fastq file for reading, in binary mode.
+    """
+    return CODECS[detect_compression(input_file)](input_file, 'rb')
+
+
+def file_name_base(input_file):
+    """
+    This function returns the name of a fastq file without its extension (.fastq,
+    and .gz, .bz2 or .xz if compressed), in the directory of the file. Dots in
+    the directory or the rest of the name are kept.
+    """
+    directory, name = os.path.split(input_file)
+    base, extension = os.path.splitext(name)
+    if extension[1:] in CODECS:
+        base = os.path.splitext(base)[0]
+    return os.path.join(directory, base)
+
+
+def output_file_name(input_file, suffix='_trimmed', compression=None):
+    """
+    This function returns the name of the output file of an input file, next to it.
+    The suffix is added to the base of the file name, and the extension of compression
+    ('gz', 'bz2', 'xz' or '' for none) is added, or the one of the input file if it is None.
+    """
+    if compression is None:
+        compression = detect_compression(input_file)
+
+    base = file_name_base(input_file)
+    file_name = base + suffix + '.fastq'
+    if compression != '':
+        file_name += '.' + compression
+    return file_name
+
+
+def controling_output_file(input_file, suffix='_trimmed', compression=None):
+    """
+    This function opens the output file of an input file (in binary mode), and asks
+    before overwriting it. The suffix is added to the base of the file name.
+    The output is compressed with compression ('gz', 'bz2', 'xz' or '' for none),
+    or like the input file if it is None.
+    """
+    if compression is None:
+        compression = detect_compression(input_file)
+    file_name = output_file_name(input_file, suffix, compression)
+
+    if os.path.exists(file_name):
+        answer = None
+        while  answer not in ['y','n']:
+            answer = input("{} will be overwritten. Do you want to continue? y/n: ".format(file_name))
+            if answer == 'y':
+                return(CODECS[compression](file_name, 'wb'))
+            elif answer == 'n':
+                print('Exiting program')
+                sys.exit(1)
+            else:
+                print('Invalid input')
     else:
-        base = input_file.split('.')[0]
-        file_name = base + '_trimmed.fastq'
-        if  os.path.exists(os.getcwd() + '/' + file_name):
-            answer = None
-            while  answer not in ['y','n']:
-                answer = input("{} will be overwritten. Do you want to continue? y/n: ".format(file_name))
-                if answer == 'y':
-                    return(open(file_name, 'w'))
-                elif answer == 'n':
-                    print('Exiting program')
-                    sys.exit(1)
-                else:
-                    print('Invalid input')
-        else:
-            return(open(file_name, 'w'))
\ No newline at end of file
+        return(CODECS[compression](file_name, 'wb'))
\ No newline at end of file
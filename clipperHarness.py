@@ -0,0 +1,413 @@
+''' -----------------------------------------
+    This is the test harness of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    The repository holds several trimmer implementations, which have grown
+    apart: magicClipper.py (with clipperFunctions.py and clipperTrimmer.py),
+    trimmerViktor.py and trimmerCelia.py (with trimmer_functions.py) and
+    trimmer_SW.py. The harness runs each of them on the same generated reads
+    and compares their output with the one of a reference engine
+    (magicClipper by default), read by read. It also records the runtime and
+    peak memory of every engine, so that a faster engine is only adopted once
+    its output is proven to be the same.
+
+    Every engine runs in its own temporary directory, as a separate process.
+    The peak memory is taken from the resource usage of that process (os.wait4).
+
+        python clipperHarness.py -R 50000 -O results.json
+        python clipperHarness.py -R 50000 -B results.json
+
+    With a baseline (-B, the results of an earlier run), the harness exits with
+    an error when an engine got slower or bigger than the tolerance, or when
+    an engine whose output was the same as the reference now differs.
+
+    The reference itself is checked against golden digests kept in the
+    repository (clipperHarness.golden.json): the SHA-256 of every file that
+    magicClipper writes (outputs and log), for the default generated reads and
+    a fixed set of settings (GOLDEN_OPTIONS). Every run with the default reads
+    and one of these settings is compared with them, and fails if magicClipper
+    itself changed its output. All golden settings are run with
+
+        python clipperHarness.py -G
+
+    and, after an intended change of the output, written again with -UG.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import argparse
+import hashlib
+import json
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+## Engines: script, whether it takes the usual options, whether it can do single end
+## reads, and its output file name(s) for an input file name
+ENGINES = {
+    'magicClipper': {'script': 'magicClipper.py', 'options': True, 'single': True,
+                     'output': lambda in_file: in_file.split('.')[0] + '_trimmed.fastq'},
+    'trimmerViktor': {'script': 'trimmerViktor.py', 'options': True, 'single': True,
+                      'output': lambda in_file: in_file.split('.')[0] + '_trimmed.fa'},
+    'trimmerCelia': {'script': 'trimmerCelia.py', 'options': True, 'single': True,
+                     'output': lambda in_file: in_file.split('.')[0] + '_trimmed.fa'},
+    # trimmer_SW.py has its (paired end) input and output file names written in it
+    'trimmer_SW': {'script': 'trimmer_SW.py', 'options': False, 'single': False,
+                   'inputs': ['BRISCOE_0069_BD18RUACXX_L2_1_pf.fastq', 'BRISCOE_0069_BD18RUACXX_L2_2_pf.fastq'],
+                   'output': lambda in_file: 'trimmed_' + in_file.split('.')[0] + '_SW.fastq'},
+}
+REFERENCE = 'magicClipper'
+
+TIME_TOLERANCE = 0.2                    # Allowed slow down against the baseline (20 %)
+MEMORY_TOLERANCE = 0.2
+
+## Golden digests of the reference: generated reads (the default ones) and settings they are kept for
+GOLDEN_FILE = os.path.join(REPO_DIR, 'clipperHarness.golden.json')
+GOLDEN_INPUT = {'reads': 20000, 'read_length': 100, 'seed': 1}
+GOLDEN_OPTIONS = ['', '-W 1 -BQ 10', '-L 3 -T 2 -ML 20', '-W 6 -AQ 25 -N 2', '-L Q20 -T Q20 -ML 0 -AQ 0',
+                  '-S "LEADING:3 TRAILING:3 SLIDINGWINDOW:4:15 MINLEN:36"', '-S SLIDINGWINDOW:4:30', '-U',
+                  '-NT split -PX G -PXL 5', '-BIN -S TOPHRED64', '-C 1000 -DD']
+
+
+def generate_reads(file_name, read_count, read_length, seed, mate=1):
+    """
+    This function writes read_count random reads (phred 33) onto a fastq file. The
+    reads have the usual problems: low quality ends, unknown bases, short reads
+    and some reads of very low quality.
+    """
+    rng = random.Random(seed * 2 + mate)
+    with open(file_name, 'w') as fastq:
+        for number in range(read_count):
+            length = read_length if rng.random() > 0.1 else rng.randint(10, read_length)
+            seq = [rng.choice('ACGT') for i in range(length)]
+            top = 38 if rng.random() > 0.05 else 12           # Some reads are bad as a whole
+            qual = [max(2, min(41, int(rng.gauss(top, 4)))) for i in range(length)]
+
+            # Quality drops at the 3' end, and sometimes at the 5' end
+            tail = rng.randint(0, length // 3)
+            for i in range(length - tail, length):
+                qual[i] = max(2, qual[i] - rng.randint(10, 35))
+            for i in range(rng.randint(0, 5) if rng.random() < 0.3 else 0):
+                if i < length:
+                    qual[i] = 2
+            # Unknown bases, with the lowest quality
+            for i in range(rng.randint(0, 20) if rng.random() < 0.1 else 0):
+                position = rng.randrange(length)
+                seq[position], qual[position] = 'N', 2
+
+            print('@read{}/{}'.format(number, mate), file=fastq)
+            print(''.join(seq), file=fastq)
+            print('+', file=fastq)
+            print(''.join(chr(score + 33) for score in qual), file=fastq)
+
+
+def read_output(file_name):
+    """
+    This function reads the output of an engine as a dict of read name -> (sequence,
+    quality). Returns None if the file doesn't exist.
+    """
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name) as fastq:
+        lines = fastq.read().split('\n')
+    reads = {}
+    for i in range(0, len(lines) - 3, 4):
+        reads[lines[i].split()[0]] = (lines[i+1], lines[i+3])
+    return reads
+
+
+def compare_outputs(reference, output):
+    """
+    This function compares the reads of an output with the ones of the reference
+    output. Returns a dict with the number of reads that are the same, trimmed
+    differently, missing from the output and only in the output.
+    """
+    same = sum(1 for name, read in output.items() if reference.get(name) == read)
+    different = sum(1 for name, read in output.items() if (name in reference) and (reference[name] != read))
+    return {'same': same, 'different': different,
+            'missing': sum(1 for name in reference if name not in output),
+            'extra': sum(1 for name in output if name not in reference)}
+
+
+def file_digests(run_dir):
+    """
+    This function returns the SHA-256 of every file an engine wrote in its directory
+    (outputs and log, not its inputs nor its stdout and stderr), by file name.
+    """
+    digests = {}
+    for name in sorted(os.listdir(run_dir)):
+        path = os.path.join(run_dir, name)
+        if os.path.islink(path) or name in ('stdout', 'stderr'):
+            continue
+        with open(path, 'rb') as written:
+            digests[name] = hashlib.sha256(written.read()).hexdigest()
+    return digests
+
+
+def golden_key(read_count, read_length, seed, options):
+    """
+    This function returns the key of a run in the golden digests, or None if its
+    reads are not the golden ones.
+    """
+    if {'reads': read_count, 'read_length': read_length, 'seed': seed} != GOLDEN_INPUT:
+        return None
+    return options
+
+
+def golden_changes(results, golden, key):
+    """
+    This function compares the digests of the reference with the golden ones.
+    Returns the list of changes found, and marks the reference of every mode with
+    golden = True (same), False (changed) or None (no golden digests).
+    """
+    changes = []
+    for mode, runs in results.items():
+        run = runs.get(REFERENCE)
+        if run is None:
+            continue
+        expected = golden.get(key, {}).get(mode) if key is not None else None
+        if (expected is None) or (run['status'] != 0):
+            run['golden'] = None
+            continue
+        changed = sorted(name for name in set(expected) | set(run['digests']) if expected.get(name) != run['digests'].get(name))
+        run['golden'] = not changed
+        if changed:
+            changes.append('{} ({}, settings \'{}\'): output changed from the golden one: {}'.format(
+                REFERENCE, mode, key, ', '.join(changed)))
+    return changes
+
+
+def run_engine(name, in_files, settings, work_dir):
+    """
+    This function runs one engine on the input files in its own directory. Returns
+    the result: runtime, peak memory (MB), exit status, last error line, digests of
+    the written files and the names of the output files. The outputs are only read once all engines ran,
+    as the peak memory of a process also counts the memory of the harness at
+    the time it was started.
+    """
+    engine = ENGINES[name]
+    run_dir = os.path.join(work_dir, name)
+    os.makedirs(run_dir)
+
+    # Inputs under the names the engine expects
+    names = engine.get('inputs', [os.path.basename(in_file) for in_file in in_files])
+    for in_file, link_name in zip(in_files, names):
+        os.symlink(os.path.abspath(in_file), os.path.join(run_dir, link_name))
+
+    command = [sys.executable, os.path.join(REPO_DIR, engine['script'])]
+    if engine['options']:
+        command += names + settings
+
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, 'stdout'), 'w') as out, open(os.path.join(run_dir, 'stderr'), 'w') as err:
+        process = subprocess.Popen(command, cwd=run_dir, stdin=subprocess.DEVNULL, stdout=out, stderr=err)
+        pid, status, usage = os.wait4(process.pid, 0)
+    runtime = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)     # Already waited for
+
+    # ru_maxrss is in bytes on macOS, kB elsewhere
+    peak = usage.ru_maxrss / 2**20 if sys.platform == 'darwin' else usage.ru_maxrss / 2**10
+
+    with open(os.path.join(run_dir, 'stderr')) as err:
+        error_lines = err.read().strip().split('\n')
+    return {'runtime': round(runtime, 3), 'peak_mb': round(peak, 1), 'status': process.returncode,
+            'error': error_lines[-1] if process.returncode != 0 else '',
+            'digests': file_digests(run_dir),
+            'outputs': [os.path.join(run_dir, engine['output'](link_name)) for link_name in names]}
+
+
+def run_harness(engines, read_count, read_length, seed, settings, keep=False):
+    """
+    This function generates the inputs, runs every engine in single and paired end
+    mode, and compares their outputs with the reference. Returns the results as
+    {mode: {engine: result}}, without the outputs themselves.
+    """
+    work_dir = tempfile.mkdtemp(prefix='magicClipper_harness_')
+    inputs = {'single': [os.path.join(work_dir, 'sim_1.fastq')],
+              'paired': [os.path.join(work_dir, 'sim_1.fastq'), os.path.join(work_dir, 'sim_2.fastq')]}
+    generate_reads(inputs['paired'][0], read_count, read_length, seed, 1)
+    generate_reads(inputs['paired'][1], read_count, read_length, seed, 2)
+
+    results = {}
+    try:
+        for mode, in_files in inputs.items():
+            mode_dir = os.path.join(work_dir, mode)
+            names = [name for name in engines if (mode == 'paired') or ENGINES[name]['single']]
+            # Engines without options can only be compared with the default settings
+            names = [name for name in names if ENGINES[name]['options'] or not settings]
+            runs = {name: run_engine(name, in_files, settings, mode_dir) for name in names}
+
+            outputs = {name: [read_output(file_name) for file_name in run.pop('outputs')] for name, run in runs.items()}
+            reference = outputs.get(REFERENCE)
+            for name, run in runs.items():
+                if (reference is None) or (None in reference) or (None in outputs[name]):
+                    run['equivalent'] = None    # Can't be compared
+                    continue
+                run['files'] = [compare_outputs(ref_output, output)
+                                for ref_output, output in zip(reference, outputs[name])]
+                run['equivalent'] = all((diff['same'] == len(ref_output)) and (diff['same'] == len(output))
+                                        for diff, ref_output, output in zip(run['files'], reference, outputs[name]))
+            results[mode] = runs
+    finally:
+        if keep:
+            print('Runs kept in', work_dir)
+        else:
+            shutil.rmtree(work_dir)
+    return results
+
+
+def regressions(results, baseline):
+    """
+    This function compares the results with the ones of an earlier run, and returns
+    the list of regressions found.
+    """
+    found = []
+    for mode, runs in results.items():
+        for name, run in runs.items():
+            before = baseline.get(mode, {}).get(name)
+            if before is None:
+                continue
+            if before.get('equivalent') and not run.get('equivalent'):
+                found.append('{} ({}): output is no longer the same as {}'.format(name, mode, REFERENCE))
+            if (name == REFERENCE) and ('digests' in before) and (before['digests'] != run['digests']):
+                found.append('{} ({}): output changed from the baseline'.format(name, mode))
+            if (before['status'] == 0) and (run['status'] != 0):
+                found.append('{} ({}): now fails: {}'.format(name, mode, run['error']))
+            if run['status'] == 0 and before['status'] == 0:
+                if run['runtime'] > before['runtime'] * (1 + TIME_TOLERANCE):
+                    found.append('{} ({}): runtime {} s, was {} s'.format(name, mode, run['runtime'], before['runtime']))
+                if run['peak_mb'] > before['peak_mb'] * (1 + MEMORY_TOLERANCE):
+                    found.append('{} ({}): peak memory {} MB, was {} MB'.format(name, mode, run['peak_mb'], before['peak_mb']))
+    return found
+
+
+def print_results(results):
+    for mode, runs in results.items():
+        print('\n===============\n{} END\n==============='.format(mode.upper()))
+        print('{:<15} {:>10} {:>10}  {}'.format('Engine', 'Time (s)', 'Peak (MB)', 'Output'))
+        for name, run in runs.items():
+            if run['status'] != 0:
+                output = 'FAILED: ' + run['error']
+            elif run['equivalent'] is None:
+                output = 'no output to compare'
+            elif name == REFERENCE:
+                output = 'reference' + {True: ' (same as golden)', False: ' (CHANGED from golden)'}.get(run.get('golden'), '')
+            elif run['equivalent']:
+                output = 'same as ' + REFERENCE
+            else:
+                output = 'DIFFERENT: ' + '; '.join('file {}: {} same, {} different, {} missing, {} extra'.format(
+                    i + 1, diff['same'], diff['different'], diff['missing'], diff['extra'])
+                    for i, diff in enumerate(run['files']))
+            print('{:<15} {:>10} {:>10}  {}'.format(name, run['runtime'], run['peak_mb'], output))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Runs the trimmer implementations of the repository \
+    on the same generated reads, compares their outputs with the one of magicClipper, and records \
+    their runtime and peak memory.')
+    parser.add_argument('-R', '--READS', default='20000', metavar='',
+                        help = "Number of generated reads (or read pairs). Default is 20000.")
+    parser.add_argument('-RL', '--READLENGTH', default='100', metavar='',
+                        help = "Length of the generated reads. Default is 100.")
+    parser.add_argument('-SD', '--SEED', default='1', metavar='',
+                        help = "Seed of the generated reads. Default is 1.")
+    parser.add_argument('-E', '--ENGINES', default=','.join(ENGINES), metavar='',
+                        help = "Comma separated engines to run. Default is all: " + ', '.join(ENGINES) + '.')
+    parser.add_argument('-S', '--SETTINGS', default='', metavar='',
+                        help = "Options given to every engine, e.g. '-W 5 -ML 30'. Engines without \
+                        options (trimmer_SW) are only run with the default settings.")
+    parser.add_argument('-O', '--OUTPUT', default='', metavar='',
+                        help = "JSON file where the results are saved, to be used as a baseline later.")
+    parser.add_argument('-B', '--BASELINE', default='', metavar='',
+                        help = "JSON file with the results of an earlier run. The harness fails if an \
+                        engine got more than 20 %% slower or bigger, or its output is no longer the same.")
+    parser.add_argument('-K', '--KEEP', action='store_true',
+                        help = "Keep the generated inputs and the outputs of the engines.")
+    parser.add_argument('-G', '--GOLDEN', action='store_true',
+                        help = "Run the reference with every golden setting on the golden reads, and \
+                        fail if its output changed from the golden digests.")
+    parser.add_argument('-UG', '--UPDATEGOLDEN', action='store_true',
+                        help = "Like GOLDEN, but write the digests of the outputs as the new golden ones \
+                        (after an intended change of the output).")
+    args = parser.parse_args()
+
+    try:
+        engines = [name for name in args.ENGINES.split(',') if name != '']
+        for name in engines:
+            if name not in ENGINES:
+                raise ValueError('unknown engine: {} \nAccepted input: {}'.format(name, ', '.join(ENGINES)))
+        if REFERENCE not in engines:
+            engines.insert(0, REFERENCE)            # Needed for the comparison
+        read_count, read_length, seed = int(args.READS), int(args.READLENGTH), int(args.SEED)
+    except ValueError as err:
+        print('Invalid input. Reason: ' + str(err))
+        sys.exit(1)
+
+    golden = {}
+    if os.path.exists(GOLDEN_FILE):
+        with open(GOLDEN_FILE) as golden_file:
+            golden = json.load(golden_file)
+
+    if args.GOLDEN or args.UPDATEGOLDEN:
+        # Only the reference, on the golden reads, with every golden setting
+        changes = []
+        for options in GOLDEN_OPTIONS:
+            results = run_harness([REFERENCE], GOLDEN_INPUT['reads'], GOLDEN_INPUT['read_length'],
+                                  GOLDEN_INPUT['seed'], shlex.split(options))
+            key = golden_key(GOLDEN_INPUT['reads'], GOLDEN_INPUT['read_length'], GOLDEN_INPUT['seed'], options)
+            if args.UPDATEGOLDEN:
+                golden[key] = {mode: runs[REFERENCE]['digests'] for mode, runs in results.items()}
+            changes += golden_changes(results, golden, key)
+            print("{:<60} {}".format("'{}'".format(options), ', '.join(
+                '{}: {}'.format(mode, {True: 'same', False: 'CHANGED', None: 'no golden digests'}[runs[REFERENCE]['golden']])
+                for mode, runs in results.items())))
+        if args.UPDATEGOLDEN:
+            with open(GOLDEN_FILE, 'w') as golden_file:
+                json.dump(golden, golden_file, indent=2, sort_keys=True)
+            print('\nGolden digests written to', GOLDEN_FILE)
+        if changes:
+            print('\n*** Changes ***')
+            print('\n'.join(changes))
+            sys.exit(1)
+        sys.exit(0)
+
+    results = run_harness(engines, read_count, read_length, seed, shlex.split(args.SETTINGS), args.KEEP)
+    changes = golden_changes(results, golden, golden_key(read_count, read_length, seed, args.SETTINGS))
+    print_results(results)
+
+    results['settings'] = {'reads': read_count, 'read_length': read_length, 'seed': seed, 'options': args.SETTINGS}
+    if args.OUTPUT != '':
+        with open(args.OUTPUT, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.BASELINE != '':
+        with open(args.BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('settings') != results['settings']:
+            print('\nWARNING: the baseline was made with other settings:', baseline.get('settings'))
+        found = regressions({mode: runs for mode, runs in results.items() if mode != 'settings'}, baseline)
+        if found:
+            print('\n*** Regressions ***')
+            for regression in found:
+                print(regression)
+            sys.exit(1)
+        print('\nNo regressions against', args.BASELINE)
+
+    if changes:
+        print('\n*** Changes from the golden outputs ***')
+        print('\n'.join(changes))
+        sys.exit(1)
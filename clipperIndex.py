@@ -0,0 +1,271 @@
+''' -----------------------------------------
+    This is the FASTQ index of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    An index is a small sidecar file (reads.fastq.mci next to reads.fastq) that
+    holds the byte offset of every K-th record of a fastq file. With it, a file
+    can be split into byte ranges that start exactly on a record, so that each
+    range can be given to its own worker without parsing the file first.
+
+    For gzip files, the offsets are the ones of the uncompressed data, and the
+    index also holds restart points: places in the compressed file from which
+    decompression can start on its own. Only the python standard library (zlib)
+    is used, and it can't start inflating in the middle of a deflate block, so
+    the restart points are the starts of the gzip members. Files written in
+    many members (bgzip, pigz -i, or concatenated .gz files) get many restart
+    points; a single member file only gets one, at its start. bzip2 and xz
+    files are always read from their start. A gzip file with a restart point
+    for every worker is trimmed in byte ranges by magicClipper -P, like a plain
+    file (see clipperParallel.py).
+
+    To build the index of a file:
+
+        python clipperIndex.py reads.fastq.gz -K 10000
+
+    Please have this file along with clipperTrimmer.py in your desired directory
+    for correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import argparse
+import bisect
+import gzip
+import json
+import os
+import zlib
+
+import clipperFunctions as cf
+import clipperTrimmer as ct
+
+
+INDEX_SUFFIX = '.mci'
+INDEX_VERSION = 1
+DEFAULT_EVERY = 10000                   # Records between two indexed offsets
+CHUNK_SIZE = 1 << 20                    # Bytes read at once while building
+
+
+def index_path(fastq_file):
+    """
+    This function returns the name of the index file of a fastq file.
+    """
+    return fastq_file + INDEX_SUFFIX
+
+
+def _plain_chunks(fastq_file):
+    with cf.open_input_file(fastq_file) as infile:
+        chunk = infile.read(CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = infile.read(CHUNK_SIZE)
+
+
+def _gzip_chunks(fastq_file, restart_points):
+    """
+    Decompresses a gzip file member by member, and writes down the
+    (compressed, uncompressed) offsets of the start of each member.
+    """
+    compressed, uncompressed = 0, 0
+    decompressor = zlib.decompressobj(wbits=31)
+    restart_points.append((0, 0))
+    with open(fastq_file, 'rb') as infile:
+        data = infile.read(CHUNK_SIZE)
+        while data:
+            chunk = decompressor.decompress(data)
+            uncompressed += len(chunk)
+            if chunk:
+                yield chunk
+
+            if decompressor.eof:
+                # End of a member: the next one starts right after it
+                rest = decompressor.unused_data
+                compressed += len(data) - len(rest)
+                data = rest or infile.read(CHUNK_SIZE)
+                if not data.strip(b'\x00'):     # Only zero padding left
+                    return
+                decompressor = zlib.decompressobj(wbits=31)
+                restart_points.append((compressed, uncompressed))
+            else:
+                compressed += len(data)
+                data = infile.read(CHUNK_SIZE)
+
+
+def build_index(fastq_file, every=DEFAULT_EVERY):
+    """
+    This function reads a (compressed or not) fastq file once, and returns its
+    index: the offsets of records 0, every, 2*every, ... and, for gzip files,
+    the restart points. Records are taken to be 4 lines long.
+    """
+    restart_points = []
+    if cf.detect_compression(fastq_file) == 'gz':
+        chunks = _gzip_chunks(fastq_file, restart_points)
+    else:
+        chunks = _plain_chunks(fastq_file)
+
+    lines_between = 4 * every
+    offsets = [0]
+    line_count = 0                      # Complete lines seen so far
+    next_line = lines_between           # Line number of the next indexed record
+    size = 0
+    last_chunk = b''
+    for chunk in chunks:
+        newlines = chunk.count(b'\n')
+        # Find the exact place of the indexed records in this chunk
+        line, position = line_count, -1
+        while line_count + newlines >= next_line:
+            while line < next_line:
+                position = chunk.index(b'\n', position + 1)
+                line += 1
+            offsets.append(size + position + 1)
+            next_line += lines_between
+        line_count += newlines
+        size += len(chunk)
+        last_chunk = chunk
+
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        line_count += 1                 # Last line without line break
+    if offsets[-1] >= size:
+        offsets.pop()                   # No record starts at the end of the file
+
+    return {'version': INDEX_VERSION,
+            'file_size': os.path.getsize(fastq_file),
+            'size': size,
+            'every': every,
+            'records': line_count // 4,
+            'offsets': offsets,
+            'restart_points': [list(point) for point in restart_points]}
+
+
+def write_index(fastq_file, every=DEFAULT_EVERY):
+    """
+    This function builds the index of a fastq file and saves it next to it.
+    """
+    index = build_index(fastq_file, every)
+    with open(index_path(fastq_file), 'w') as index_file:
+        json.dump(index, index_file)
+    return index
+
+
+def load_index(fastq_file):
+    """
+    This function returns the saved index of a fastq file, or None if there is
+    none or it does not belong to the file as it is now.
+    """
+    try:
+        with open(index_path(fastq_file)) as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+
+    if (index.get('version') != INDEX_VERSION) or (index.get('file_size') != os.path.getsize(fastq_file)):
+        return None
+    if os.path.getmtime(index_path(fastq_file)) < os.path.getmtime(fastq_file):
+        return None                     # File changed after the index was made
+    return index
+
+
+def open_at(fastq_file, index, offset):
+    """
+    This function opens a (compressed or not) fastq file in binary mode, at the
+    given offset of its (uncompressed) data.
+    """
+    compression = cf.detect_compression(fastq_file)
+    if compression != 'gz':
+        infile = cf.open_input_file(fastq_file)
+        infile.seek(offset)             # For bz2 and xz, decompresses up to the offset
+        return infile
+
+    # Start decompressing at the last restart point before the offset
+    starts = [uncompressed for compressed, uncompressed in index['restart_points']]
+    compressed, uncompressed = index['restart_points'][bisect.bisect_right(starts, offset) - 1]
+    infile = open(fastq_file, 'rb')
+    infile.seek(compressed)
+    stream = gzip.GzipFile(fileobj=infile, mode='rb')
+    stream.myfileobj = infile           # So that it is closed together with the stream
+    stream.seek(offset - uncompressed)
+    return stream
+
+
+class RangeReader:
+    """
+    Binary stream that stops at the end of a byte range of another stream.
+    """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.left = length
+
+    def readline(self):
+        if self.left <= 0:
+            return b''
+        line = self.stream.readline()
+        self.left -= len(line)
+        return line
+
+    def close(self):
+        self.stream.close()
+
+
+def read_range(fastq_file, index, start, end, reuse=False):
+    """
+    Generator of the FastqRecords between two (uncompressed) offsets of a fastq
+    file, which must be record starts (e.g. from split_ranges). With reuse, the
+    same RecordBuffer is filled with every read (see ct.read_fastq).
+    """
+    stream = RangeReader(open_at(fastq_file, index, start), end - start)
+    try:
+        yield from ct.read_fastq(stream, reuse)
+    finally:
+        stream.close()
+
+
+def read_records(fastq_file, index, first):
+    """
+    Generator of the FastqRecords of a fastq file, starting at record number first
+    (counted from 0). Only the records after the last indexed one are parsed.
+    """
+    slot = min(first // index['every'], len(index['offsets']) - 1)
+    skip = first - slot * index['every']
+    records = read_range(fastq_file, index, index['offsets'][slot], index['size'])
+    for number, record in enumerate(records):
+        if number >= skip:
+            yield record
+
+
+def split_ranges(index, parts):
+    """
+    This function splits an indexed file into at most parts byte ranges of about
+    the same size, all starting on a record. Returns a list of (start, end),
+    which is empty for an empty file.
+    """
+    offsets, size = index['offsets'], index['size']
+    if not offsets:
+        return []
+    bounds = [0]
+    for part in range(1, parts):
+        target = size * part // parts
+        i = bisect.bisect_left(offsets, target)
+        # Nearest indexed record to the target
+        if (i == len(offsets)) or ((i > 0) and (target - offsets[i-1] <= offsets[i] - target)):
+            i -= 1
+        if offsets[i] > bounds[-1]:
+            bounds.append(offsets[i])
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Builds the index of a (compressed or not) fastq \
+    file, used by magicClipper to split it between workers.')
+    parser.add_argument('FILE', metavar = 'File name',
+                        help = "Your fastq file.")
+    parser.add_argument('-K', '--EVERY', default=str(DEFAULT_EVERY), metavar='',
+                        help = "Number of records between two indexed offsets. Default is {}.".format(DEFAULT_EVERY))
+    args = parser.parse_args()
+
+    index = write_index(args.FILE, int(args.EVERY))
+    print('Index written to {}: {} records, {} offsets, {} restart points'.format(
+        index_path(args.FILE), index['records'], len(index['offsets']), len(index['restart_points'])))
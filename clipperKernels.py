@@ -0,0 +1,310 @@
+''' -----------------------------------------
+    These are the kernels of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    The trimming, decoding and filtering primitives shared by the trimmer
+    scripts of the repository, so that each of them is written, sped up and
+    tested only once:
+        magicClipper.py     sliding window trimming (QUALITYTRIM, through
+                            clipperPlan.py), unknown base and poly-X trimming
+                            (through clipperTrimmer.py), and the sweep (-SW,
+                            through clipperSweep.py)
+        trimmerViktor.py,   decoding, crops and sliding window trimming
+        trimmerCelia.py     (through trimmer_functions.py)
+        trimmer_SW.py       decoding, crops, averages and stride window
+                            trimming (window_trim with a step)
+
+    Two backends are available, chosen at runtime with set_backend() or the
+    MAGICCLIPPER_KERNELS environment variable:
+        python  Pure python, always available (default)
+        numpy   Cumulative sums and window sums done by NumPy; only used if
+                NumPy is installed. Best for long reads.
+    Both backends give exactly the same results. The sequence kernels (unknown
+    base and poly-X trimming) use bytes.find/strip and compare bytes one by one,
+    so they have no NumPy version for single reads; poly_x_trim_batch trims a
+    list of sequences at once, on a padded matrix with the numpy backend.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import importlib
+import os
+
+numpy = None                                    # Optional, only imported for the numpy backend
+
+
+BACKENDS = ('python', 'numpy')
+backend = 'python'
+
+
+def set_backend(name):
+    """
+    This function chooses the backend of the kernels ('python' or 'numpy'). A
+    ValueError is raised for unknown backends, or if NumPy is not installed.
+    NumPy is only imported here, so that runs with the python backend don't
+    carry its memory (in every worker process).
+    """
+    global backend, numpy
+    if name not in BACKENDS:
+        raise ValueError('unknown kernel backend: {} \nAccepted input: {}'.format(name, ', '.join(BACKENDS)))
+    if (name == 'numpy') and (numpy is None):
+        try:
+            numpy = importlib.import_module('numpy')
+        except ImportError:
+            raise ValueError('the numpy kernel backend needs NumPy, which is not installed')
+    backend = name
+
+
+def get_backend():
+    return backend
+
+
+############
+# Decoding #
+############
+
+def quality_score(quality_str, phred):
+    """
+    This function decodes an encoded quality string (str or bytes) into a list of
+    scores, or returns 'unknown' if it contains a character that is not part of
+    the encoding (phred '33' or '64').
+    """
+    offset = int(phred)
+    if isinstance(quality_str, str):
+        try:
+            quality_str = quality_str.encode('latin-1')
+        except UnicodeEncodeError:
+            return 'unknown'
+
+    if backend == 'numpy':
+        scores = numpy.frombuffer(quality_str, dtype=numpy.uint8).astype(numpy.int16) - offset
+        if scores.size and ((scores.min() < 0) or (scores.max() > 41)):
+            return 'unknown'
+        return scores.tolist()
+
+    if quality_str.translate(None, bytes(range(offset, offset + 42))):
+        return 'unknown'                        # Characters left after deleting the valid ones
+    return [score - offset for score in quality_str]
+
+
+def average_quality(qual_score):
+    """
+    This function returns the average of a list of scores (0 for an empty list).
+    """
+    return sum(qual_score)/len(qual_score) if len(qual_score) else 0
+
+
+############
+# Trimming #
+############
+
+def window_trim(scores, start, end, window_size, quality, step=1):
+    """
+    Sliding window trimming from both ends of scores[start:end], a list of scores
+    or an encoded quality string (bytes, with an encoded threshold). The window
+    slides inwards while its average is below quality, and is cut short at the
+    other end of the read. Returns the kept (start, end). In python, only the
+    windows at the ends are summed, so good reads cost two windows.
+
+    With a step above 1, the window jumps step bases at a time (stride window, as
+    in trimmer_SW.py), and each end is scanned over the whole of scores[start:end],
+    without looking at where the other one stopped. Nothing is kept if they cross.
+    """
+    if (backend == 'numpy') and (end > start):
+        # Window sums at every position at once, from the cumulative sums
+        length = end - start
+        if isinstance(scores, (bytes, bytearray)):
+            values = numpy.frombuffer(scores, dtype=numpy.uint8, count=length, offset=start)
+        else:
+            values = numpy.asarray(scores[start:end])
+        sums = numpy.zeros(length + 1, dtype=numpy.int64)
+        numpy.cumsum(values, dtype=numpy.int64, out=sums[1:])
+
+        if step > 1:
+            i = numpy.arange(0, length, step)
+            window_end = numpy.minimum(i + window_size, length)
+            good = sums[window_end] - sums[i] >= quality * (window_end - i)
+            first = int(i[good.argmax()]) if good.any() else length
+
+            ends = length - numpy.arange(0, length, step)
+            window_start = numpy.maximum(ends - window_size, 0)
+            good = sums[ends] - sums[window_start] >= quality * (ends - window_start)
+            last = int(ends[good.argmax()]) if good.any() else 0
+            return start + first, start + max(last, first)
+
+        i = numpy.arange(length)
+        window_end = numpy.minimum(i + window_size, length)
+        good = sums[window_end] - sums[i] >= quality * (window_end - i)
+        first = int(good.argmax()) if good.any() else length
+
+        ends = numpy.arange(first + 1, length + 1)
+        window_start = numpy.maximum(ends - window_size, first)
+        good = sums[ends] - sums[window_start] >= quality * (ends - window_start)
+        last = int(ends[good][-1]) if good.any() else first
+        return start + first, start + last
+
+    if step > 1:
+        ## LEADING TRIM (stride window)
+        first = start
+        while first < end:
+            window_end = min(first + window_size, end)
+            if sum(scores[first:window_end]) >= quality * (window_end - first):
+                break
+            first += step
+
+        ## TRAILING TRIM (stride window)
+        last = end
+        while last > start:
+            window_start = max(last - window_size, start)
+            if sum(scores[window_start:last]) >= quality * (last - window_start):
+                break
+            last -= step
+        first = min(first, end)
+        return first, max(last, first)
+
+    ## LEADING TRIM
+    while start < end:
+        window_end = min(start + window_size, end)
+        if sum(scores[start:window_end]) >= quality * (window_end - start):
+            break
+        start += 1
+
+    ## TRAILING TRIM
+    while end > start:
+        window_start = max(end - window_size, start)
+        if sum(scores[window_start:end]) >= quality * (end - window_start):
+            break
+        end -= 1
+    return start, end
+
+
+def quality_trim_coordinates(qual_score, window_size, quality):
+    """
+    This function returns the (start, end) of the part of a read that is kept by
+    sliding window trimming of its scores. A window size of 0 means no trimming.
+    """
+    length = len(qual_score)
+    if (window_size == 0) or (length == 0):
+        return 0, length
+    return window_trim(qual_score, 0, length, window_size, quality)
+
+
+def quality_trim(read, qual_str, qual_score, WIN_SIZE, AVG_QUALITY, BASE_QUALITY):
+    """
+    This function removes 5' and 3' bases based on their quality.
+    If WIN_SIZE > 1, it takes the sliding window approach, with AVG_QUALITY as threshold.
+    If WIN_SIZE = 1, it takes the single base approach, with BASE_QUALITY as threshold.
+    The read, quality string and scores are only sliced once, at the end.
+    """
+    quality = AVG_QUALITY if WIN_SIZE > 1 else BASE_QUALITY
+    start, end = quality_trim_coordinates(qual_score, WIN_SIZE, quality)
+    if (start, end) == (0, len(qual_score)):
+        return read, qual_str, qual_score, False
+    return read[start:end], qual_str[start:end], qual_score[start:end], True
+
+
+def end_trim(read, qual_str, qual_score, LEADING, TRAILING):
+    """
+    This function removes LEADING bases from the start and TRAILING bases from the
+    end of a read, whatever their quality.
+    """
+    kept = slice(LEADING, -TRAILING if TRAILING != 0 else None)
+    return read[kept], qual_str[kept], qual_score[kept]
+
+
+############################
+# Sequence (N and poly-X) #
+############################
+
+def n_trim(seq, split=False):
+    """
+    Unknown base trimming of a sequence (bytes). Returns the (start, end) of the read
+    without the runs of N bases at both ends or, with split, of the longest part of
+    the read without any N base (the first one if several are as long). The N bases
+    are found with bytes.strip and bytes.find.
+    """
+    start = len(seq) - len(seq.lstrip(b'N'))
+    end = max(len(seq.rstrip(b'N')), start)
+    if not split:
+        return start, end
+
+    best_start, best_end = start, start
+    position = start
+    while position < end:
+        n_position = seq.find(b'N', position, end)
+        if n_position == -1:
+            n_position = end
+        if n_position - position > best_end - best_start:
+            best_start, best_end = position, n_position
+        position = n_position + 1
+    return best_start, best_end
+
+
+def poly_x_trim(seq, start, end, base, min_len, mismatches):
+    """
+    Poly-X tail trimming of a sequence (bytes). Scans from the 3' end of seq[start:end]
+    for a tail of the base (a byte value, e.g. ord('G')), with at most mismatches
+    other bases per 10 bases of the tail (and at least mismatches for shorter tails).
+    Returns the new end, only moved if the tail is at least min_len bases long. The
+    read is never sliced, the bytes are compared one by one from its end, and the
+    scan stops at the first mismatch over the tolerance.
+    """
+    tail_start = end
+    mismatch_count = 0
+    i = end
+    while i > start:
+        i -= 1
+        if seq[i] == base:
+            tail_start = i              # A tail can only start on the base itself
+        else:
+            mismatch_count += 1
+            if mismatch_count > mismatches * max(1, (end - i) // 10):
+                break
+    if end - tail_start >= min_len:
+        return tail_start
+    return end
+
+
+def poly_x_trim_batch(seqs, bases, min_len, mismatches):
+    """
+    Poly-X tail trimming of a list of sequences (bytes), for every base in bases
+    (bytes, e.g. b'GA'), as poly_x_trim on each whole sequence. Returns the list of
+    new ends, the longest tail being removed. With the numpy backend, the whole
+    batch is done at once on a matrix of the reversed sequences.
+    """
+    if (backend != 'numpy') or (not seqs):
+        return [min(poly_x_trim(seq, 0, len(seq), base, min_len, mismatches) for base in bases) if seq else 0
+                for seq in seqs]
+
+    lengths = numpy.array([len(seq) for seq in seqs])
+    width = int(lengths.max())
+    if width == 0:
+        return [0] * len(seqs)
+    reversed_seqs = numpy.zeros((len(seqs), width), dtype=numpy.uint8)     # Padding (0) is never a base
+    for row, seq in enumerate(seqs):
+        reversed_seqs[row, :len(seq)] = numpy.frombuffer(seq[::-1], dtype=numpy.uint8)
+
+    # Bases from the 3' end (d = end - i in poly_x_trim), and the mismatches allowed up to each of them
+    distance = numpy.arange(1, width + 1)
+    allowed = mismatches * numpy.maximum(1, distance // 10)
+    ends = lengths.copy()
+    for base in bases:
+        is_base = reversed_seqs == base
+        # The scan stops at the first mismatch over the tolerance, or at the start of the read
+        stop = (numpy.cumsum(~is_base, axis=1) > allowed) | (distance > lengths[:, None])
+        stop_at = numpy.where(stop.any(axis=1), stop.argmax(axis=1) + 1, width + 1)
+        # The tail starts on the last base itself found before the scan stops
+        tail_len = numpy.where(is_base & (distance < stop_at[:, None]), distance, 0).max(axis=1)
+        ends = numpy.minimum(ends, numpy.where(tail_len >= min_len, lengths - tail_len, lengths))
+    return ends.tolist()
+
+
+## Backend given by the environment (if any)
+if os.environ.get('MAGICCLIPPER_KERNELS', '') != '':
+    set_backend(os.environ['MAGICCLIPPER_KERNELS'])
@@ -0,0 +1,153 @@
+''' -----------------------------------------
+    This is the memory budget of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    With a memory budget (--max-memory), the memory hungry parts of a run are
+    sized to fit in it: the duplicate filter, the trim cache and the batches of
+    reads handed to worker processes (see clipperShared.py). A budget below the
+    memory the program already uses when it starts is refused.
+
+    While the run goes on, the resident memory (RSS) of the process is checked
+    every batch_size reads. When it is above the budget, the trim cache is
+    emptied, garbage is collected and batch_size is halved. In a serial run the
+    reads are streamed one by one (into the same buffer, see
+    clipperTrimmer.read_fastq), so no reads are held back: a smaller batch_size
+    only means the memory is checked more often. Only the shared memory workers
+    (see clipperShared.py) get their reads in batches of batch_size, which then
+    hold fewer reads at once. Reading is never slowed down or paused. Every time
+    the budget is found exceeded is counted as a throttling event, and both the
+    peak memory and the events end up in the log file.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import gc
+import itertools
+import os
+import sys
+
+try:
+    import resource                             # Not available on Windows
+except ImportError:
+    resource = None
+
+
+## Rough sizes of the python objects behind one read and one trim cache entry
+RECORD_BYTES = 1024
+CACHE_ENTRY_BYTES = 512
+
+## Share of the budget for each part of a run
+DEDUP_SHARE = 0.5
+CACHE_SHARE = 0.1
+BATCH_SHARE = 0.05
+
+MIN_BATCH = 100                                 # Reads per batch, whatever the budget
+MAX_BATCH = 100000
+
+
+def current_rss_mb():
+    """
+    This function returns the resident memory of the process in MB (0 if it can't
+    be known on this system).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """
+    This function returns the peak resident memory of the process in MB (0 if it
+    can't be known on this system).
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':                # Bytes on macOS, kB elsewhere
+        return peak / 2**20
+    return peak / 2**10
+
+
+class MemoryBudget:
+    """
+    Memory ceiling of a run, in MB.
+    """
+
+    def __init__(self, max_memory):
+        self.max_memory = max_memory
+        self.batch_size = int(min(max(max_memory * 2**20 * BATCH_SHARE / RECORD_BYTES, MIN_BATCH), MAX_BATCH))
+        self.peak = current_rss_mb()
+        self.throttle_events = 0
+        self.release = []                       # Functions that free memory (e.g. Trimmer.clear_cache)
+        self.changes = []                       # Settings changed to fit the budget
+
+    def check_start(self, processes=1):
+        """
+        Raises a ValueError if the budget is not above the memory used at start by
+        all the processes of the run (the main one and the workers, which start as
+        copies of it).
+        """
+        process_count = processes + 1 if processes > 1 else 1
+        if self.max_memory <= self.peak * process_count:
+            raise ValueError('the memory budget ({} MB) is below the memory used at start by {} process(es) ({} MB)'.format(
+                self.max_memory, process_count, round(self.peak * process_count, 1)))
+
+    def fit(self, config):
+        """
+        Shrinks the duplicate filter and trim cache settings of a TrimConfig to
+        the budget. The changes are kept in self.changes, for the log file.
+        """
+        changes = self.changes
+        dedup_memory = self.max_memory * DEDUP_SHARE
+        if config.dedup and (config.dedup_memory > dedup_memory):
+            config.dedup_memory = dedup_memory
+            changes.append('Duplicate filter memory cap lowered to {} MB'.format(round(dedup_memory, 1)))
+
+        cache_size = int(self.max_memory * 2**20 * CACHE_SHARE / CACHE_ENTRY_BYTES)
+        if config.cache_size > cache_size:
+            config.cache_size = cache_size
+            changes.append('Trim cache size lowered to {}'.format(cache_size))
+
+    def check(self, others=0):
+        """
+        Checks the memory use. If it is above the budget, frees what can be freed
+        and halves batch_size (see above), and returns True. others is the memory (MB) used by the other processes of
+        the run (e.g. the workers of clipperShared.py), added to this one's.
+        """
+        rss = current_rss_mb() + others
+        self.peak = max(self.peak, rss)
+        if rss <= self.max_memory:
+            return False
+
+        self.throttle_events += 1
+        for release in self.release:
+            release()
+        gc.collect()
+        self.batch_size = max(self.batch_size // 2, MIN_BATCH)
+        return True
+
+    def watch(self, records):
+        """
+        Generator of the given records, one by one (so that a reused RecordBuffer
+        stays usable), checking the memory before every batch_size records.
+        """
+        records = iter(records)
+        while True:
+            self.check()
+            count = 0
+            for record in itertools.islice(records, self.batch_size):
+                count += 1
+                yield record
+            if count == 0:
+                return
+
+    def peak_mb(self):
+        return max(self.peak, peak_rss_mb())
@@ -0,0 +1,122 @@
+''' -----------------------------------------
+    This is the metrics exporter of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    While magicClipper runs, a MetricsWriter regularly writes the progress of
+    the trimming to a Prometheus textfile (as read by the textfile collector of
+    node_exporter), e.g.
+
+        magicclipper_reads_processed_total{input="reads_1.fastq.gz"} 1200000
+
+    The file is first written under a temporary name and then renamed, so the
+    collector never reads a half written file.
+
+    The time to completion is estimated from the (compressed) bytes read so far
+    out of the total size of the input files.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import os
+import time
+
+
+def stream_position(stream):
+    """
+    This function returns the number of bytes read from (or written to) the file on
+    disk behind a stream. For compressed files, this is the position in the
+    compressed file (gzip keeps it in fileobj, bz2 and lzma in _fp).
+    """
+    for name in ('fileobj', '_fp'):
+        if getattr(stream, name, None) is not None:
+            return getattr(stream, name).tell()
+    return stream.tell()
+
+
+class MetricsWriter:
+    """
+    Writes the metrics of a run to a Prometheus textfile, at most once every
+    interval seconds (unless forced).
+    """
+
+    def __init__(self, path, in_files, interval=10):
+        self.path = path
+        self.label = '{{input="{}"}}'.format(' '.join(in_files).replace('"', ''))
+        self.interval = interval
+        self.total_bytes = sum(os.path.getsize(in_file) for in_file in in_files)
+
+        self.start_time = time.monotonic()
+        self.last_time = self.start_time        # Time and read count of the last write
+        self.last_count = 0
+
+    def update(self, stats, in_streams, out_streams, finished=False, bytes_in=None):
+        """
+        Writes the metrics if the interval has passed since the last write, or if
+        the run is finished. bytes_in can be given when the input files are not
+        read through in_streams (e.g. by worker processes, see clipperParallel.py).
+        """
+        now = time.monotonic()
+        if (not finished) and (now - self.last_time < self.interval):
+            return
+
+        if bytes_in is None:
+            bytes_in = sum(stream_position(stream) for stream in in_streams)
+        bytes_out = sum(stream_position(stream) for stream in out_streams)
+
+        # Current speed, since the last write (average speed of the whole run once finished)
+        if finished:
+            elapsed, count = now - self.start_time, stats.read_count
+        else:
+            elapsed, count = now - self.last_time, stats.read_count - self.last_count
+        reads_per_second = count / elapsed if elapsed > 0 else 0
+        self.last_time, self.last_count = now, stats.read_count
+
+        # Time to completion, from the part of the input read so far
+        progress = min(bytes_in / self.total_bytes, 1) if self.total_bytes else 1
+        if finished:
+            progress, eta = 1, 0
+        elif progress > 0:
+            eta = (now - self.start_time) * (1 - progress) / progress
+        else:
+            eta = -1                            # Not known yet
+
+        self.write(stats, bytes_in, bytes_out, reads_per_second, progress, eta)
+
+    def write(self, stats, bytes_in, bytes_out, reads_per_second, progress, eta):
+        label = self.label
+        lines = []
+
+        def metric(name, kind, text, values):
+            lines.append('# HELP magicclipper_{} {}'.format(name, text))
+            lines.append('# TYPE magicclipper_{} {}'.format(name, kind))
+            for labels, value in values:
+                lines.append('magicclipper_{}{} {}'.format(name, labels, value))
+
+        metric('reads_processed_total', 'counter', 'Reads (or read pairs) processed.',
+               [(label, stats.read_count)])
+        metric('reads_kept_total', 'counter', 'Reads (or read pairs) kept.',
+               [(label, stats.read_count - stats.dropped_reads)])
+        metric('reads_dropped_total', 'counter', 'Reads (or read pairs) dropped, by reason.',
+               [(label[:-1] + ',reason="{}"}}'.format(reason), count)
+                for reason, count in stats.dropped_by_reason.items()])
+        metric('bytes_in_total', 'counter', 'Bytes read from the input files (compressed).',
+               [(label, bytes_in)])
+        metric('bytes_out_total', 'counter', 'Bytes written to the output files (compressed).',
+               [(label, bytes_out)])
+        metric('reads_per_second', 'gauge', 'Reads (or read pairs) processed per second (whole run average once finished).',
+               [(label, round(reads_per_second, 1))])
+        metric('progress_ratio', 'gauge', 'Part of the input read so far.',
+               [(label, round(progress, 4))])
+        metric('eta_seconds', 'gauge', 'Estimated time to completion (-1 if not known yet).',
+               [(label, round(eta, 1))])
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.path)
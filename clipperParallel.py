@@ -0,0 +1,227 @@
+''' -----------------------------------------
+    This is the parallel engine of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    A plain (not compressed) fastq file is split into byte ranges, a few for
+    each worker process. Each worker opens the file itself, goes to the start of
+    a range and trims the reads that start inside it, writing them to a part
+    file of its own (in a temporary directory, see TMPDIR). As ranges are done,
+    the part files are put together in order into the output file. No single
+    process has to parse every read.
+
+    If the file has an index (see clipperIndex.py), the ranges start exactly on
+    a record. gzip files can be split too if their index has a restart point
+    for every worker (files written in many members, like bgzip ones): each
+    worker decompresses its own range, starting at the last restart point
+    before it. Otherwise the file is cut in equal parts, and each worker first
+    finds the next record start: a line starting with '@' whose second-next
+    line starts with '+'. A quality line can also start with '@', but then its
+    second-next line is a sequence, so it is skipped. The sequence and quality
+    of the found record must also have the same length.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import clipperFunctions as cf
+import clipperIndex as ci
+import clipperMemory as cmem
+import clipperTrimmer as ct
+
+
+## Byte ranges per worker process, so that progress can be followed as ranges are done
+RANGES_PER_PROCESS = 4
+
+
+def find_record_start(stream, start):
+    """
+    This function moves an open fastq file (binary mode) to the first record that
+    starts at or after the given offset, and returns the offset of that record.
+    """
+    if start == 0:
+        stream.seek(0)
+        return 0
+
+    # Go to the start of the first line at or after start
+    stream.seek(start - 1)
+    position = start - 1 + len(stream.readline())
+
+    while True:
+        stream.seek(position)
+        lines = [stream.readline() for i in range(4)]
+        if not lines[3]:
+            return position + sum(len(line) for line in lines)  # No record left
+        header, seq, plus, qual = lines
+        if header.startswith(b'@') and plus.startswith(b'+') and (len(seq.strip()) == len(qual.strip())):
+            stream.seek(position)
+            return position
+        position += len(header)
+
+
+def read_fastq_range(stream, start, end, reuse=False):
+    """
+    Generator of the FastqRecords that start between two offsets of an open fastq
+    file. The stream must be at start, which must be a record start. With reuse,
+    the same RecordBuffer is filled with every read (see ct.read_fastq).
+    """
+    readline = stream.readline
+    position = start
+    record = ct.RecordBuffer() if reuse else None
+    while position < end:
+        header = readline()
+        seq = readline()
+        plus = readline()
+        qual = readline()
+        if not qual:
+            return
+        position += len(header) + len(seq) + len(plus) + len(qual)
+        if record is None:
+            yield ct.FastqRecord(header.strip(), seq.strip(), qual.strip())
+        else:
+            record.header_line = header
+            record.seq = seq.strip()
+            record.qual = qual.strip()
+            yield record
+
+
+def splittable(fastq_file, processes):
+    """
+    This function tells whether a fastq file can be split into byte ranges for
+    processes workers: plain files always can, gzip files only if their index
+    has a restart point for every worker.
+    """
+    compression = cf.detect_compression(fastq_file)
+    if compression == '':
+        return True
+    if compression != 'gz':
+        return False
+    index = ci.load_index(fastq_file)
+    return (index is not None) and (len(index['restart_points']) >= processes)
+
+
+def byte_ranges(fastq_file, parts):
+    """
+    This function splits a fastq file into at most parts byte ranges. Returns the
+    list of (start, end) and the index of the file, if the ranges start exactly on
+    a record (None otherwise). Offsets of gzip files are the uncompressed ones.
+    """
+    index = ci.load_index(fastq_file)
+    if index is not None:
+        return ci.split_ranges(index, parts), index
+
+    size = os.path.getsize(fastq_file)
+    bounds = [size * part // parts for part in range(parts + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start], None
+
+
+def trim_range(task):
+    """
+    Worker: trims the reads of one byte range onto a part file. Returns the part
+    file, the stats of the worker, its trim cache counts, its peak memory and
+    throttling events, and the id of the worker process.
+    """
+    fastq_file, start, end, index, part_file, config, max_memory = task
+    trimmer = ct.Trimmer(config)
+    budget = None
+    if max_memory > 0:
+        budget = cmem.MemoryBudget(max_memory)
+        budget.release.append(trimmer.clear_cache)
+
+    with open(fastq_file, 'rb') as infile, open(part_file, 'wb') as outfile:
+        if cf.detect_compression(fastq_file) == 'gz':
+            records = ci.read_range(fastq_file, index, start, end, reuse=True)
+        else:
+            if index is not None:
+                infile.seek(start)
+            else:
+                start = find_record_start(infile, start)
+            records = read_fastq_range(infile, start, end, reuse=True)
+        trim, write_fastq = trimmer.trim, ct.write_fastq
+        for record in (budget.watch(records) if budget is not None else records):
+            trimmed = trim(record)
+            if trimmed is not None:
+                write_fastq(trimmed, outfile)
+
+    if budget is None:
+        return part_file, trimmer.stats, trimmer.cache_counts(), cmem.peak_rss_mb(), 0, os.getpid()
+    return part_file, trimmer.stats, trimmer.cache_counts(), budget.peak_mb(), budget.throttle_events, os.getpid()
+
+
+def add_stats(stats, worker_stats):
+    """
+    This function adds the stats of a worker to the stats of the whole run.
+    """
+    for name in stats.__slots__:
+        if name == 'dropped_by_reason':
+            for reason, count in worker_stats.dropped_by_reason.items():
+                stats.dropped_by_reason[reason] += count
+        else:
+            setattr(stats, name, getattr(stats, name) + getattr(worker_stats, name))
+
+
+def trim_parallel(fastq_file, out_stream, trimmer, processes, budget=None, metrics=None):
+    """
+    This function trims a fastq file that can be split (see splittable) with
+    processes worker processes, and writes the kept reads onto out_stream
+    (compressed or not), in the order of the input. The stats of all workers are
+    added to the given trimmer (which does not trim itself).
+
+    The file is cut in a few ranges per worker. As ranges are done, their stats
+    are added, the metrics are updated (if given) from the part of the input
+    done so far, and the part files that are next in order are written out.
+    """
+    parts = processes * RANGES_PER_PROCESS
+    if cf.detect_compression(fastq_file) == 'gz':
+        # No more ranges than restart points, so that no range decompresses the one before it
+        parts = min(parts, len(ci.load_index(fastq_file)['restart_points']))
+    ranges, index = byte_ranges(fastq_file, parts)
+    # The main process runs too, while the workers trim (see cmem.MemoryBudget.check_start)
+    max_memory = budget.max_memory / (processes + 1) if budget is not None else 0
+    stats = trimmer.stats
+    done, done_bytes, written = set(), 0, 0
+    worker_peaks = {}
+    # Part files go to a temporary directory (TMPDIR), removed even if a worker fails
+    with tempfile.TemporaryDirectory(prefix='magicClipper.') as part_dir:
+        tasks = [(fastq_file, start, end, index, os.path.join(part_dir, 'part{}.fastq'.format(part)), trimmer.config, max_memory)
+                 for part, (start, end) in enumerate(ranges)]
+        range_bytes = {task[4]: task[2] - task[1] for task in tasks}
+        total_bytes = sum(range_bytes.values())
+
+        with multiprocessing.Pool(processes) as pool:
+            for part_file, worker_stats, cache_counts, peak, throttle_events, pid in pool.imap_unordered(trim_range, tasks):
+                add_stats(stats, worker_stats)
+                trimmer.cleared_hits += cache_counts[0]
+                trimmer.cleared_misses += cache_counts[1]
+                worker_peaks[pid] = max(worker_peaks.get(pid, 0), peak)
+                if budget is not None:
+                    budget.throttle_events += throttle_events
+                print('---', stats.read_count, 'reads processed ---')
+
+                # Put the part files together, in order, as soon as the ones before them are done
+                done.add(part_file)
+                done_bytes += range_bytes[part_file]
+                while (written < len(tasks)) and (tasks[written][4] in done):
+                    with open(tasks[written][4], 'rb') as part:
+                        shutil.copyfileobj(part, out_stream)
+                    os.remove(tasks[written][4])
+                    written += 1
+
+                # Offsets of gzip ranges are uncompressed: the metrics get the same share of the file on disk
+                if metrics is not None:
+                    metrics.update(stats, [], [out_stream], bytes_in=metrics.total_bytes * done_bytes // total_bytes)
+
+    # Upper bound of the peak memory of the whole run: the peaks of the workers
+    # may not have happened at the same time
+    if budget is not None:
+        budget.peak = max(budget.peak, budget.peak_mb() + sum(worker_peaks.values()))
+    return stats
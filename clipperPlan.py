@@ -0,0 +1,463 @@
+''' -----------------------------------------
+    This is the trimming plan compiler of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    A list of trimming steps, either written in Trimmomatic syntax, e.g.
+
+        LEADING:3 TRAILING:3 SLIDINGWINDOW:4:15 MINLEN:36
+
+    or made from the usual magicClipper settings, is compiled once into a
+    TrimPlan: a list of small functions with all their settings already
+    filled in. Neighbouring steps are merged where possible, so that each
+    read goes through as few function calls as possible.
+
+    Every step works on the (start, end) coordinates of the part of the read
+    that is kept so far, never on sliced copies of the read. The quality string
+    is never decoded as a whole either: the thresholds are encoded once (quality
+    + phred offset), so the steps only look at the bytes they need, which for
+    good reads are just the windows at both ends. As in Trimmomatic, a read
+    that is trimmed down to nothing is dropped, whatever the steps.
+
+    Supported steps (see TrimmomaticManual.pdf):
+        LEADING:<quality>               Remove leading bases below quality
+        TRAILING:<quality>              Remove trailing bases below quality
+        SLIDINGWINDOW:<size>:<quality>  Cut the read once the average quality
+                                        of a window falls below quality
+        CROP:<length>                   Keep at most length bases
+        HEADCROP:<length>               Remove length bases from the start
+        TAILCROP:<length>               Remove length bases from the end
+        MINLEN:<length>                 Drop reads shorter than length
+        AVGQUAL:<quality>               Drop reads with a lower average quality
+        TOPHRED33, TOPHRED64            Write qualities in this phred encoding
+    and the magicClipper specific steps:
+        QUALITYTRIM:<size>:<quality>    Sliding window trim from both ends (as -W)
+        MAXN:<count>                    Drop reads with more unknown bases
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import clipperKernels as ck
+
+
+## Number of values each step takes
+STEP_VALUES = {'LEADING': 1, 'TRAILING': 1, 'SLIDINGWINDOW': 2, 'CROP': 1, 'HEADCROP': 1,
+               'TAILCROP': 1, 'MINLEN': 1, 'AVGQUAL': 1, 'TOPHRED33': 0, 'TOPHRED64': 0,
+               'QUALITYTRIM': 2, 'MAXN': 1}
+
+## Groups of steps that can be merged into one function when next to each other
+CROP_STEPS = ('CROP', 'HEADCROP', 'TAILCROP')
+END_STEPS = ('LEADING', 'TRAILING')
+FILTER_STEPS = ('MINLEN', 'AVGQUAL')
+
+
+def parse_steps(step_string):
+    """
+    This function reads a Trimmomatic-style step list, and returns it as a list
+    of (name, values) tuples. A ValueError is raised for unknown or invalid steps.
+    """
+    steps = []
+    for word in step_string.split():
+        name, *values = word.split(':')
+        name = name.upper()
+
+        if name not in STEP_VALUES:
+            raise ValueError('unknown or unsupported trimming step: ' + word)
+        if len(values) != STEP_VALUES[name]:
+            raise ValueError('{} takes {} value(s): {}'.format(name, STEP_VALUES[name], word))
+
+        values = [int(value) for value in values]
+        if any(value < 0 for value in values):
+            raise ValueError('values of trimming steps must be positive: ' + word)
+        if (name in ('SLIDINGWINDOW', 'QUALITYTRIM')) and (values[0] == 0):
+            raise ValueError('window size must be at least 1: ' + word)
+
+        steps.append((name, values))
+    return steps
+
+
+def default_steps(leading, trailing, window_size, avg_quality, base_quality, min_len, max_n,
+                  leading_quality=0, trailing_quality=0):
+    """
+    This function returns the usual magicClipper trimming (STEP 1 to 5) as a step list.
+    """
+    steps = []
+
+    ## STEP 1: Remove leading and trailing bases, given user input
+    if leading != 0:
+        steps.append(('HEADCROP', [leading]))
+    if trailing != 0:
+        steps.append(('TAILCROP', [trailing]))
+    if leading_quality != 0:
+        steps.append(('LEADING', [leading_quality]))
+    if trailing_quality != 0:
+        steps.append(('TRAILING', [trailing_quality]))
+
+    ## STEP 2: Remove leading and trailing bases, based on quality
+    if window_size > 1:
+        steps.append(('QUALITYTRIM', [window_size, avg_quality]))
+    elif window_size == 1:
+        steps.append(('QUALITYTRIM', [1, base_quality]))
+
+    ## STEP 3 to 5: Drop short reads, reads with low average quality and with too many N bases
+    steps.append(('MINLEN', [min_len]))
+    steps.append(('AVGQUAL', [avg_quality]))
+    steps.append(('MAXN', [max_n]))
+    return steps
+
+
+def steps_to_string(steps):
+    """
+    This function writes a step list back in Trimmomatic syntax (for the log file).
+    """
+    return ' '.join(':'.join([name] + [str(value) for value in values]) for name, values in steps)
+
+
+#######################
+# Functions for steps #
+#######################
+# Every step is a function step(qual, start, end, n_checks) that returns the new
+# (start, end, reason). reason is None, or the reason why the read has to be dropped.
+# qual is the encoded quality string (bytes), and offset the phred offset that is
+# added to the thresholds. Unknown base checks need the sequence, so they are only
+# written down in n_checks.
+
+def crop_step(crops):
+    """
+    Fixed crops (CROP, HEADCROP, TAILCROP). Neighbouring crops of the same kind are
+    merged first, and then the crops are combined into one function.
+    """
+    merged = []
+    for name, length in crops:
+        if merged and merged[-1][0] == name:
+            if name == 'CROP':
+                length = min(length, merged[-1][1])
+            else:
+                length = length + merged[-1][1]
+            merged[-1] = (name, length)
+        else:
+            merged.append((name, length))
+
+    def headcrop(length):
+        return lambda start, end: (min(start + length, end), end)
+
+    def tailcrop(length):
+        return lambda start, end: (start, max(end - length, start))
+
+    def crop(length):
+        return lambda start, end: (start, min(end, start + length))
+
+    # The most usual cases get their own function
+    if [name for name, length in merged] == ['HEADCROP', 'TAILCROP']:
+        head, tail = merged[0][1], merged[1][1]
+        def step(qual, start, end, n_checks):
+            start = min(start + head, end)
+            return start, max(end - tail, start), None
+        return step
+
+    makers = {'HEADCROP': headcrop, 'TAILCROP': tailcrop, 'CROP': crop}
+    functions = [makers[name](length) for name, length in merged]
+    if len(functions) == 1:
+        only = functions[0]
+        def step(qual, start, end, n_checks):
+            return only(start, end) + (None,)
+        return step
+
+    def step(qual, start, end, n_checks):
+        for function in functions:
+            start, end = function(start, end)
+        return start, end, None
+    return step
+
+
+def end_step(leading, trailing, offset):
+    """
+    LEADING and/or TRAILING: remove end bases while their quality is below the threshold.
+    A threshold of None means that end is not trimmed. The thresholds are compared
+    directly with the quality bytes; on a whole read the low quality bytes are
+    stripped off in one go.
+    """
+    leading = 0 if leading is None else leading + offset
+    trailing = 0 if trailing is None else trailing + offset
+    low_leading = bytes(range(leading))     # All characters below the threshold
+    low_trailing = bytes(range(trailing))
+
+    def step(qual, start, end, n_checks):
+        if (start == 0) and (end == len(qual)):
+            kept = qual.lstrip(low_leading)
+            start = end - len(kept)
+            return start, start + len(kept.rstrip(low_trailing)), None
+
+        while (start < end) and (qual[start] < leading):
+            start += 1
+        while (end > start) and (qual[end-1] < trailing):
+            end -= 1
+        return start, end, None
+    return step
+
+
+def sliding_window_step(window_size, quality, offset):
+    """
+    SLIDINGWINDOW: scan from the 5' end, and cut the read where the average quality
+    of a window falls below the threshold. As in Trimmomatic, reads shorter than
+    the window are dropped.
+    """
+    quality += offset
+    required = window_size * quality        # Minimum sum of a window
+
+    def step(qual, start, end, n_checks):
+        if end - start < window_size:
+            return start, end, 'too_short'
+
+        total = sum(qual[start:start+window_size])
+        i, last = start, end - window_size
+        while total >= required:
+            if i == last:
+                return start, end, None
+            total += qual[i+window_size] - qual[i]
+            i += 1
+        return start, i, None
+    return step
+
+
+def quality_trim_step(window_size, quality, offset):
+    """
+    QUALITYTRIM: the magicClipper quality trimming, sliding a window inwards from
+    both ends of the read (see window_trim in clipperKernels.py, which gives the
+    backend). With a window size of 1, bases are removed one by one while their
+    quality is below the threshold.
+    """
+    if window_size == 1:
+        return end_step(quality, quality, offset)
+    quality += offset
+
+    def step(qual, start, end, n_checks):
+        start, end = ck.window_trim(qual, start, end, window_size, quality)
+        return start, end, None
+    return step
+
+
+def filter_step(min_len, avg_quality, offset):
+    """
+    MINLEN and/or AVGQUAL: drop reads that are too short or have low average quality.
+    A setting of None means that filter is not used.
+    """
+    if avg_quality is not None:
+        empty_fails = avg_quality > 0       # Empty reads have an average quality of 0
+        avg_quality += offset
+    if avg_quality is None:
+        def step(qual, start, end, n_checks):
+            if end - start < min_len:
+                return start, end, 'too_short'
+            return start, end, None
+    elif min_len is None:
+        def step(qual, start, end, n_checks):
+            if sum(qual[start:end]) < avg_quality * (end - start) or (empty_fails and end == start):
+                return start, end, 'low_quality'
+            return start, end, None
+    else:
+        def step(qual, start, end, n_checks):
+            if end - start < min_len:
+                return start, end, 'too_short'
+            if sum(qual[start:end]) < avg_quality * (end - start) or (empty_fails and end == start):
+                return start, end, 'low_quality'
+            return start, end, None
+    return step
+
+
+def max_n_step(max_n):
+    """
+    MAXN: drop reads with more than max_n unknown bases. Only the coordinates are
+    written down here, the bases are counted by the Trimmer on the sequence.
+    """
+    def step(qual, start, end, n_checks):
+        n_checks.append((start, end, max_n))
+        return start, end, None
+    return step
+
+
+class TrimPlan:
+    """
+    A compiled list of trimming steps, for one phred encoding.
+    """
+
+    def __init__(self, steps, phred):
+        self.steps = steps
+        self.phred = phred
+        self.offset = int(phred)
+        self.encoding = bytes(range(self.offset, self.offset + 42))    # Valid quality characters
+        self.out_phred = phred                  # Encoding of the written qualities
+        self.kinds = []                         # (kind, setting) of each function
+        self.functions = self.compile(steps)
+        self.compile_prefilter()
+
+    def compile(self, steps):
+        functions = []
+        i = 0
+        while i < len(steps):
+            name, values = steps[i]
+
+            # Take all neighbouring steps that can be merged with this one
+            group = [(name, values)]
+            for names in (CROP_STEPS, END_STEPS, FILTER_STEPS):
+                if name in names:
+                    while (i + len(group) < len(steps)) and (steps[i + len(group)][0] in names):
+                        group.append(steps[i + len(group)])
+            i += len(group)
+
+            if name in CROP_STEPS:
+                functions.append(crop_step([(n, v[0]) for n, v in group]))
+                self.kinds.append(('crop', None))
+
+            elif name in END_STEPS or name in FILTER_STEPS:
+                # Of each kind, only the highest threshold matters
+                first, second = None, None
+                for n, v in group:
+                    if n in ('LEADING', 'MINLEN'):
+                        first = v[0] if first is None else max(first, v[0])
+                    else:
+                        second = v[0] if second is None else max(second, v[0])
+                if name in END_STEPS:
+                    functions.append(end_step(first, second, self.offset))
+                    self.kinds.append(('trim', None))
+                else:
+                    functions.append(filter_step(first, second, self.offset))
+                    self.kinds.append(('filter', first))
+
+            elif name == 'SLIDINGWINDOW':
+                functions.append(sliding_window_step(*values, self.offset))
+                self.kinds.append(('trim', None))
+
+            elif name == 'QUALITYTRIM':
+                functions.append(quality_trim_step(*values, self.offset))
+                self.kinds.append(('trim', None))
+
+            elif name == 'MAXN':
+                functions.append(max_n_step(values[0]))
+                self.kinds.append(('maxn', values[0]))
+
+            elif name in ('TOPHRED33', 'TOPHRED64'):
+                self.out_phred = name[-2:]
+
+        return functions
+
+    def compile_prefilter(self):
+        """
+        Finds the checks that can be done on the raw read, before any decoding:
+        the fixed crops at the start of the plan, a MAXN step right after them and
+        the first MINLEN. Quality trimming can only make a read shorter, so a read
+        that is too short after the crops will always be dropped. It can also cut
+        N bases away, so the N check is only done early if nothing comes in between.
+        """
+        kinds = [kind for kind, setting in self.kinds]
+        i = 0
+
+        self.pre_crop = None
+        if kinds[i:i+1] == ['crop']:
+            self.pre_crop = self.functions[i]
+            i += 1
+
+        self.pre_max_n = None
+        if kinds[i:i+1] == ['maxn']:
+            self.pre_max_n = self.kinds[i][1]
+            i += 1
+
+        # Trimming steps up to the first filter (for the trimmed reads stats)
+        self.pre_trims = []
+        while (i < len(kinds)) and (kinds[i] in ('crop', 'trim')):
+            self.pre_trims.append(self.functions[i])
+            i += 1
+
+        # The first filter drops short reads before anything else
+        self.pre_min_len = None
+        if (i < len(kinds)) and (kinds[i] == 'filter'):
+            self.pre_min_len = self.kinds[i][1]
+
+        self.use_prefilter = (self.pre_max_n is not None) or bool(self.pre_min_len)
+
+    def prefilter(self, seq, qual):
+        """
+        Early reject of a read from its raw sequence and quality string (bytes).
+        Returns None if the read has to go through the whole plan, 'unknown' if the
+        quality can't be determined, and otherwise a result like trim_qualities for
+        a dropped read. The stats of the read (average quality and whether it was
+        trimmed before being dropped) are the same as with the whole plan.
+        """
+        length = len(qual)
+        start, end = 0, length
+        if self.pre_crop is not None:
+            start, end, _ = self.pre_crop(None, start, end, None)
+
+        if (self.pre_max_n is not None) and (seq.count(b'N', start, end) > self.pre_max_n):
+            reason = 'too_many_n'
+        elif (self.pre_min_len is not None) and (end - start < self.pre_min_len):
+            reason = 'too_short'
+            # Trimming done before the read is dropped (only matters if the crops did nothing)
+            if self.pre_trims and (start, end) == (0, length):
+                if not self.valid(qual):
+                    return 'unknown'
+                for function in self.pre_trims:
+                    start, end, _ = function(qual, start, end, None)
+        else:
+            return None
+
+        if not self.valid(qual):
+            return 'unknown'
+        avg_qual = (sum(qual) - self.offset * length) / length if length else 0
+        return avg_qual, start, end, 0, reason, ()
+
+    def valid(self, qual):
+        """
+        True if all characters of the quality string are part of the encoding.
+        """
+        return not qual.translate(None, self.encoding)     # Deletes all valid characters
+
+    def output_table(self):
+        """
+        Translation table from the input to the output phred encoding, or None if
+        they are the same.
+        """
+        if self.out_phred == self.phred:
+            return None
+        source = bytes(score + int(self.phred) for score in range(42))
+        target = bytes(score + int(self.out_phred) for score in range(42))
+        return bytes.maketrans(source, target)
+
+    def trim_qualities(self, qual):
+        """
+        Runs the plan on an encoded quality string (bytes). Returns None if the
+        quality can't be determined, and otherwise:
+        (average quality, start, end, average quality of the kept bases, reason, n_checks)
+        where reason is None for kept reads, and n_checks are the (start, end, max_n)
+        unknown base checks that still have to be done on the sequence.
+        """
+        if not self.valid(qual):
+            return None
+
+        # Average quality from the sum of the encoded bytes
+        offset = self.offset
+        length = len(qual)
+        total = sum(qual) - offset * length
+        avg_qual = total/length if length else 0
+
+        start, end, reason = 0, length, None
+        n_checks = []
+        for function in self.functions:
+            start, end, reason = function(qual, start, end, n_checks)
+            if reason is not None:
+                break
+        if (reason is None) and (end == start):
+            reason = 'too_short'                # Empty reads are never written
+
+        if (start, end) == (0, length):
+            kept_total = total
+        else:
+            kept_total = sum(qual[start:end]) - offset * (end - start)
+        avg_kept_qual = kept_total/(end - start) if end > start else 0
+
+        return avg_qual, start, end, avg_kept_qual, reason, tuple(n_checks)
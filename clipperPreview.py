@@ -0,0 +1,241 @@
+''' -----------------------------------------
+    This is the preview mode of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    Instead of trimming a whole file, only a sample of its reads is trimmed,
+    and the results are projected onto the full run: kept and dropped rates
+    (by reason), estimated number of kept reads, and the length and quality
+    distributions of the kept reads. No output files are written, so many
+    settings can be tried out quickly.
+
+    The sample is either the first N reads (--preview N), or a seeded random
+    subset where every read is taken with probability F (--fraction F). For
+    the random subset, the number of reads to skip before the next sampled
+    one is drawn at once (geometric distribution), and skipped reads are
+    never parsed nor trimmed. Both can be combined: the first N reads of the
+    random subset. In a plain single end file, long runs of skipped reads are
+    jumped over: the file is moved forward by their estimated size (from the
+    average size of the records so far), to the next record start. Compressed
+    (and paired end) files can't be jumped in, so a fraction alone only reads
+    their first MAX_SCAN records, and the rest of the input is projected.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import io
+import math
+import os
+import random
+
+import clipperIndex as ci
+import clipperMetrics as cm
+import clipperParallel as cpar
+import clipperTrimmer as ct
+
+
+LENGTH_BIN = 10                         # Width of the bins of the distributions
+QUALITY_BIN = 5
+BAR_WIDTH = 40                          # Characters of the longest histogram bar
+
+MAX_SCAN = 1000000                      # Records read at most for a fraction alone, if the input can't be jumped in
+SEEK_RECORDS = 100                      # Skipped records from which a plain file is jumped in
+
+
+class Sampler:
+    """
+    Takes a sample of the records of one or more open fastq files (read in step,
+    as for paired end files), and counts the records seen on the way.
+    """
+
+    def __init__(self, streams, limit=0, fraction=1.0, seed=1):
+        self.streams = streams
+        self.limit = limit                      # Records to sample (0 for no limit)
+        self.fraction = fraction
+        self.random = random.Random(seed)
+        self.seen = 0                           # Records read or skipped (estimated once jumped over)
+        self.sampled = 0
+        self.eof = False                        # Whether the files were read to the end, counting every record
+        self.jumped = False                     # Whether records were jumped over (see _jump)
+        self.stopped = False                    # Whether the reading stopped at MAX_SCAN records
+
+    def _skip_count(self):
+        if self.fraction >= 1:
+            return 0
+        # Records until the next sampled one, when each is sampled with probability fraction
+        return int(math.log(1.0 - self.random.random()) / math.log(1.0 - self.fraction))
+
+    def _skip(self, count):
+        readlines = [stream.readline for stream in self.streams]
+        for i in range(count):
+            for readline in readlines:
+                readline()
+                readline()
+                readline()
+                if not readline():
+                    return False
+            self.seen += 1
+        return True
+
+    def _jump(self, count):
+        """
+        Skips about count records of a plain file, by moving forward by their size
+        (estimated from the records so far) to the next record start.
+        """
+        stream = self.streams[0]
+        position = stream.tell()
+        cpar.find_record_start(stream, position + int(count * position / self.seen))
+        self.seen += count
+        self.jumped = True
+
+    def __iter__(self):
+        readers = [ct.read_fastq(stream) for stream in self.streams]
+        fraction_only = (self.limit == 0) and (self.fraction < 1)
+        seekable = (len(self.streams) == 1) and isinstance(self.streams[0], io.BufferedReader)
+        while (self.limit == 0) or (self.sampled < self.limit):
+            count = self._skip_count()
+            if fraction_only and (not seekable) and (self.seen + count >= MAX_SCAN):
+                self.stopped = True
+                return
+            if seekable and (count >= SEEK_RECORDS) and (self.seen > 0):
+                self._jump(count)
+            elif not self._skip(count):
+                break
+            records = tuple(next(reader, None) for reader in readers)
+            if None in records:
+                if any(record is not None for record in records):
+                    raise ct.UnequalReadCountError()
+                break
+            self.seen += 1
+            self.sampled += 1
+            yield records if len(records) > 1 else records[0]
+        else:
+            return
+        self.eof = not self.jumped
+
+    def estimated_total(self, in_file):
+        """
+        Estimated number of records in the whole file: exact if it was read to
+        the end, from its index (see clipperIndex.py) if it has one, and otherwise
+        from the part of the (compressed) file read so far.
+        """
+        if self.eof:
+            return self.seen
+        index = ci.load_index(in_file)
+        if index is not None:
+            return index['records']
+        position = cm.stream_position(self.streams[0])
+        if position == 0:
+            return self.seen
+        return round(self.seen * os.path.getsize(in_file) / position)
+
+
+def histogram(values, width):
+    """
+    This function counts values in bins of the given width. Returns a list of
+    (bin start, count), without the empty bins at both ends.
+    """
+    counts = {}
+    for value in values:
+        start = int(value // width) * width
+        counts[start] = counts.get(start, 0) + 1
+    if not counts:
+        return []
+    return [(start, counts.get(start, 0)) for start in range(min(counts), max(counts) + width, width)]
+
+
+def histogram_lines(values, width):
+    """
+    This function returns the lines of a text histogram of values, in bins of
+    the given width.
+    """
+    bins = histogram(values, width)
+    if not bins:
+        return ['  (no reads kept)']
+    total = len(values)
+    biggest = max(count for start, count in bins)
+    lines = []
+    for start, count in bins:
+        bar = '#' * round(BAR_WIDTH * count / biggest)
+        lines.append('  {:>4}-{:<4} {:>6.2f} % {}'.format(start, start + width - 1, 100 * count / total, bar))
+    return lines
+
+
+def summary_line(values):
+    values = sorted(values)
+    if not values:
+        return '  -'
+    return '  min {}, median {}, mean {}, max {}'.format(
+        round(values[0], 2), round(values[len(values)//2], 2), round(sum(values)/len(values), 2), round(values[-1], 2))
+
+
+def preview(in_files, in_streams, trimmer, limit=0, fraction=1.0, seed=1):
+    """
+    This function trims a sample of the reads (or read pairs) of open fastq files,
+    and returns the lines of the preview report, with the results projected onto
+    the whole input.
+    """
+    paired = len(in_streams) == 2
+    sampler = Sampler(in_streams, limit, fraction, seed)
+    offset = int(trimmer.plan.out_phred)        # Phred offset of the written qualities
+    lengths, qualities = [], []
+
+    ## Trim the sample, keeping the length and average quality of every kept read
+    for records in sampler:
+        if paired:
+            trimmed = trimmer.trim_pair(*records)
+            kept = trimmed if trimmed is not None else ()
+        else:
+            trimmed = trimmer.trim(records)
+            kept = (trimmed,) if trimmed is not None else ()
+        for record in kept:
+            length = len(record.qual)
+            lengths.append(length)
+            qualities.append((sum(record.qual) - offset * length) / length if length else 0)
+
+    ## Project the results onto the whole input
+    stats = trimmer.stats
+    unit = 'read pairs' if paired else 'reads'
+    sampled, kept = stats.read_count, stats.read_count - stats.dropped_reads
+    total = sampler.estimated_total(in_files[0])
+    kept_rate = kept / sampled if sampled else 0
+
+    lines = ['\n===============\nPREVIEW\n===============']
+    if limit and (fraction < 1):
+        lines.append('Sample: first {} of a random {} % of the {} (seed {})'.format(limit, 100 * fraction, unit, seed))
+    elif fraction < 1:
+        lines.append('Sample: random {} % of the {} (seed {})'.format(100 * fraction, unit, seed))
+    elif limit:
+        lines.append('Sample: first {} {}'.format(limit, unit))
+    else:
+        lines.append('Sample: all {}'.format(unit))
+    lines.append('{} trimmed: {} (out of {} {} from the input)'.format(
+        unit.capitalize(), sampled, sampler.seen, 'read or jumped over' if sampler.jumped else 'read'))
+    if sampler.stopped:
+        lines.append('Only the first {} {} were read (the input can\'t be jumped in), the rest is projected.'.format(
+            sampler.seen, unit))
+    if sampled == 0:
+        lines.append('No {} in the sample.'.format(unit))
+        return lines
+
+    lines.append('{} in the input: {}{}'.format(unit.capitalize(), total, '' if sampler.eof else ' (estimated)'))
+    lines.append('\n*** Projected for the full run ***')
+    lines.append('Kept: {} % (about {} {})'.format(round(100 * kept_rate, 2), round(kept_rate * total), unit))
+    lines.append('Dropped: {} % (about {} {})'.format(round(100 * (1 - kept_rate), 2), round((1 - kept_rate) * total), unit))
+    for reason, count in stats.dropped_by_reason.items():
+        if count:
+            lines.append('  {}: {} %'.format(reason, round(100 * count / sampled, 2)))
+    lines.append('Reads trimmed: {} %'.format(round(100 * stats.trimmed_reads / (sampled * (2 if paired else 1)), 2)))
+
+    lines.append('\n*** Length of kept reads ***')
+    lines.append(summary_line(lengths))
+    lines += histogram_lines(lengths, LENGTH_BIN)
+    lines.append('\n*** Average quality of kept reads ***')
+    lines.append(summary_line(qualities))
+    lines += histogram_lines(qualities, QUALITY_BIN)
+    return lines
@@ -0,0 +1,89 @@
+''' -----------------------------------------
+    This is the rejected reads output of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    Dropped reads can be written to a side output (FILE_rejected.fastq), as they
+    were before trimming, with the reason why they were dropped added to their
+    header:
+
+        @read_1234 reason=too_short
+
+    In paired end mode, both reads of a dropped pair are written, each to the
+    side output of its own file, with the reason of the pair. A mate given as None
+    (kept as an unpaired read) is not written.
+
+    As this can be most of a large run, a fixed number of reads can be kept for
+    each reason instead (reservoir sampling): every dropped read has the same
+    chance to be in the sample, and the sample is written at the end of the run.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import random
+
+import clipperTrimmer as ct
+
+
+def tag_record(record, reason):
+    """
+    This function returns a copy of a FastqRecord with the drop reason in its header.
+    """
+    return ct.FastqRecord(b'%s reason=%s' % (record.header, reason.encode()), record.seq, record.qual)
+
+
+class RejectWriter:
+    """
+    Writes every dropped read (or read pair) to the rejected reads output(s).
+    To be set as the on_reject of a Trimmer.
+    """
+
+    def __init__(self, out_streams):
+        self.out_streams = out_streams          # One per input file
+        self.counts = dict.fromkeys(ct.DROP_REASONS, 0)
+
+    def __call__(self, records, reason):
+        self.counts[reason] += 1
+        self.write(records, reason)
+
+    def write(self, records, reason):
+        for record, out_stream in zip(records, self.out_streams):
+            if record is not None:
+                ct.write_fastq(tag_record(record, reason), out_stream)
+
+    def close(self):
+        pass
+
+
+class RejectSampler(RejectWriter):
+    """
+    Keeps a uniform sample of at most size dropped reads (or read pairs) per
+    reason, and writes it when closed.
+    """
+
+    def __init__(self, out_streams, size, seed=1):
+        super().__init__(out_streams)
+        self.size = size
+        self.random = random.Random(seed)
+        self.samples = {reason: [] for reason in ct.DROP_REASONS}
+
+    def __call__(self, records, reason):
+        self.counts[reason] += 1
+        sample = self.samples[reason]
+        if len(sample) < self.size:
+            sample.append(records)
+        else:
+            # The n-th dropped read replaces a sampled one with probability size/n
+            i = self.random.randrange(self.counts[reason])
+            if i < self.size:
+                sample[i] = records
+
+    def close(self):
+        for reason in ct.DROP_REASONS:
+            for records in self.samples[reason]:
+                self.write(records, reason)
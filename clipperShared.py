@@ -0,0 +1,303 @@
+''' -----------------------------------------
+    This is the shared memory engine of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    Compressed and paired end files can't be split into byte ranges (see
+    clipperParallel.py), so they are read by the main process, and the reads
+    are handed to worker processes in batches. Sending the reads themselves
+    (pickled) to the workers takes longer than trimming them, so the batches
+    go through shared memory instead:
+
+    - A ring of slots is made once, in three shared memory blocks: the bases
+      and qualities of the reads of each slot, one after the other in a flat
+      byte buffer; the offsets of every sequence and quality in that buffer;
+      and, for every read, the (start, end, keep) result of the trimming.
+    - The main process packs a batch into a free slot, and only sends the
+      slot number and read count to a worker.
+    - The worker trims the reads of the slot, writes their coordinates into
+      the result array of the slot, and only sends back the stats of the batch.
+    - The main process writes the kept reads (the headers never leave it), in
+      the order of the input, and the slot is free again.
+
+    There are two slots per worker, so that a batch can be packed while the
+    previous one is being trimmed. The memory used is fixed by the slots.
+    With a memory budget (see clipperMemory.py), the slots are sized to its
+    share for batches of reads instead: fewer reads and bytes per slot, and
+    one slot per worker when even that is too much. The budget is checked
+    before every batch, and when it is over, the next batches hold fewer
+    reads. The budget counts the memory of the workers too, and each of them
+    gets the same part of it as the main process, to back off on its own.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import array
+import collections
+import itertools
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import clipperMemory as cmem
+import clipperParallel as cpar
+import clipperTrimmer as ct
+
+
+SLOT_SIZE = 1 << 22                     # Bytes of bases and qualities per slot (4 MB)
+SLOT_READS = 16384                      # Reads per slot at most
+SLOTS_PER_PROCESS = 2
+MIN_SLOT_SIZE = 1 << 16                 # Bytes per slot, whatever the budget (64 kB)
+
+
+def ring_size(processes, budget=None):
+    """
+    This function returns the (slots, slot_size, slot_reads) of the ring for
+    processes workers: two full slots per worker, or, with a memory budget,
+    slots that together hold its batch share of reads and bytes.
+    """
+    slots = SLOTS_PER_PROCESS * processes
+    if budget is None:
+        return slots, SLOT_SIZE, SLOT_READS
+    if budget.batch_size < slots * cmem.MIN_BATCH:
+        slots = processes               # One slot per worker, trimmed while the next one is read
+    slot_reads = max(min(budget.batch_size // slots, SLOT_READS), 2)
+    slot_size = int(min(max(budget.max_memory * 2**20 * cmem.BATCH_SHARE / slots, MIN_SLOT_SIZE), SLOT_SIZE))
+    return slots, slot_size, slot_reads
+
+
+class SlotRing:
+    """
+    A ring of slots in shared memory, each holding a batch of reads (bases and
+    qualities only) and the results of their trimming. Made by the main process,
+    and opened by name in the workers.
+    """
+
+    def __init__(self, slots, slot_size=SLOT_SIZE, slot_reads=SLOT_READS, names=None):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.slot_reads = slot_reads
+        self.offset_count = 2 * slot_reads + 1  # Offsets per slot: start of every sequence and quality, and end
+        if names is None:
+            sizes = [slots * slot_size, slots * self.offset_count * 4, slots * slot_reads * 3 * 4]
+            self.blocks = [shared_memory.SharedMemory(create=True, size=size) for size in sizes]
+        else:
+            self.blocks = [shared_memory.SharedMemory(name=name) for name in names]
+        self.data = self.blocks[0].buf
+        self.offsets = self.blocks[1].buf.cast('I')
+        self.results = self.blocks[2].buf.cast('i')
+
+    def names(self):
+        return [block.name for block in self.blocks]
+
+    def fits(self, read_count, byte_count):
+        return (read_count <= self.slot_reads) and (byte_count <= self.slot_size)
+
+    def pack(self, slot, records):
+        """
+        Writes the bases and qualities of a list of FastqRecords into a slot.
+        """
+        pieces = list(itertools.chain.from_iterable((record.seq, record.qual) for record in records))
+        data = b''.join(pieces)
+        start = slot * self.slot_size
+        self.data[start:start + len(data)] = data
+        offsets = array.array('I', itertools.accumulate(map(len, pieces), initial=0))
+        start = slot * self.offset_count
+        self.offsets[start:start + len(offsets)] = offsets
+
+    def unpack(self, slot, count):
+        """
+        Generator of the (sequence, quality) of the first count reads of a slot.
+        """
+        data, start = self.data, slot * self.slot_size
+        offsets = self.offsets[slot * self.offset_count:slot * self.offset_count + 2 * count + 1].tolist()
+        for i in range(0, 2 * count, 2):
+            yield (bytes(data[start + offsets[i]:start + offsets[i+1]]),
+                   bytes(data[start + offsets[i+1]:start + offsets[i+2]]))
+
+    def close(self, unlink=False):
+        self.data.release()
+        self.offsets.release()
+        self.results.release()
+        for block in self.blocks:
+            block.close()
+            if unlink:
+                block.unlink()
+
+
+## State of a worker process: its view of the ring and its Trimmer
+worker = {}
+
+
+def init_worker(names, slot_size, slot_reads, config, max_memory=0):
+    worker['ring'] = SlotRing(0, slot_size, slot_reads, names)
+    worker['trimmer'] = ct.Trimmer(config)
+    worker['cache_counts'] = (0, 0)
+    worker['budget'] = None
+    if max_memory > 0:
+        worker['budget'] = cmem.MemoryBudget(max_memory)
+        worker['budget'].release.append(worker['trimmer'].clear_cache)
+    worker['throttle_events'] = 0
+
+
+def trim_slot(task):
+    """
+    Worker: trims the count reads of one slot (read pairs one after the other if
+    paired), and writes the (start, end, keep) of every read into the results of the slot.
+    Returns the stats of the batch, the trim cache counts of the batch, and the
+    process id, memory, peak memory and throttling events of the batch of the worker.
+    """
+    slot, count, paired, keep_unpaired = task
+    ring, trimmer, budget = worker['ring'], worker['trimmer'], worker['budget']
+    if budget is not None:
+        budget.check()
+    trimmer.stats = ct.TrimStats()
+    results, position = ring.results, slot * ring.slot_reads * 3
+    record_fw, record_rev = ct.RecordBuffer(), ct.RecordBuffer()
+
+    reads = ring.unpack(slot, count)
+    for seq, qual in reads:
+        record_fw.seq, record_fw.qual = seq, qual
+        if not paired:
+            kept = (trimmer.trim_coordinates(record_fw),)
+        else:
+            record_rev.seq, record_rev.qual = next(reads)
+            kept = trimmer.trim_pair_coordinates(record_fw, record_rev, keep_unpaired) or (None, None)
+        for coordinates in kept:
+            if coordinates is None:
+                results[position+2] = 0
+            else:
+                results[position] = coordinates[0]
+                results[position+1] = coordinates[1]
+                results[position+2] = 1
+            position += 3
+
+    # Cache counts and throttling events of this batch only
+    hits, misses = trimmer.cache_counts()
+    last_hits, last_misses = worker['cache_counts']
+    worker['cache_counts'] = (hits, misses)
+    if budget is None:
+        return trimmer.stats, hits - last_hits, misses - last_misses, os.getpid(), 0, cmem.peak_rss_mb(), 0
+    throttle_events = budget.throttle_events - worker['throttle_events']
+    worker['throttle_events'] = budget.throttle_events
+    return (trimmer.stats, hits - last_hits, misses - last_misses, os.getpid(), cmem.current_rss_mb(),
+            budget.peak_mb(), throttle_events)
+
+
+def batches(records, ring, paired, budget=None):
+    """
+    Generator of lists of FastqRecords (or read pairs) that fit in a slot. With a
+    memory budget, a batch holds at most the budget's batch size spread over the
+    slots, which is looked at again for every batch.
+    """
+    reads_per_record = 2 if paired else 1
+
+    def read_limit():
+        if budget is None:
+            return ring.slot_reads
+        return max(min(budget.batch_size // ring.slots, ring.slot_reads), reads_per_record)
+
+    batch, read_count, byte_count = [], 0, 0
+    limit = read_limit()
+    for record in records:
+        size = sum(len(read.seq) + len(read.qual) for read in record) if paired else len(record.seq) + len(record.qual)
+        if (read_count + reads_per_record > limit) or not ring.fits(read_count + reads_per_record, byte_count + size):
+            if batch:
+                yield batch
+                batch, read_count, byte_count = [], 0, 0
+                limit = read_limit()
+            if not ring.fits(reads_per_record, size):
+                raise ValueError('read longer than a shared memory slot ({} bytes)'.format(ring.slot_size))
+        batch.append(record)
+        read_count += reads_per_record
+        byte_count += size
+    if batch:
+        yield batch
+
+
+def trim_shared(in_streams, out_streams, trimmer, processes, metrics=None, budget=None):
+    """
+    This function trims the reads of one open fastq file (or read pairs of two)
+    with processes worker processes, and writes the kept reads onto out_streams
+    (the forward and reverse outputs, then the unpaired ones with keep_unpaired),
+    in the order of the input. The stats of all workers are added to the given
+    trimmer, which only writes the kept reads out. Raises a ct.UnequalReadCountError
+    if paired files don't contain the same number of reads.
+    """
+    paired = len(in_streams) == 2
+    keep_unpaired = paired and trimmer.config.keep_unpaired
+    if paired:
+        records = ct.read_fastq_pairs(in_streams[0], in_streams[1])
+    else:
+        records = ct.read_fastq(in_streams[0])
+
+    ring = SlotRing(*ring_size(processes, budget))
+    free_slots = list(range(ring.slots))
+    pending = collections.deque()                  # (slot, batch, result) in the order of the input
+    stats = trimmer.stats
+    # The main process and every worker get the same part of the budget
+    max_memory = budget.max_memory / (processes + 1) if budget is not None else 0
+    worker_memory, worker_peaks = {}, {}           # Last and peak memory of every worker, by process id
+
+    def write_batch():
+        slot, batch, result = pending.popleft()
+        worker_stats, hits, misses, pid, memory, peak, throttle_events = result.get()
+        cpar.add_stats(stats, worker_stats)
+        trimmer.cleared_hits += hits
+        trimmer.cleared_misses += misses
+        worker_memory[pid] = memory
+        worker_peaks[pid] = max(worker_peaks.get(pid, 0), peak)
+        if budget is not None:
+            budget.throttle_events += throttle_events
+
+        results = ring.results[slot * ring.slot_reads * 3:(slot * ring.slot_reads + len(batch) * (2 if paired else 1)) * 3].tolist()
+        free_slots.append(slot)
+        if not paired:
+            write = out_streams[0].write
+            for i, record in enumerate(batch):
+                if results[3*i + 2]:
+                    write(trimmer.keep(record, results[3*i], results[3*i + 1]).to_bytes())
+        else:
+            for i, (record_fw, record_rev) in enumerate(batch):
+                start_fw, end_fw, keep_fw, start_rev, end_rev, keep_rev = results[6*i:6*i + 6]
+                if keep_fw and keep_rev:
+                    out_streams[0].write(trimmer.keep(record_fw, start_fw, end_fw).to_bytes())
+                    out_streams[1].write(trimmer.keep(record_rev, start_rev, end_rev).to_bytes())
+                elif keep_fw:
+                    out_streams[2].write(trimmer.keep(record_fw, start_fw, end_fw).to_bytes())
+                elif keep_rev:
+                    out_streams[3].write(trimmer.keep(record_rev, start_rev, end_rev).to_bytes())
+
+        # Print to STDOUT when progress is being made
+        if stats.read_count // 100000 > (stats.read_count - len(batch)) // 100000:
+            print('---', stats.read_count // 100000 * 100000, 'read pairs processed ---' if paired else 'reads processed ---')
+        if metrics is not None:
+            metrics.update(stats, in_streams, out_streams)
+
+    try:
+        with multiprocessing.Pool(processes, init_worker,
+                                  (ring.names(), ring.slot_size, ring.slot_reads, trimmer.config, max_memory)) as pool:
+            for batch in batches(records, ring, paired, budget):
+                if not free_slots:
+                    write_batch()               # Wait for the oldest batch to free its slot
+                if budget is not None:
+                    budget.check(sum(worker_memory.values()))   # Whole run, before the next batch is read
+                slot = free_slots.pop()
+                ring.pack(slot, itertools.chain.from_iterable(batch) if paired else batch)
+                read_count = 2 * len(batch) if paired else len(batch)
+                pending.append((slot, batch, pool.apply_async(trim_slot, ((slot, read_count, paired, keep_unpaired),))))
+            while pending:
+                write_batch()
+    finally:
+        ring.close(unlink=True)
+
+    # Upper bound of the peak memory of the whole run: the peaks of the workers
+    # may not have happened at the same time
+    if budget is not None:
+        budget.peak = max(budget.peak, cmem.peak_rss_mb() + sum(worker_peaks.values()))
+    return stats
@@ -0,0 +1,164 @@
+''' -----------------------------------------
+    This is the parameter sweep of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    A sweep trims the input once for a whole grid of settings, e.g.
+
+        magicClipper.py reads.fastq -SW 'AQ=10,15,20 W=4,5 ML=30,36'
+
+    and prints, for every combination, the reads kept, the bases kept and the
+    average quality of the kept reads. Settings that are not in the grid are
+    taken from the other options, as in a normal run.
+
+    Each read is checked and cropped once, and the prefix sums of its quality
+    bytes are computed once: the sum of the kept bases is then one subtraction,
+    for every combination. The quality trimming only depends on the window
+    size and average quality, so it is done once per pair of them, and all
+    minimum lengths are then checked on its result. The duplicate filter and
+    Trimmomatic-style steps (-S) can't be swept.
+
+    Please have this file along with magicClipper.py in your desired directory for
+    correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import itertools
+
+import clipperKernels as ck
+import clipperPlan as cp
+
+
+## Settings that can be swept, with their short names
+SWEEP_SETTINGS = {'AQ': 'avg_quality', 'AVGQUALITY': 'avg_quality',
+                  'W': 'window_size', 'WINDOWSIZE': 'window_size',
+                  'ML': 'min_len', 'MINLEN': 'min_len'}
+
+
+def parse_sweep(sweep_string, config):
+    """
+    This function reads a grid of settings like 'AQ=10,15,20 W=4,5 ML=30,36', and
+    returns the lists of average qualities, window sizes and minimum lengths to
+    try. Settings that are not given keep their value from the TrimConfig.
+    A ValueError is raised for unknown settings or invalid values.
+    """
+    grid = {'avg_quality': [config.avg_quality], 'window_size': [config.window_size],
+            'min_len': [config.min_len]}
+    for word in sweep_string.split():
+        name, _, values = word.partition('=')
+        if name.upper() not in SWEEP_SETTINGS:
+            raise ValueError('unknown sweep setting: {} \nAccepted input: AQ, W, ML'.format(word))
+        values = [int(value) for value in values.split(',') if value != '']
+        if (not values) or any(value < 0 for value in values):
+            raise ValueError('sweep values must be positive integers: ' + word)
+        grid[SWEEP_SETTINGS[name.upper()]] = sorted(set(values))
+    return grid['avg_quality'], grid['window_size'], grid['min_len']
+
+
+class Sweep:
+    """
+    Counts, for every combination of a grid of settings, the reads (or read
+    pairs) that would be kept, with their bases and quality.
+    """
+
+    def __init__(self, config, avg_qualities, window_sizes, min_lens):
+        if config.steps != '':
+            raise ValueError('trimming steps (-S) cannot be used in a parameter sweep')
+        if config.dedup:
+            raise ValueError('the duplicate filter cannot be used in a parameter sweep')
+        self.config = config
+        self.min_lens = min_lens
+
+        # Fixed steps before the quality trimming (crops and end trims), run once per read
+        steps = cp.default_steps(config.leading, config.trailing, 0, 0, 0, 0, 0,
+                                 config.leading_quality, config.trailing_quality)
+        self.plan = cp.TrimPlan([step for step in steps if step[0] not in ('MINLEN', 'AVGQUAL', 'MAXN')],
+                                config.phred)
+        self.offset = self.plan.offset
+
+        # Quality trimming for each (window size, average quality), as in cp.default_steps
+        self.trims = []
+        for window_size, avg_quality in itertools.product(window_sizes, avg_qualities):
+            quality = avg_quality if window_size > 1 else config.base_quality
+            self.trims.append((window_size, avg_quality, quality + self.offset, avg_quality + self.offset))
+
+        self.read_count = 0
+        # Kept reads (or pairs), bases and sum of average qualities, per (window size, avg quality, min length)
+        self.results = {(window_size, avg_quality, min_len): [0, 0, 0]
+                        for window_size, avg_quality, quality, threshold in self.trims
+                        for min_len in min_lens}
+
+    def _trim_read(self, record):
+        """
+        Returns, for every (window size, average quality), the kept length and
+        average quality of the read, or None where it is dropped whatever the
+        minimum length. Returns None if the quality can't be determined.
+        """
+        qual, offset = record.qual, self.offset
+        if not self.plan.valid(qual):
+            return None
+        start, end = 0, len(qual)
+        if (self.config.trim_n != '') and (b'N' in record.seq):
+            start, end = ck.n_trim(record.seq, self.config.trim_n == 'split')
+        if self.config.poly_x != '':
+            end = min(ck.poly_x_trim(record.seq, start, end, base, self.config.poly_x_min_len,
+                                     self.config.poly_x_mismatches) for base in self.config.poly_x.encode())
+        for function in self.plan.functions:
+            start, end, _ = function(qual, start, end, None)
+        sums = list(itertools.accumulate(qual, initial=0))
+
+        kept = []
+        for window_size, avg_quality, quality, threshold in self.trims:
+            trim_start, trim_end = start, end
+            if window_size > 0:
+                trim_start, trim_end = ck.window_trim(qual, start, end, window_size, quality)
+            length = trim_end - trim_start
+            total = sums[trim_end] - sums[trim_start]
+            ## STEP 4 and 5: Drop empty reads, reads with low average quality and with too many N bases
+            if (total < threshold * length) or (length == 0):
+                kept.append(None)
+            elif record.seq.count(b'N', trim_start, trim_end) > self.config.max_n:
+                kept.append(None)
+            else:
+                kept.append((length, (total - offset * length) / length))
+        return kept
+
+    def add(self, *records):
+        """
+        Adds one read, or one read pair, to the counts of every combination.
+        """
+        self.read_count += 1
+        results = [self._trim_read(record) for record in records]
+        if None in results:
+            return                              # Dropped for every combination
+
+        for trim, kept_reads in zip(self.trims, zip(*results)):
+            if None in kept_reads:
+                continue
+            ## STEP 3: Drop reads that are too short
+            shortest = min(length for length, avg_qual in kept_reads)
+            for min_len in self.min_lens:
+                if shortest < min_len:
+                    break                       # Minimum lengths are sorted
+                counts = self.results[trim[0], trim[1], min_len]
+                counts[0] += 1
+                for length, avg_qual in kept_reads:
+                    counts[1] += length
+                    counts[2] += avg_qual
+
+    def table(self, reads_per_count=1):
+        """
+        Returns the lines of the result table, one line per combination.
+        """
+        unit = 'pairs' if reads_per_count == 2 else 'reads'
+        lines = ['{:>6} {:>6} {:>6} {:>12} {:>8} {:>14} {:>11}'.format(
+            'W', 'AQ', 'ML', 'Kept ' + unit, 'Kept %', 'Kept bases', 'Avg quality')]
+        for (window_size, avg_quality, min_len), (kept, bases, qual_sum) in sorted(self.results.items()):
+            lines.append('{:>6} {:>6} {:>6} {:>12} {:>8.2f} {:>14} {:>11.2f}'.format(
+                window_size, avg_quality, min_len, kept,
+                100 * kept / self.read_count if self.read_count else 0, bases,
+                qual_sum / (kept * reads_per_count) if kept else 0))
+        return lines
@@ -0,0 +1,592 @@
+''' -----------------------------------------
+    This is the library interface of the magicClipper NGS read trimmer.
+    -----------------------------------------
+
+    It lets you trim reads from your own python code, without going through
+    the command line:
+
+        import clipperTrimmer as ct
+
+        config = ct.TrimConfig(phred='33', window_size=4, min_len=36)
+        for record in ct.iter_trimmed('reads.fastq.gz', config):
+            ...
+
+    A Trimmer can also be used directly on FastqRecord objects, one at a time
+    with trim() / trim_pair() or in lists with trim_batch(). All lines of a
+    FastqRecord are bytes, without the line break.
+
+    Please have this file along with clipperFunctions.py, clipperPlan.py and
+    clipperDedup.py in your desired directory for correct functioning.
+
+    -----------------------------------------
+    Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
+    -----------------------------------------
+'''
+
+## Required modules
+import clipperFunctions as cf
+import clipperDedup as dd
+import clipperKernels as ck
+import clipperPlan as cp
+import functools
+
+
+class FastqRecord:
+    """
+    One read of a fastq file: header, sequence and quality lines (as bytes).
+    """
+    __slots__ = ('header', 'seq', 'qual')
+
+    def __init__(self, header, seq, qual):
+        self.header = header
+        self.seq = seq
+        self.qual = qual
+
+    def __repr__(self):
+        return 'FastqRecord({!r}, {!r}, {!r})'.format(self.header, self.seq, self.qual)
+
+    def __eq__(self, other):
+        if not isinstance(other, FastqRecord):
+            return NotImplemented
+        return (self.header, self.seq, self.qual) == (other.header, other.seq, other.qual)
+
+    def kept(self, seq, qual):
+        """
+        Returns the read with a trimmed sequence and quality, as a new FastqRecord.
+        """
+        return FastqRecord(self.header, seq, qual)
+
+    def to_bytes(self):
+        """
+        Returns the four lines of the read, as written in a fastq file.
+        """
+        return b'%s\n%s\n+\n%s\n' % (self.header, self.seq, self.qual)
+
+
+class RecordBuffer(FastqRecord):
+    """
+    A FastqRecord that is filled again for every read of a file (see read_fastq),
+    so that no new object is built per read. The header line is kept as read, and
+    only stripped if the header is asked for; it is written as it is. A read is
+    kept by trimming the buffer in place (see Trimmer.keep), so a RecordBuffer,
+    and the read kept from it, are only valid until the next read is read.
+    """
+    __slots__ = ('header_line',)
+
+    def __init__(self):
+        self.header_line = b''
+        self.seq = b''
+        self.qual = b''
+
+    @property
+    def header(self):
+        return self.header_line.strip()
+
+    def kept(self, seq, qual):
+        self.seq = seq
+        self.qual = qual
+        return self
+
+    def to_bytes(self):
+        line = self.header_line
+        # Header lines with other spaces than their end of line are written stripped
+        if (line[-1:] != b'\n') or line[-2:-1].isspace() or line[:1].isspace():
+            line = line.strip() + b'\n'
+        return b'%s%s\n+\n%s\n' % (line, self.seq, self.qual)
+
+
+class TrimConfig:
+    """
+    All the settings of a trimming run. The defaults are the same as the ones of
+    the magicClipper command line. A ValueError is raised for invalid settings.
+    """
+
+    def __init__(self, phred='33', leading=0, trailing=0, window_size=4, avg_quality=15,
+                 base_quality=3, min_len=36, max_n=15, dedup=False, dedup_memory=1024,
+                 dedup_fpr=0.001, cache_size=0, bin_qualities='', steps='', leading_quality=0,
+                 trailing_quality=0, keep_unpaired=False, trim_n='', poly_x='', poly_x_min_len=10,
+                 poly_x_mismatches=1):
+        self.phred = phred                      # Phred encoding type ('33' or '64')
+        self.leading = leading                  # 3' bases to be removed
+        self.trailing = trailing                # 5' bases to be removed
+        self.leading_quality = leading_quality  # 3' bases below this quality are removed
+        self.trailing_quality = trailing_quality    # 5' bases below this quality are removed
+        self.window_size = window_size          # Window size for sliding window approach
+        self.avg_quality = avg_quality          # Average quality threshold for read/window
+        self.base_quality = base_quality        # Quality threshold for single bases
+        self.min_len = min_len                  # Minimum length for trimmed read
+        self.max_n = max_n                      # Maximum number of unknown bases in read
+        self.dedup = dedup                      # Remove exact duplicates
+        self.dedup_memory = dedup_memory        # Memory cap of the duplicate filter, in MB
+        self.dedup_fpr = dedup_fpr              # False-positive rate of the Bloom filter
+        self.cache_size = cache_size            # Number of quality strings with remembered trimming
+        self.bin_qualities = bin_qualities      # Quality binning of written reads ('' for no binning)
+        self.steps = steps                      # Trimmomatic-style trimming steps ('' for the settings above)
+        self.keep_unpaired = keep_unpaired      # Keep the surviving mate of dropped pairs
+        self.trim_n = trim_n                    # Unknown base trimming: 'ends', 'split' ('' for none)
+        self.poly_x = poly_x                    # Bases of the poly-X tails to remove, e.g. 'G' ('' for none)
+        self.poly_x_min_len = poly_x_min_len    # Minimum length of a poly-X tail
+        self.poly_x_mismatches = poly_x_mismatches  # Other bases allowed per 10 bases of a poly-X tail
+
+        self.quality_bins = None
+        if bin_qualities != '':
+            self.quality_bins = cf.parse_bin_edges(bin_qualities)
+
+        if steps != '':
+            cp.parse_steps(steps)               # Raises a ValueError for invalid steps
+
+        self.validate()
+
+    @classmethod
+    def from_args(cls, args, phred='33'):
+        """
+        Builds the configuration from the arguments of cf.run_arg_parser().
+        """
+        leading, leading_quality = cf.parse_end_trim(args.LEADING)
+        trailing, trailing_quality = cf.parse_end_trim(args.TRAILING)
+        return cls(phred=phred,
+                   leading=leading,
+                   trailing=trailing,
+                   leading_quality=leading_quality,
+                   trailing_quality=trailing_quality,
+                   window_size=int(args.WINDOWSIZE),
+                   avg_quality=int(args.AVGQUALITY),
+                   base_quality=int(args.BASEQUALITY),
+                   min_len=int(args.MINLEN),
+                   max_n=int(args.MAXN),
+                   dedup=args.DEDUP,
+                   dedup_memory=int(args.DEDUPMEMORY),
+                   dedup_fpr=float(args.DEDUPFPR),
+                   cache_size=int(args.CACHE),
+                   bin_qualities=args.BINQUALITIES,
+                   steps=args.STEPS,
+                   keep_unpaired=args.UNPAIRED,
+                   trim_n=args.NTRIM,
+                   poly_x=args.POLYX.upper(),
+                   poly_x_min_len=int(args.POLYXLENGTH),
+                   poly_x_mismatches=int(args.POLYXMISMATCHES))
+
+    def validate(self):
+        input_values = [self.leading, self.trailing, self.leading_quality, self.trailing_quality,
+                        self.base_quality, self.avg_quality, self.min_len, self.max_n, self.window_size,
+                        self.dedup_memory, self.cache_size, self.poly_x_min_len, self.poly_x_mismatches]
+        for value in input_values:
+            if value < 0:
+                raise ValueError('Must be posive integer: {}'.format(value))
+
+        if self.trim_n not in ['', 'ends', 'split']:
+            raise ValueError('Invalid input for unknown base trimming: {} \nAccepted input: \'ends\', \'split\''.format(self.trim_n))
+
+        if any(base not in 'ACGTN' for base in self.poly_x):
+            raise ValueError('Invalid input for poly-X tail bases: {} \nAccepted input: A, C, G, T, N'.format(self.poly_x))
+
+        if self.phred not in ['33', '64']:
+            raise ValueError('Invalid input for phred type: {} \nAccepted input: \'33\', \'64\''.format(self.phred))
+
+        if not 0 < self.dedup_fpr < 1:
+            raise ValueError('Invalid input for duplicate filter false-positive rate: {} \nMust be between 0 and 1'.format(self.dedup_fpr))
+
+
+## Reasons why a read (pair) can be dropped
+DROP_REASONS = ('unknown_quality', 'too_short', 'low_quality', 'too_many_n', 'duplicate')
+
+
+class TrimStats:
+    """
+    Counters kept by a Trimmer while it works, used for the log file.
+    In paired end mode, read_count and dropped_reads count read pairs.
+    dropped_by_reason splits dropped_reads over DROP_REASONS.
+    """
+    __slots__ = ('read_count', 'dropped_reads', 'trimmed_reads', 'duplicate_reads',
+                 'unpaired_fw_reads', 'unpaired_rev_reads',
+                 'read_len_sum', 'read_qual_sum', 'trimmed_read_len_sum', 'trimmed_read_qual_sum',
+                 'dropped_by_reason')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+        self.dropped_by_reason = dict.fromkeys(DROP_REASONS, 0)
+
+
+class Trimmer:
+    """
+    Trims reads following a TrimConfig, and keeps the stats of everything it trimmed.
+    """
+
+    def __init__(self, config=None):
+        if config is None:
+            config = TrimConfig()
+        self.config = config
+        self.stats = TrimStats()
+        self.on_reject = None                   # Called as on_reject(records, reason) for dropped reads (None for kept mates)
+        self.poly_x = config.poly_x.encode()    # Poly-X tail bases, as byte values
+
+        # Trimming steps, compiled once (see clipperPlan.py)
+        if config.steps != '':
+            steps = cp.parse_steps(config.steps)
+        else:
+            steps = cp.default_steps(config.leading, config.trailing, config.window_size, config.avg_quality,
+                                     config.base_quality, config.min_len, config.max_n,
+                                     config.leading_quality, config.trailing_quality)
+        self.plan = cp.TrimPlan(steps, config.phred)
+
+        # Trimming of quality strings, remembering the last results (only if user says so)
+        if config.cache_size > 0:
+            self.trim_qualities = functools.lru_cache(maxsize=config.cache_size)(self.plan.trim_qualities)
+        else:
+            self.trim_qualities = self.plan.trim_qualities
+        self.cleared_hits, self.cleared_misses = 0, 0     # Cache counts from before clear_cache()
+
+        # Duplicate filter (only if user says so)
+        self.dup_filter = None
+        if config.dedup:
+            self.dup_filter = dd.DuplicateFilter(config.dedup_memory, config.dedup_fpr)
+
+        # Translation table for the written qualities: quality binning and/or change of
+        # phred encoding (only if user says so)
+        self.out_table = None
+        if config.quality_bins is not None:
+            self.out_table = cf.quality_bin_table(config.phred, config.quality_bins)
+        phred_table = self.plan.output_table()
+        if phred_table is not None:
+            if self.out_table is None:
+                self.out_table = phred_table
+            else:
+                self.out_table = self.out_table.translate(phred_table)
+
+    def cache_counts(self):
+        """
+        Hits and misses of the trim cache since the start, as (hits, misses).
+        """
+        if self.config.cache_size == 0:
+            return self.cleared_hits, self.cleared_misses
+        cache_info = self.trim_qualities.cache_info()
+        return self.cleared_hits + cache_info.hits, self.cleared_misses + cache_info.misses
+
+    def clear_cache(self):
+        """
+        Empties the trim cache (if any), to free memory.
+        """
+        if self.config.cache_size > 0:
+            self.cleared_hits, self.cleared_misses = self.cache_counts()
+            self.trim_qualities.cache_clear()
+
+    def _trim_read(self, record):
+        """
+        STEP 0 to 5 for one read. Returns None if the quality can't be determined,
+        and otherwise the (start, end) coordinates of the kept bases, their average
+        quality and the reason to drop the read (None if it is kept). The read
+        itself is only sliced once it is kept (see keep).
+        """
+        stats, config = self.stats, self.config
+        seq, qual = record.seq, record.qual
+
+        ## Remove unknown bases at the ends, or keep the longest part without them (if user says so)
+        ## Remove poly-X tails (if user says so)
+        # The rest of the trimming is done on the kept part, and its coordinates moved back at the end
+        seq_start, seq_end = 0, len(seq)
+        if (config.trim_n != '') and (b'N' in seq):
+            seq_start, seq_end = ck.n_trim(seq, config.trim_n == 'split')
+        if self.poly_x:
+            seq_end = min(ck.poly_x_trim(seq, seq_start, seq_end, base, config.poly_x_min_len, config.poly_x_mismatches)
+                          for base in self.poly_x)
+        if (seq_start, seq_end) != (0, len(seq)):
+            if not self.plan.valid(qual):
+                return None
+            seq, qual = seq[seq_start:seq_end], qual[seq_start:seq_end]
+
+        ## STEP 0: Drop read if quality can't be determined
+        # Reads that can't pass the length (or N) filter anyway are dropped before decoding
+        trim_result = None
+        if self.plan.use_prefilter:
+            trim_result = self.plan.prefilter(seq, qual)
+        if trim_result is None:
+            trim_result = self.trim_qualities(qual)
+        if (trim_result is None) or (trim_result == 'unknown'):
+            return None
+        avg_qual, start, end, avg_kept_qual, reason, n_checks = trim_result
+
+        ## Stats for unprocessed reads
+        if len(qual) != len(record.qual):
+            avg_qual = (sum(record.qual) - self.plan.offset * len(record.qual)) / len(record.qual)
+        stats.read_len_sum += len(record.seq)
+        stats.read_qual_sum += avg_qual
+
+        ## STEP 3 and 4: Drop reads that are too short or have low average quality (done by the plan)
+        ## STEP 5: Drop reads with too many N bases
+        for check_start, check_end, max_n in n_checks:
+            if seq.count(b'N', check_start, check_end) > max_n:
+                reason = 'too_many_n'
+                start, end = check_start, check_end     # Read as it was when dropped
+                break
+        start, end = start + seq_start, end + seq_start
+
+        ## STEP 1 and 2: Remove leading and trailing bases, given user input and based on quality
+        if (start, end) != (0, len(record.qual)):
+            stats.trimmed_reads += 1
+        return start, end, avg_kept_qual, reason
+
+    def keep(self, record, start, end):
+        """
+        Returns the kept part of a read, from its (start, end) coordinates (as given
+        by trim_coordinates), with the qualities written as asked (binning, phred).
+        """
+        seq, qual = record.seq, record.qual
+        if (start, end) != (0, len(qual)):
+            seq, qual = seq[start:end], qual[start:end]
+        elif self.out_table is None:
+            return record                       # Nothing to change, the read is kept as it is
+        # Binned qualities (if user says so) are only used for the output
+        if self.out_table is not None:
+            qual = qual.translate(self.out_table)
+        return record.kept(seq, qual)
+
+    def trim(self, record):
+        """
+        Trims one read. Returns the trimmed FastqRecord, or None if the read is dropped.
+        """
+        kept = self.trim_coordinates(record)
+        if kept is None:
+            return None
+        return self.keep(record, kept[0], kept[1])
+
+    def trim_coordinates(self, record):
+        """
+        Same as trim, but returns the (start, end) coordinates of the kept bases
+        instead of the trimmed read (None if the read is dropped).
+        """
+        stats = self.stats
+        stats.read_count += 1
+
+        ## STEP 0 to 5: Check and trim read
+        result = self._trim_read(record)
+        if (result is None) or (result[3] is not None):
+            reason = 'unknown_quality' if result is None else result[3]
+            stats.dropped_reads += 1
+            stats.dropped_by_reason[reason] += 1
+            if self.on_reject is not None:
+                self.on_reject((record,), reason)
+            return None
+        start, end, avg_qual, reason = result
+
+        ## STEP 6: Drop exact duplicates of reads already kept (if user says so)
+        if (self.dup_filter is not None) and self.dup_filter.is_duplicate(dd.sequence_hash(record.seq)):
+            stats.dropped_reads += 1
+            stats.duplicate_reads += 1
+            stats.dropped_by_reason['duplicate'] += 1
+            if self.on_reject is not None:
+                self.on_reject((record,), 'duplicate')
+            return None
+
+        stats.trimmed_read_len_sum += end - start
+        stats.trimmed_read_qual_sum += avg_qual
+        return start, end
+
+    def trim_pair(self, record_fw, record_rev):
+        """
+        Trims one read pair. Returns the trimmed (forward, reverse) FastqRecords,
+        or None if the pair is dropped. A pair is dropped when either read is.
+        """
+        return self._trim_pair(record_fw, record_rev, False)
+
+    def trim_pair_unpaired(self, record_fw, record_rev):
+        """
+        Same as trim_pair, but always returns a (forward, reverse) tuple. When only
+        one read of the pair is dropped, the other one is still given, and the
+        dropped one is None. Both are None if both reads are dropped.
+        """
+        trimmed = self._trim_pair(record_fw, record_rev, True)
+        if trimmed is None:
+            return None, None
+        return trimmed
+
+    def _trim_pair(self, record_fw, record_rev, keep_unpaired):
+        kept = self.trim_pair_coordinates(record_fw, record_rev, keep_unpaired)
+        if kept is None:
+            return None
+        kept_fw, kept_rev = kept
+        return (self.keep(record_fw, kept_fw[0], kept_fw[1]) if kept_fw is not None else None,
+                self.keep(record_rev, kept_rev[0], kept_rev[1]) if kept_rev is not None else None)
+
+    def trim_pair_coordinates(self, record_fw, record_rev, keep_unpaired=False):
+        """
+        Same as trim_pair (or trim_pair_unpaired with keep_unpaired), but returns
+        the (start, end) coordinates of the kept bases of both reads instead of the
+        trimmed reads, or None if the pair is dropped. With keep_unpaired, the
+        coordinates of the dropped mate of a kept read are None.
+        """
+        stats = self.stats
+        stats.read_count += 1
+
+        ## STEP 0 to 5: Check and trim forward and reverse reads
+        result_fw = self._trim_read(record_fw)
+        result_rev = None
+        if (result_fw is not None) or keep_unpaired:
+            result_rev = self._trim_read(record_rev)
+        kept_fw = (result_fw is not None) and (result_fw[3] is None)
+        kept_rev = (result_rev is not None) and (result_rev[3] is None)
+
+        if not (kept_fw and kept_rev):
+            reason = self._pair_reason(result_fw, result_rev)
+            stats.dropped_reads += 1
+            stats.dropped_by_reason[reason] += 1
+            # A mate kept as an unpaired read (if user says so) is not given to on_reject
+            if self.on_reject is not None:
+                self.on_reject((None if keep_unpaired and kept_fw else record_fw,
+                                None if keep_unpaired and kept_rev else record_rev), reason)
+            # The surviving mate (if user says so), unless it is a duplicate of a mate already kept
+            if keep_unpaired and kept_fw:
+                if self._unpaired_duplicate((record_fw, None)):
+                    return None
+                stats.unpaired_fw_reads += 1
+                return result_fw[:2], None
+            if keep_unpaired and kept_rev:
+                if self._unpaired_duplicate((None, record_rev)):
+                    return None
+                stats.unpaired_rev_reads += 1
+                return None, result_rev[:2]
+            return None
+        start_fw, end_fw, avg_qual_fw, reason_fw = result_fw
+        start_rev, end_rev, avg_qual_rev, reason_rev = result_rev
+
+        ## STEP 6: Drop exact duplicates of read pairs already kept (if user says so)
+        if (self.dup_filter is not None) and self.dup_filter.is_duplicate(dd.sequence_hash(record_fw.seq, record_rev.seq)):
+            stats.dropped_reads += 1
+            stats.duplicate_reads += 1
+            stats.dropped_by_reason['duplicate'] += 1
+            if self.on_reject is not None:
+                self.on_reject((record_fw, record_rev), 'duplicate')
+            return None
+
+        stats.trimmed_read_len_sum += (end_fw - start_fw) + (end_rev - start_rev)
+        stats.trimmed_read_qual_sum += avg_qual_fw + avg_qual_rev
+        return (start_fw, end_fw), (start_rev, end_rev)
+
+    def _unpaired_duplicate(self, records):
+        # STEP 6 for the surviving mate of a dropped pair, given as (record, None) or (None, record)
+        # Forward and reverse mates are hashed apart, as they are written to different files
+        # The pair is already counted as dropped, so only the duplicate is counted here
+        if self.dup_filter is None:
+            return False
+        record_fw, record_rev = records
+        if record_fw is not None:
+            read_hash = dd.sequence_hash(record_fw.seq, b'')
+        else:
+            read_hash = dd.sequence_hash(b'', record_rev.seq)
+        if not self.dup_filter.is_duplicate(read_hash):
+            return False
+        self.stats.duplicate_reads += 1
+        if self.on_reject is not None:
+            self.on_reject(records, 'duplicate')
+        return True
+
+    @staticmethod
+    def _pair_reason(result_fw, result_rev):
+        # Reason of the forward read first, as it is checked first
+        for result in (result_fw, result_rev):
+            if result is None:
+                return 'unknown_quality'
+            if result[3] is not None:
+                return result[3]
+
+    def trim_batch(self, records):
+        """
+        Trims a list of reads. Returns a list with, for each read, the trimmed
+        FastqRecord or None if the read is dropped.
+        """
+        trim = self.trim
+        return [trim(record) for record in records]
+
+
+def read_fastq(stream, reuse=False):
+    """
+    Generator of the FastqRecords of an open fastq file (in binary mode).
+    An incomplete record at the end of the file is ignored. With reuse, the same
+    RecordBuffer is filled with every read, for loops that write (or drop) each
+    read before reading the next one.
+    """
+    readline = stream.readline
+    if reuse:
+        record = RecordBuffer()
+        while True:
+            record.header_line = readline()
+            seq = readline()
+            readline()
+            qual = readline()
+            if not qual:
+                return
+            record.seq = seq.strip()
+            record.qual = qual.strip()
+            yield record
+
+    while True:
+        header = readline()
+        seq = readline()
+        readline()
+        qual = readline()
+        if not qual:
+            return
+        yield FastqRecord(header.strip(), seq.strip(), qual.strip())
+
+
+class UnequalReadCountError(ValueError):
+    """
+    Raised when the two files of a paired end run don't contain the same number of reads.
+    """
+
+    def __init__(self):
+        super().__init__('Input files do not contain equal number of reads.')
+
+
+def read_fastq_pairs(stream_fw, stream_rev, reuse=False):
+    """
+    Generator of the (forward, reverse) FastqRecords of two open fastq files
+    (reusing one RecordBuffer per file with reuse, see read_fastq).
+    Raises an UnequalReadCountError if the files don't contain the same number of reads.
+    """
+    records_rev = read_fastq(stream_rev, reuse)
+    for record_fw in read_fastq(stream_fw, reuse):
+        record_rev = next(records_rev, None)
+        if record_rev is None:
+            raise UnequalReadCountError()
+        yield record_fw, record_rev
+    if next(records_rev, None) is not None:
+        raise UnequalReadCountError()
+
+
+def write_fastq(record, file):
+    """
+    Writes a FastqRecord onto a file opened in binary mode.
+    """
+    file.write(record.to_bytes())
+
+
+def iter_trimmed(path_or_stream, config=None, trimmer=None):
+    """
+    Generator of the trimmed reads of a fastq file, given by its name or as an
+    open binary stream. Dropped reads are left out. Either a TrimConfig or a
+    Trimmer (to look at its stats afterwards) can be given. Without any of them,
+    the default settings are used, with the phred type autodetected from the file.
+    """
+    if trimmer is None:
+        if config is None:
+            phred = '33'
+            if isinstance(path_or_stream, str):
+                phred = cf.phred_autodetect(path_or_stream, '')
+            config = TrimConfig(phred=phred)
+        trimmer = Trimmer(config)
+
+    if isinstance(path_or_stream, str):
+        stream = cf.open_input_file(path_or_stream)
+    else:
+        stream = path_or_stream
+
+    try:
+        trim = trimmer.trim
+        for record in read_fastq(stream):
+            trimmed = trim(record)
+            if trimmed is not None:
+                yield trimmed
+    finally:
+        if stream is not path_or_stream:
+            stream.close()
@@ -10,22 +10,28 @@ with gzip.open('input.gz','r') as infile:
 
 
 # We also should be able to find out whether our input files are compressed
-# or not. 
+# or not. The file name can lie (or have no extension at all), so we look at
+# the first bytes of the file instead: gzip files start with 1f 8b, bzip2
+# files with 'BZh' and xz files with fd 37 7a 58 5a 00.
 
 # We do it like this:
 
 import sys
-import re
-
-if re.search(r'\.gz', sys.argv[1]):
-    with gzip.open('input.gz','r') as infile:
-        for line in infile:
-            print('got line', line)
-
-else: 
-    with open(input.fastq, 'r') as infile:
-        for line in infile:
-            print('got line', line)
-
-
-    
\ No newline at end of file
+import bz2
+import lzma
+
+with open(sys.argv[1], 'rb') as infile:
+    magic = infile.read(6)
+
+if magic.startswith(b'\x1f\x8b'):
+    opener = gzip.open
+elif magic.startswith(b'BZh'):
+    opener = bz2.open
+elif magic.startswith(b'\xfd7zXZ\x00'):
+    opener = lzma.open
+else:
+    opener = open
+
+with opener(sys.argv[1], 'rt') as infile:
+    for line in infile:
+        print('got line', line)
@@ -1,14 +1,20 @@
 ''' -----------------------------------------
     This is the magicClipper NGS read trimmer
     -----------------------------------------
-    When given one or two .fastq files, this program performs a complete 
-    user-guided and quality-based trimming of the reads contained in it. 
-    
-    Please have this file and clipperFunctions.py in your desired directory for
-    correct functioning.
+    When given one or two .fastq files, this program performs a complete
+    user-guided and quality-based trimming of the reads contained in it.
 
-    For a more detailed description of the programa and its settings, please read 
-    the program manual or type magicClipper.py -h on your terminal. 
+    Please have this file, clipperFunctions.py, clipperTrimmer.py, clipperPlan.py,
+    clipperDedup.py, clipperMetrics.py, clipperMemory.py, clipperIndex.py,
+    clipperParallel.py, clipperPreview.py, clipperSweep.py, clipperRejects.py,
+    clipperKernels.py, clipperAsync.py and clipperShared.py in your desired directory
+    for correct functioning.
+
+    The trimming itself is done by clipperTrimmer.py, which can also be
+    imported to trim reads from your own python code.
+
+    For a more detailed description of the programa and its settings, please read
+    the program manual or type magicClipper.py -h on your terminal.
 
     -----------------------------------------
     Authors: Celia Burgos Sequeros (s202423) & Viktor Törnblom (s200116)
@@ -18,522 +24,562 @@
 
 ## Required modules
 import clipperFunctions as cf
-import gzip
+import clipperTrimmer as ct
+import clipperPlan as cp
+import clipperMetrics as cm
+import clipperMemory as cmem
+import clipperParallel as cpar
+import clipperPreview as cprev
+import clipperSweep as csweep
+import clipperRejects as crej
+import clipperAsync as casync
+import clipperShared as cshared
+import os
 import sys
 
-##############
-# User input #
-##############
-
-## Get filename(s) and filename base(s) from command line (and make sure extension is correct)
-args = cf.run_arg_parser()
-
-in_fwFile = args.FILE1
-in_revFile = args.FILE2
-base_fw = in_fwFile.split('.')[0]
-base_rev = in_revFile.split('.')[0]
-
-if (not in_fwFile.endswith('.fastq')) and (not in_fwFile.endswith('.fastq.gz')):
-    print('ERROR: your input file(s) must have .fastq or .fastq.gz extension')
-    sys.exit(1)
-
-if in_revFile != '':
-    if (not in_revFile.endswith('.fastq')) and (not in_revFile.endswith('.fastq.gz')):
-        print('ERROR: your input file(s) must have .fastq or .fastq.gz extension')
-        sys.exit(1)
-
 
-## Get arguments from command line (and make sure they are acceptable)
-try:
-    LEADING = int(args.LEADING)               # 3' bases to be removed
-    TRAILING = int(args.TRAILING)             # 5' bases to be removed
-    BASE_QUALITY = int(args.BASEQUALITY)      # Quality threshold for single bases (3 by default)
-    AVG_QUALITY = int(args.AVGQUALITY)        # Average quality threshold for read/window (15 by default)
-    MIN_LEN = int(args.MINLEN)                # Minimum length for trimmed read (36 by default)
-    N_MAX = int(args.MAXN)                    # Maximum number of unknown bases in read (3 by default)      
-    WIN_SIZE = int(args.WINDOWSIZE)           # Window size for sliding window approach (1 by default)
-    USER_PHRED = args.PHRED                   # User given phred type                                     
-except ValueError as err:
-    print('Invalid input. Reason: ' + str(err))
-    sys.exit(1)
-
-input_values = [LEADING, TRAILING, BASE_QUALITY, AVG_QUALITY, MIN_LEN, N_MAX, WIN_SIZE]
-for i in range(len(input_values)):
-    if input_values[i] < 0:
-        print('Invalid input. Must be posive integer: {}'.format(input_values[i]) )
-        sys.exit(1)
+def write_log(log_name, in_files, config, USER_PHRED, trimmer, budget=None, rejects=None):
+    """
+    This function writes the settings and stats of a run onto the log file.
+    """
+    stats = trimmer.stats
+    paired = len(in_files) == 2
+    reads_per_count = 2 if paired else 1       # In paired end mode, stats are counted per read pair
+    read_count, dropped_reads = stats.read_count, stats.dropped_reads
 
-if USER_PHRED not in ['', '33', '64']:
-    print('Invalid input for phred type: {} \nAccepted input: \'33\', \'64\''.format(USER_PHRED))
-    sys.exit(1)
+    trimmed_reads = stats.trimmed_reads
+    if (config.steps == '') and ((config.leading != 0) or (config.trailing != 0)):
+        trimmed_reads = 'all'
 
+    log = open(log_name, 'w')
 
-
-###################
-# Singe end reads #
-################### 
-if in_revFile == '':    
-    ## -------- Trimmer ---------- ##
-    try:
-        # Determine Phred encoding type
-        phred = cf.phred_autodetect(in_fwFile, USER_PHRED) 
-    
-        # Open files, checking if file is compressed or not 
-        if in_fwFile.endswith('.gz'):
-            file_fw = gzip.open(in_fwFile, 'rt')
-        else:    
-            file_fw = open(in_fwFile, 'r')
-    except IOError as err:
-        print('File could not be opened. Reason: ' + str(err))
-        sys.exit(1)
-    
-    # Control if output file already exists in working directory, and open
-    out_fw = cf.controling_output_file(in_fwFile)
-
-    print('You have initialized the single end mode of magicClipper.\nThis might take a while... So please be patient!')    
-    
-    # Read first line and initialize variables
-    line_fw = file_fw.readline()
-    
-    line_count = 0
-    fastq_fw = []
-
-    # Variables for stats
-    dropped_reads = 0
-    trimmed_reads = 0
-    if (LEADING != 0) or (TRAILING != 0):
-        trimmed_reads = 'all'    
-    read_count = 0
-    read_len_sum = 0
-    read_qual_sum = 0
-    trimmed_read_len_sum = 0
-    trimmed_read_qual_sum = 0
-
-    # Iterate through lines
-    while line_fw != '':
-        line_count += 1
-        
-        # For each read, make a 4 element list with each line as an element
-        fastq_fw.append(line_fw.strip())
-
-        if line_count == 4:
-            # Keep track of number of reads in files
-            read_count += 1
-            # Print to STDOUT when progress is being made
-            if read_count % 100000 == 0:
-                print('---', read_count, 'reads processed ---')
-
-            # Read sequence and quality (encoded and decoded)
-            read_fw = fastq_fw[1]
-            qual_str_fw = fastq_fw[3]
-            qual_score_fw = cf.quality_score(qual_str_fw, phred)      
-
-            ## STEP 0: Drop read if quality can't be determined            
-            if qual_score_fw == 'unknown':
-                # Keep track of dropped read
-                dropped_reads += 1
-                # Reset
-                line_count, fastq_fw = 0, []
-                # Read new line
-                line_fw = file_fw.readline()
-                # Continue to next read without printing                
-                continue
-            
-            ## Stats for unprocessed reads ##
-            # Average length of all kept reads
-            read_len_sum += len(read_fw)
-            # Average quality of all kept reads
-            avg_qual = sum(qual_score_fw)/len(qual_score_fw)
-            read_qual_sum += avg_qual    
-
-
-            ## STEP 1: Remove leading and trailing bases, given user input
-            read_fw, qual_str_fw, qual_score_fw = cf.global_trim(read_fw, qual_str_fw, qual_score_fw, LEADING, TRAILING)
-            
-
-            ## STEP 2: Remove leading and trailing bases, based on quality
-            read_fw, qual_str_fw, qual_score_fw, trimmed = cf.quality_trim(read_fw, qual_str_fw, qual_score_fw, WIN_SIZE, AVG_QUALITY, BASE_QUALITY)
-            if (trimmed == True) and (trimmed_reads != 'all'):
-                trimmed_reads += 1
-
-
-            ## STEP 3: Drop reads that become too short after trimming
-            if (len(read_fw) < MIN_LEN):                                    
-                # Keep track of dropped read
-                dropped_reads += 1
-                # Reset
-                line_count, fastq_fw = 0, []
-                # Read new line
-                line_fw = file_fw.readline()
-                # Continue to next read without printing
-                continue
-
-
-            ## STEP 4: Drop reads with low average quality
-            avg_qual_fw = sum(qual_score_fw)/len(qual_score_fw)
-            if (avg_qual_fw < AVG_QUALITY):
-                # Keep track of dropped read
-                dropped_reads += 1
-                # Reset
-                line_count, fastq_fw = 0, []
-                # Read new line
-                line_fw = file_fw.readline()
-                # Continue to next read without printing
-                continue
-
-
-            # STEP 5: Drop reads with too many N bases
-            if (read_fw.count('N') > N_MAX):
-                # Keep track of dropped read
-                dropped_reads += 1                
-                # Reset
-                line_count, fastqForward = 0, []
-                # Read new lines
-                line_fw = file_fw.readline()    
-                # Continue to next read without printing
-                continue 
-
-
-            # STEP 6: Print trimmed reads onto outfile
-            cf.print_read(fastq_fw[0], read_fw, qual_str_fw, out_fw)
-
-
-            ## Stats for trimmed reads ##
-            # Average length of all kept reads
-            trimmed_read_len_sum += len(read_fw)
-            # Average quality of all kept reads
-            trimmed_read_qual_sum += avg_qual_fw           
-
-            # Reset
-            line_count, fastq_fw = 0, []
-
-        # Read next line
-        line_fw = file_fw.readline()
-
-    # Close files
-    file_fw.close()
-    out_fw.close()
-    
-    ## --------------------------- ##
-
-    ## ------- Log file ---------- ##
-    log = open(base_fw + '.log', 'w')
-
-    print('This is the log file for the trimming of', in_fwFile, file=log)
+    print('This is the log file for the trimming of', ' and '.join(in_files), file=log)
 
     # Print used settings
     print('\n===============\nSETTINGS\n===============', file=log)
-    print('File 1:', in_fwFile, file=log)                 # File 1                                      
-    print('Base quality:', BASE_QUALITY, file=log)        # Single base quality
-    print('Average quality:', AVG_QUALITY, file=log)      # Average quality
-    print('Lead trim:', LEADING, file=log)                # Lead trim
-    print('Trail trim:', TRAILING, file=log)              # Trail trim
-    print('Window size:', WIN_SIZE, file=log)             # Window size 
-    print('Maximum unknown bases:', N_MAX, file=log)      # Maximum number of Ns
-    print('Min lenght:', MIN_LEN, file=log)               # Minimum lenght after trim
-    if (USER_PHRED != '') and (phred != USER_PHRED):      # Phred encoding type
-        print("Phred encoding was set to {}, but {} was used.".format(USER_PHRED, phred), file=log)
+    print('File 1:', in_files[0], file=log)                         # File 1
+    if paired:
+        print('File 2:', in_files[1], file=log)                     # File 2
+        print('Base quality: ', config.base_quality, file=log)      # Single base quality
+    else:
+        print('Base quality:', config.base_quality, file=log)
+    if config.steps != '':                                          # Trimming steps
+        print('Trimming steps:', cp.steps_to_string(trimmer.plan.steps), file=log)
+    else:
+        print('Average quality:', config.avg_quality, file=log)     # Average quality
+        if config.leading_quality != 0:                             # Lead trim
+            print('Lead trim: bases below quality', config.leading_quality, file=log)
+        else:
+            print('Lead trim:', config.leading, file=log)
+        if config.trailing_quality != 0:                            # Trail trim
+            print('Trail trim: bases below quality', config.trailing_quality, file=log)
+        else:
+            print('Trail trim:', config.trailing, file=log)
+        print('Window size:', config.window_size, file=log)         # Window size
+        print('Maximum unknown bases:', config.max_n, file=log)     # Maximum number of Ns
+        print('Min lenght:', config.min_len, file=log)              # Minimum lenght after trim
+    if config.trim_n != '':                                         # Unknown base trimming
+        print('Unknown base trimming:', config.trim_n, file=log)
+    if config.poly_x != '':                                         # Poly-X tails
+        print('Poly-X tails: {} (at least {} bases, {} mismatches per 10 bases)'.format(
+            config.poly_x, config.poly_x_min_len, config.poly_x_mismatches), file=log)
+    if config.dedup:                                                # Duplicate filter
+        print('Duplicate filter memory cap (MB):', config.dedup_memory, file=log)
+        print('Duplicate filter false-positive rate:', config.dedup_fpr, file=log)
+    if config.cache_size > 0:                                       # Trim cache
+        print('Trim cache size:', config.cache_size, file=log)
+    if config.quality_bins is not None:                             # Quality binning
+        print('Quality bins:', ', '.join('{}-{} -> {}'.format(*b) for b in config.quality_bins), file=log)
+    if (USER_PHRED != '') and (config.phred != USER_PHRED):         # Phred encoding type
+        print("Phred encoding was set to {}, but {} was used.".format(USER_PHRED, config.phred), file=log)
     else:
-        print('Phred: ' + phred, file=log)            
+        print('Phred: ' + config.phred, file=log)
 
     # Print stats
+    if paired:
+        print('\n===============\nSTATS\n===============', file=log)
     if read_count == dropped_reads:
         print('All of your reads were removed due to low quality/short length. Try different settings.', file=log)
     else:
-        print('\n===============\nSTATS\n===============', file=log)
+        if not paired:
+            print('\n===============\nSTATS\n===============', file=log)
         print('*** Before trimming ***', file=log)
-        print('Total number of reads:', read_count, file=log)
-        print('Average length of reads:', round(read_len_sum/read_count,2), file=log)
-        print('Average quality of reads:', round(read_qual_sum/read_count,2), file=log)
+        if paired:
+            print('Total number of read pairs', read_count, file=log)
+            print('Average length of kept reads:', round(stats.read_len_sum/(read_count*2),2), file=log)
+            print('Average quality of kept reads:', round(stats.read_qual_sum/(read_count*2),2), file=log)
+        else:
+            print('Total number of reads:', read_count, file=log)
+            print('Average length of reads:', round(stats.read_len_sum/read_count,2), file=log)
+            print('Average quality of reads:', round(stats.read_qual_sum/read_count,2), file=log)
         print('\n*** After trimming ***', file=log)
-        print('Read pairs removed due to low quality/short length:', dropped_reads, file=log)
+        if paired:
+            print('Read pairs dropped due to low quality/short length:', dropped_reads, file=log)
+        else:
+            print('Read pairs removed due to low quality/short length:', dropped_reads, file=log)
         print('Read pairs kept:', read_count-dropped_reads, file=log)
+        if config.dedup:
+            label = 'Duplicate reads removed:'
+            if paired:
+                label = 'Duplicate read pairs (or unpaired reads) removed:' if config.keep_unpaired else 'Duplicate read pairs removed:'
+            print(label, stats.duplicate_reads,
+                  '(using a {})'.format(trimmer.dup_filter.mode), file=log)
+            if trimmer.dup_filter.bits is not None:
+                print('Duplicate filter capacity (distinct reads):', trimmer.dup_filter.capacity(), file=log)
+                print('Duplicate filter estimated false-positive rate:', round(trimmer.dup_filter.estimated_fpr(), 6), file=log)
+                warning = trimmer.dup_filter.fpr_warning()
+                if warning is not None:
+                    print(warning, file=log)
+                    print(warning)
+        if paired and config.keep_unpaired:
+            print('Forward reads kept without their mate:', stats.unpaired_fw_reads, file=log)
+            print('Reverse reads kept without their mate:', stats.unpaired_rev_reads, file=log)
         print('Reads trimmed:', trimmed_reads, file=log)
-        print('Average length of kept reads:', round(trimmed_read_len_sum/(read_count-dropped_reads),2), file=log)
-        print('Average quality of kept reads:', round(trimmed_read_qual_sum/(read_count-dropped_reads),2), file=log)
+        kept_count = (read_count-dropped_reads) * reads_per_count
+        print('Average length of kept reads:', round(stats.trimmed_read_len_sum/kept_count,2), file=log)
+        print('Average quality of kept reads:', round(stats.trimmed_read_qual_sum/kept_count,2), file=log)
+
+    # Print trim cache statistics
+    if config.cache_size > 0:
+        hits, misses = trimmer.cache_counts()
+        lookups = hits + misses
+        print('\n*** Trim cache ***', file=log)
+        print('Cache hits:', hits, file=log)
+        print('Cache misses:', misses, file=log)
+        print('Cache hit rate:', round(100*hits/lookups, 2) if lookups else 0, '%', file=log)
+
+    # Print rejected reads output
+    if rejects is not None:
+        print('\n*** Rejected reads ***', file=log)
+        if isinstance(rejects, crej.RejectSampler):
+            print('Sample size per reason:', rejects.size, file=log)
+        for reason, count in rejects.counts.items():
+            if count:
+                print('{}: {} dropped, {} written'.format(reason, count, min(count, getattr(rejects, 'size', count))), file=log)
+
+    # Print memory use
+    if budget is not None:
+        print('\n*** Memory ***', file=log)
+        print('Memory budget (MB):', budget.max_memory, file=log)
+        for change in budget.changes:
+            print(change, file=log)
+        print('Peak memory (MB):', round(budget.peak_mb(), 1), file=log)
+        print('Throttling events:', budget.throttle_events, file=log)
+        print('Final batch size (reads):', budget.batch_size, file=log)
 
-    log.close()    
+    log.close()
 
-    ## --------------------------- ##
 
-    ## -------- STDOUT --------- ##
-    # If trimming was successful
-    print('Congratulations! Your trimming was successful. \nYou can find your results in the', 
-        base_fw + '_trimmed.fastq file and some additional info in the the', 
-        base_fw + '.log file. \nPleasure working with you!')
-    ## ------------------------- ##
+METRICS_EVERY = 10000                         # Reads between two checks of the metrics timer
 
 
+def main():
+    """
+    This function runs magicClipper from the command line. It is only called when
+    this file is run as a script, so that worker processes started with spawn or
+    forkserver (which import it again) don't run it too.
+    """
+    ##############
+    # User input #
+    ##############
 
-####################
-# Paired end reads #
-####################
-else:
-    ## -------- Trimmer ---------- ##
-    try:
-        # Check whether both files have the same encoding
-        if cf.phred_autodetect(in_fwFile, USER_PHRED) != cf.phred_autodetect(in_revFile, USER_PHRED):
-            print("The two given files do not have the same phred encoding type. Please check your files.")
+    ## Get filename(s) and filename base(s) from command line (and make sure extension is correct)
+    args = cf.run_arg_parser()
+
+    in_fwFile = args.FILE1
+    in_revFile = args.FILE2
+    base_fw = cf.file_name_base(in_fwFile)
+    base_rev = cf.file_name_base(in_revFile)
+
+    if (not args.MANYFILES) and not in_fwFile.endswith(cf.FASTQ_EXTENSIONS):
+        print('ERROR: your input file(s) must have .fastq, .fastq.gz, .fastq.bz2 or .fastq.xz extension')
+        sys.exit(1)
+
+    if in_revFile != '':
+        if not in_revFile.endswith(cf.FASTQ_EXTENSIONS):
+            print('ERROR: your input file(s) must have .fastq, .fastq.gz, .fastq.bz2 or .fastq.xz extension')
             sys.exit(1)
 
-        # Determine Phred encoding type
-        phred = cf.phred_autodetect(in_fwFile, USER_PHRED)
-
-        # Open files, checking if file is compressed or not 
-        if in_fwFile.endswith('.gz'):
-            file_fw = gzip.open(in_fwFile, 'rt')
-        else:    
-            file_fw = open(in_fwFile, 'r')
-
-        if in_revFile.endswith('.gz'):
-            file_rev = gzip.open(in_revFile, 'rt')
-        else:    
-            file_rev = open(in_revFile, 'r')
-    except IOError as err:
-        print('File could not be opened. Reason: ' + str(err))
+
+    ## Get arguments from command line (and make sure they are acceptable)
+    USER_PHRED = args.PHRED                       # User given phred type
+    if USER_PHRED not in ['', '33', '64']:
+        print('Invalid input for phred type: {} \nAccepted input: \'33\', \'64\''.format(USER_PHRED))
         sys.exit(1)
 
-    # Control if output file already exists in working directory, and open
-    out_fw = cf.controling_output_file(in_fwFile)
-    out_rev = cf.controling_output_file(in_revFile)
-
-    print('You have initialized the paired end mode of magicClipper.\nThis might take a while... So please be patient!')        
-
-    # Read first line of each file and initialize variables
-    line_fw = file_fw.readline()
-    line_rev = file_rev.readline() 
-
-    line_count, fastq_fw, fastq_rev = 0, [], []
-
-    # Variables for stats
-    dropped_reads = 0
-    trimmed_reads = 0
-    if (LEADING != 0) or (TRAILING != 0):
-        trimmed_reads = 'all'    
-    read_count = 0
-    read_len_sum = 0
-    read_qual_sum = 0
-    trimmed_read_len_sum = 0
-    trimmed_read_qual_sum = 0
-
-    # Iterate through lines
-    while (line_fw or line_rev) != '':
-        line_count += 1
-        
-        # For each file, and each read, make a 4 element list with each line as an element
-        fastq_fw.append(line_fw.strip())
-        fastq_rev.append(line_rev.strip())
-
-        if line_count == 4:            
-            # Keep track of number of reads in files
-            read_count +=1
-            
-            # Print to STDOUT when progress is being made
-            if read_count % 100000 == 0:
-                print('---', read_count, 'read pairs processed ---')
-
-            ## -- FORWARD READS -- ##
-
-            # Read sequence and quality (encoded and decoded)
-            read_fw = fastq_fw[1]
-            qual_str_fw = fastq_fw[3]
-            qual_score_fw = cf.quality_score(qual_str_fw, phred)
-
-
-            ## STEP 0: Drop read if quality can't be determined
-            if qual_score_fw == 'unknown':
-                # Keep track of dropped read
-                dropped_reads += 1
-                # Reset
-                line_count, fastq_fw, fastq_rev = 0, [], []
-                # Read new lines
-                line_fw = file_fw.readline()
-                line_rev = file_rev.readline() 
-                # Continue to next read without printing
-                continue
-
-
-            ## Stats for unprocessed reads ##
-            # Average length of all kept reads
-            read_len_sum += len(read_fw)
-            # Average quality of all kept reads
-            avg_qual = sum(qual_score_fw)/len(qual_score_fw)
-            read_qual_sum += avg_qual      
-
-
-            ## STEP 1: Remove leading and trailing bases, given user input
-            read_fw, qual_str_fw, qual_score_fw = cf.global_trim(read_fw, qual_str_fw, qual_score_fw, LEADING, TRAILING)
-
-
-            ## STEP 2: Remove leading and trailing bases, based on quality 
-            read_fw, qual_str_fw, qual_score_fw, trimmed = cf.quality_trim(read_fw, qual_str_fw, qual_score_fw, WIN_SIZE, AVG_QUALITY, BASE_QUALITY)
-            if (trimmed == True) and (trimmed_reads != 'all'):
-                trimmed_reads += 1
-            ## ------------------- ##
-            
-
-            ## -- REVERSE READS -- ##
-            # Read sequence and quality (encoded and decoded)
-            read_rev = fastq_rev[1]
-            qual_str_rev = fastq_rev[3]
-            qual_score_rev = cf.quality_score(qual_str_rev, phred)
-
-
-            ## Stats for original reads ##
-            # Average length of all kept reads
-            read_len_sum += len(read_rev)
-            # Average quality of all kept reads
-            avg_qual = sum(qual_score_rev)/len(qual_score_rev)
-            read_qual_sum += avg_qual            
-            
-
-            ## STEP 0: Drop read if quality can't be determined
-            if qual_score_rev == 'unknown':
-                # Keep track of dropped read
-                dropped_reads += 1
-                # Reset
-                line_count, fastq_fw, fastq_rev = 0, [], []
-                # Read new lines
-                line_fw = file_fw.readline()
-                line_rev = file_rev.readline()
-                # Continue to next read without printing                
-                continue
-
-
-            ## STEP 1: Remove leading and trailing bases, given user input      
-            read_rev, qual_str_rev, qual_score_rev = cf.global_trim(read_rev, qual_str_rev, qual_score_rev, LEADING, TRAILING)
-
-
-            ## STEP 2: Remove leading and trailing bases, based on quality
-            read_rev, qual_str_rev, qual_score_rev, trimmed = cf.quality_trim(read_rev, qual_str_rev, qual_score_rev, WIN_SIZE, AVG_QUALITY, BASE_QUALITY)
-            if (trimmed == True) and (trimmed_reads != 'all'):
-                trimmed_reads += 1
-            ## ------------------- ##
-
-
-            ## -- FORWARD AND REVERSE, SIMULTANEOUSLY -- ##
-            ## STEP 3: Drop reads that become too short after trimming
-            if (len(read_fw) < MIN_LEN) or (len(read_rev) < MIN_LEN):  
-                # Keep track of dropped read
-                dropped_reads += 1           
-                # Reset
-                line_count, fastq_fw, fastq_rev = 0, [], []
-                # Read new lines
-                line_fw = file_fw.readline()
-                line_rev = file_rev.readline() 
-                # Continue to next read without printing
-                continue
-
-
-            ## STEP 4: Drop reads with low average quality
-            # Average quality in the reads
-            avg_qual_fw = sum(qual_score_fw)/len(qual_score_fw)
-            avg_qual_rev = sum(qual_score_rev)/len(qual_score_rev)
-            # Drop trimmed reads with low average quality
-            if (avg_qual_fw < AVG_QUALITY) or (avg_qual_rev < AVG_QUALITY):
-                # Keep track of dropped read
-                dropped_reads += 1                    
-                # Reset
-                line_count, fastq_fw, fastq_rev = 0, [], []
-                # Read new lines
-                line_fw = file_fw.readline()
-                line_rev = file_rev.readline()    
-                # Continue to next read without printing
-                continue
-
-
-            ## STEP 5: Drop reads with too many N bases
-            if (read_fw.count('N') > N_MAX) or (read_rev.count('N') > N_MAX):
-                # Keep track of dropped read
-                dropped_reads += 1                               
-                # Reset
-                line_count, fastq_fw, fastq_rev = 0, [], []
-                # Read new lines
-                line_fw = file_fw.readline()
-                line_rev = file_rev.readline()    
-                # Continue to next read without printing
-                continue 
-
-            ## STEP 6: Print trimmed reads onto outfiles
-            cf.print_read(fastq_fw[0], read_fw, qual_str_fw, out_fw)
-            cf.print_read(fastq_rev[0], read_rev, qual_str_rev, out_rev)
-            
-
-            ## Stats for trimmed reads
-            # Average length of all kept reads
-            trimmed_read_len_sum += len(read_fw) + len(read_rev)
-            # Average quality of all kept reads
-            trimmed_read_qual_sum += avg_qual_fw + avg_qual_rev
-            
-            ## ------------------- ##
-
-            # Reset
-            line_count, fastq_fw, fastq_rev = 0, [], []
-
-        # Read next lines
-        line_fw = file_fw.readline()
-        line_rev = file_rev.readline()
-        
-        # Raise error if both files don't have the same length (something wrong with input files)
-        if (len(line_fw) == 0 and len(line_rev) != 0) or (len(line_fw) != 0 and len(line_rev) == 0):
-            print("Input files do not contain equal number of reads. Output cannot be trusted. Check your files.")
+    try:
+        config = ct.TrimConfig.from_args(args)    # All other settings (see clipperTrimmer.py)
+        METRICS_INTERVAL = float(args.METRICSINTERVAL)
+        MAX_MEMORY = float(args.MAXMEMORY)        # Memory budget in MB (0 for no budget)
+        if MAX_MEMORY < 0:
+            raise ValueError('Must be posive integer: {}'.format(args.MAXMEMORY))
+        PROCESSES = int(args.PROCESSES)           # Number of worker processes
+        if PROCESSES < 1:
+            raise ValueError('Must be posive integer: {}'.format(args.PROCESSES))
+        if (PROCESSES > 1) and config.dedup:
+            raise ValueError('the duplicate filter cannot be used with more than one process')
+        REJECTED_SAMPLE = int(args.REJECTEDSAMPLE)    # Rejected reads kept per reason (0 for all)
+        if REJECTED_SAMPLE < 0:
+            raise ValueError('Must be posive integer: {}'.format(args.REJECTEDSAMPLE))
+        if (PROCESSES > 1) and args.REJECTED:
+            raise ValueError('the rejected reads output cannot be used with more than one process')
+        # Output compression (None: same as the input)
+        OUTPUT_COMPRESSION = {'same': None, 'none': ''}.get(args.OUTPUTCOMPRESSION, args.OUTPUTCOMPRESSION)
+        if OUTPUT_COMPRESSION not in [None, '', 'gz', 'bz2', 'xz']:
+            raise ValueError('unknown output compression: {} \nAccepted input: gz, bz2, xz, none, same'.format(args.OUTPUTCOMPRESSION))
+        PREVIEW = int(args.PREVIEW)               # Reads to trim in preview mode (0 for a full run)
+        if PREVIEW < 0:
+            raise ValueError('Must be posive integer: {}'.format(args.PREVIEW))
+        FRACTION = float(args.FRACTION)           # Share of the reads to trim in preview mode
+        if not 0 <= FRACTION <= 1:
+            raise ValueError('Must be between 0 and 1: {}'.format(args.FRACTION))
+        SEED = int(args.SEED)
+        SWEEP = None                              # Grid of settings to sweep (None for a normal run)
+        if args.SWEEP != '':
+            SWEEP = csweep.parse_sweep(args.SWEEP, config)
+        CONCURRENT_FILES = int(args.CONCURRENTFILES)  # Files trimmed at the same time in many files mode
+        if CONCURRENT_FILES < 1:
+            raise ValueError('Must be posive integer: {}'.format(args.CONCURRENTFILES))
+        if args.MANYFILES:
+            if in_revFile != '':
+                raise ValueError('only one directory or file list can be given in many files mode')
+            if config.dedup or args.REJECTED or (PROCESSES > 1) or (PREVIEW > 0) or (FRACTION > 0) or (SWEEP is not None):
+                raise ValueError('DEDUP, REJECTED, PROCESSES, PREVIEW, FRACTION and SWEEP cannot be used in many files mode')
+        if args.MANYFILES or (PREVIEW > 0) or (FRACTION > 0) or (SWEEP is not None):
+            if (MAX_MEMORY > 0) or (args.METRICS != ''):
+                raise ValueError('MAXMEMORY and METRICS cannot be used in the many files, preview and sweep modes')
+
+        # Fit the memory hungry settings in the memory budget (if user says so)
+        budget = None
+        if MAX_MEMORY > 0:
+            budget = cmem.MemoryBudget(MAX_MEMORY)
+            budget.check_start(PROCESSES)
+            budget.fit(config)
+    except ValueError as err:
+        print('Invalid input. Reason: ' + str(err))
+        sys.exit(1)
+
+
+    ###################
+    # Many files mode #
+    ###################
+    if args.MANYFILES:
+        try:
+            jobs = [casync.FileJob(in_files, OUTPUT_COMPRESSION, config.keep_unpaired)
+                    for in_files in casync.find_input_files(in_fwFile)]
+        except (IOError, ValueError) as err:
+            print('File could not be opened. Reason: ' + str(err))
+            sys.exit(1)
+        try:
+            casync.check_output_files(jobs)
+        except ValueError as err:
+            print('Invalid input. Reason: ' + str(err))
             sys.exit(1)
 
-       
-    # Close
-    file_fw.close()
-    file_rev.close()
-    out_fw.close()
-    out_rev.close()
+        # Control if output files already exist, and ask only once for all of them
+        existing = [out_file for job in jobs for out_file in job.out_files if os.path.exists(out_file)]
+        answer = 'y' if not existing else None
+        while answer not in ['y','n']:
+            answer = input("{} output files (e.g. {}) will be overwritten. Do you want to continue? y/n: ".format(len(existing), existing[0]))
+            if answer not in ['y','n']:
+                print('Invalid input')
+        if answer == 'n':
+            print('Exiting program')
+            sys.exit(1)
 
-    ## ----------------------------- ##
+        print('You have initialized the many files mode of magicClipper ({} files or file pairs).'.format(len(jobs)))
 
-    ## ---------- LOG FILE --------- ##
-    log = open(base_fw + '.log', 'w')
+        # Trim all files concurrently, in one process (see clipperAsync.py)
+        casync.ManyFilesRunner(config, USER_PHRED, CONCURRENT_FILES).run(jobs)
 
-    print('This is the log file for the trimming of', in_fwFile, 'and', in_revFile, file=log)
-    
-    # Print settings
-    print('\n===============\nSETTINGS\n===============', file=log)
-    print('File 1:', in_fwFile, file=log)               # File 1
-    print('File 2:', in_revFile, file=log)              # File 2
-    print('Base quality: ', BASE_QUALITY, file=log)     # Single base quality
-    print('Average quality:', AVG_QUALITY, file=log)    # Average quality
-    print('Lead trim:', LEADING, file=log)              # Lead trim
-    print('Trail trim:', TRAILING, file=log)            # Trail trim
-    print('Window size:', WIN_SIZE, file=log)           # Window size
-    print('Maximum unknown bases:', N_MAX, file=log)    # Maximum number of Ns
-    print('Min lenght:', MIN_LEN, file=log)             # Min lenght after trim
-    if (USER_PHRED != '') and (phred != USER_PHRED):    # Phred encoding type
-        print("Phred encoding was set to {}, but {} was used.".format(USER_PHRED, phred), file=log)
-    else:
-        print('Phred: ' + phred, file=log)            
+        log_file = os.path.splitext(in_fwFile.rstrip('/'))[0] + '.log'
+        log = open(log_file, 'w')
+        print('\n===============\nMANY FILES\n===============', file=log)
+        print('\n'.join(casync.summary_lines(jobs)), file=log)
+        log.close()
+
+        failed = [job for job in jobs if job.error is not None]
+        if failed:
+            print('{} file(s) could not be trimmed, see the {} file.'.format(len(failed), log_file))
+            sys.exit(1)
+        print('Congratulations! Your trimming was successful. \nYou can find a summary of all files in the',
+            log_file, 'file. \nPleasure working with you!')
+        sys.exit(0)
+
+
+    ##########################
+    # Preview and sweep mode #
+    ##########################
+    if (PREVIEW > 0) or (FRACTION > 0) or (SWEEP is not None):
+        in_files = [in_fwFile] if in_revFile == '' else [in_fwFile, in_revFile]
+        try:
+            # Determine Phred encoding type, and check whether all files have the same encoding
+            config.phred = cf.phred_autodetect(in_fwFile, USER_PHRED)
+            if (in_revFile != '') and (config.phred != cf.phred_autodetect(in_revFile, USER_PHRED)):
+                print("The two given files do not have the same phred encoding type. Please check your files.")
+                sys.exit(1)
+            in_streams = [cf.open_input_file(in_file) for in_file in in_files]
+        except IOError as err:
+            print('File could not be opened. Reason: ' + str(err))
+            sys.exit(1)
 
-    # Print statistics
-    print('\n===============\nSTATS\n===============', file=log)
+        try:
+            if SWEEP is not None:
+                # Trim (a sample of) the reads once for every combination of settings (see clipperSweep.py)
+                sweep = csweep.Sweep(config, *SWEEP)
+                for records in cprev.Sampler(in_streams, PREVIEW, FRACTION or 1.0, SEED):
+                    if in_revFile != '':
+                        sweep.add(*records)
+                    else:
+                        sweep.add(records)
+                report = ['\n===============\nSWEEP\n==============='] + sweep.table(len(in_files))
+            else:
+                # Trim a sample of the reads only, and project the stats onto the full run (see clipperPreview.py)
+                report = cprev.preview(in_files, in_streams, ct.Trimmer(config), PREVIEW, FRACTION or 1.0, SEED)
+        except ValueError as err:
+            print('Invalid input. Reason: ' + str(err))
+            sys.exit(1)
+        for stream in in_streams:
+            stream.close()
 
-    if read_count == dropped_reads:
-        print('All of your reads were removed due to low quality/short length. Try different settings.', file=log)
+        print('\n'.join(report))
+        sys.exit(0)
+
+
+
+    ###################
+    # Singe end reads #
+    ###################
+    if in_revFile == '':
+        ## -------- Trimmer ---------- ##
+        try:
+            # Determine Phred encoding type
+            config.phred = cf.phred_autodetect(in_fwFile, USER_PHRED)
+
+            # Open file, checking if file is compressed or not
+            file_fw = cf.open_input_file(in_fwFile)
+        except IOError as err:
+            print('File could not be opened. Reason: ' + str(err))
+            sys.exit(1)
+
+        # Control if output file already exists in working directory, and open
+        out_fw = cf.controling_output_file(in_fwFile, compression=OUTPUT_COMPRESSION)
+
+        print('You have initialized the single end mode of magicClipper.\nThis might take a while... So please be patient!')
+
+        trimmer = ct.Trimmer(config)
+        stats = trimmer.stats
+        if budget is not None:
+            budget.release.append(trimmer.clear_cache)
+
+        # Dropped reads, tagged with the reason (if user says so, see clipperRejects.py)
+        rejects = None
+        if args.REJECTED:
+            rejected_streams = [cf.controling_output_file(in_fwFile, '_rejected', OUTPUT_COMPRESSION)]
+            if REJECTED_SAMPLE > 0:
+                rejects = crej.RejectSampler(rejected_streams, REJECTED_SAMPLE, SEED)
+            else:
+                rejects = crej.RejectWriter(rejected_streams)
+            trimmer.on_reject = rejects
+
+        metrics = None
+        if args.METRICS != '':
+            metrics = cm.MetricsWriter(args.METRICS, [in_fwFile], METRICS_INTERVAL)
+
+        parallel = (PROCESSES > 1) and cpar.splittable(in_fwFile, PROCESSES)
+        if parallel:
+            # Split the file (plain, or gzip with an index) between worker processes (see clipperParallel.py)
+            cpar.trim_parallel(in_fwFile, out_fw, trimmer, PROCESSES, budget, metrics)
+        elif PROCESSES > 1:
+            # Other files: read them here, and hand the reads to worker processes through shared memory (see clipperShared.py)
+            try:
+                cshared.trim_shared([file_fw], [out_fw], trimmer, PROCESSES, metrics, budget)
+            except ValueError as err:
+                print('Invalid input. Reason: ' + str(err))
+                sys.exit(1)
+        else:
+            # Iterate through reads, and print the trimmed ones onto outfile
+            # Every read is read into the same buffer (unless dropped reads are sampled)
+            # With a memory budget, the memory is checked between batches of reads
+            records = ct.read_fastq(file_fw, reuse=REJECTED_SAMPLE == 0)
+            for record in (budget.watch(records) if budget is not None else records):
+                trimmed = trimmer.trim(record)
+
+                # Print to STDOUT when progress is being made
+                if stats.read_count % 100000 == 0:
+                    print('---', stats.read_count, 'reads processed ---')
+                if (metrics is not None) and (stats.read_count % METRICS_EVERY == 0):
+                    metrics.update(stats, [file_fw], [out_fw])
+
+                if trimmed is not None:
+                    ct.write_fastq(trimmed, out_fw)
+
+        if metrics is not None:
+            out_fw.flush()
+            # The workers of a parallel run read the input file themselves
+            bytes_in = metrics.total_bytes if parallel else None
+            metrics.update(stats, [file_fw], [out_fw], finished=True, bytes_in=bytes_in)
+
+        # Close files
+        file_fw.close()
+        out_fw.close()
+        if rejects is not None:
+            rejects.close()
+            for stream in rejects.out_streams:
+                stream.close()
+
+        ## --------------------------- ##
+
+        ## ------- Log file ---------- ##
+        write_log(base_fw + '.log', [in_fwFile], config, USER_PHRED, trimmer, budget, rejects)
+        ## --------------------------- ##
+
+        ## -------- STDOUT --------- ##
+        # If trimming was successful
+        print('Congratulations! Your trimming was successful. \nYou can find your results in the',
+            base_fw + '_trimmed.fastq file and some additional info in the the',
+            base_fw + '.log file. \nPleasure working with you!')
+        ## ------------------------- ##
+
+
+
+    ####################
+    # Paired end reads #
+    ####################
     else:
-        print('*** Before trimming ***', file=log)
-        print('Total number of read pairs', read_count, file=log)
-        print('Average length of kept reads:', round(read_len_sum/(read_count*2),2), file=log)
-        print('Average quality of kept reads:', round(read_qual_sum/(read_count*2),2), file=log)
-        print('\n*** After trimming ***', file=log)
-        print('Read pairs dropped due to low quality/short length:', dropped_reads, file=log)
-        print('Read pairs kept:', read_count-dropped_reads, file=log)
-        print('Reads trimmed:', trimmed_reads, file=log)
-        print('Average length of kept reads:', round(trimmed_read_len_sum/((read_count-dropped_reads)*2),2), file=log)
-        print('Average quality of kept reads:', round(trimmed_read_qual_sum/((read_count-dropped_reads)*2),2), file=log)
+        ## -------- Trimmer ---------- ##
+        try:
+            # Determine Phred encoding type, and check whether both files have the same encoding
+            config.phred = cf.phred_autodetect(in_fwFile, USER_PHRED)
+            if config.phred != cf.phred_autodetect(in_revFile, USER_PHRED):
+                print("The two given files do not have the same phred encoding type. Please check your files.")
+                sys.exit(1)
+
+            # Open files, checking if file is compressed or not
+            file_fw = cf.open_input_file(in_fwFile)
+            file_rev = cf.open_input_file(in_revFile)
+        except IOError as err:
+            print('File could not be opened. Reason: ' + str(err))
+            sys.exit(1)
 
-    log.close()
+        # Control if output file already exists in working directory, and open
+        out_fw = cf.controling_output_file(in_fwFile, compression=OUTPUT_COMPRESSION)
+        out_rev = cf.controling_output_file(in_revFile, compression=OUTPUT_COMPRESSION)
+        if config.keep_unpaired:
+            out_fw_unpaired = cf.controling_output_file(in_fwFile, '_unpaired', OUTPUT_COMPRESSION)
+            out_rev_unpaired = cf.controling_output_file(in_revFile, '_unpaired', OUTPUT_COMPRESSION)
+
+        print('You have initialized the paired end mode of magicClipper.\nThis might take a while... So please be patient!')
+
+        trimmer = ct.Trimmer(config)
+        stats = trimmer.stats
+        if budget is not None:
+            budget.release.append(trimmer.clear_cache)
+
+        # Dropped read pairs, tagged with the reason (if user says so, see clipperRejects.py)
+        rejects = None
+        if args.REJECTED:
+            rejected_streams = [cf.controling_output_file(in_fwFile, '_rejected', OUTPUT_COMPRESSION),
+                                cf.controling_output_file(in_revFile, '_rejected', OUTPUT_COMPRESSION)]
+            if REJECTED_SAMPLE > 0:
+                rejects = crej.RejectSampler(rejected_streams, REJECTED_SAMPLE, SEED)
+            else:
+                rejects = crej.RejectWriter(rejected_streams)
+            trimmer.on_reject = rejects
+
+        in_streams, out_streams = [file_fw, file_rev], [out_fw, out_rev]
+        if config.keep_unpaired:
+            out_streams += [out_fw_unpaired, out_rev_unpaired]
+        metrics = None
+        if args.METRICS != '':
+            metrics = cm.MetricsWriter(args.METRICS, [in_fwFile, in_revFile], METRICS_INTERVAL)
+
+        try:
+            if PROCESSES > 1:
+                # Hand the read pairs to worker processes through shared memory (see clipperShared.py),
+                # which reads the files and keeps to the memory budget itself
+                cshared.trim_shared(in_streams, out_streams, trimmer, PROCESSES, metrics, budget)
+            else:
+                # Iterate through read pairs, and print the trimmed ones onto outfiles
+                # With a memory budget, the memory is checked between batches of read pairs
+                records = ct.read_fastq_pairs(file_fw, file_rev, reuse=REJECTED_SAMPLE == 0)
+                if budget is not None:
+                    records = budget.watch(records)
+                if config.keep_unpaired:
+                    # Pairs where only one mate survives go to the unpaired outputs, in the same pass
+                    for record_fw, record_rev in records:
+                        trimmed_fw, trimmed_rev = trimmer.trim_pair_unpaired(record_fw, record_rev)
+
+                        # Print to STDOUT when progress is being made
+                        if stats.read_count % 100000 == 0:
+                            print('---', stats.read_count, 'read pairs processed ---')
+                        if (metrics is not None) and (stats.read_count % METRICS_EVERY == 0):
+                            metrics.update(stats, in_streams, out_streams)
+
+                        if (trimmed_fw is not None) and (trimmed_rev is not None):
+                            ct.write_fastq(trimmed_fw, out_fw)
+                            ct.write_fastq(trimmed_rev, out_rev)
+                        elif trimmed_fw is not None:
+                            ct.write_fastq(trimmed_fw, out_fw_unpaired)
+                        elif trimmed_rev is not None:
+                            ct.write_fastq(trimmed_rev, out_rev_unpaired)
+                else:
+                    for record_fw, record_rev in records:
+                        trimmed = trimmer.trim_pair(record_fw, record_rev)
+
+                        # Print to STDOUT when progress is being made
+                        if stats.read_count % 100000 == 0:
+                            print('---', stats.read_count, 'read pairs processed ---')
+                        if (metrics is not None) and (stats.read_count % METRICS_EVERY == 0):
+                            metrics.update(stats, in_streams, out_streams)
+
+                        if trimmed is not None:
+                            ct.write_fastq(trimmed[0], out_fw)
+                            ct.write_fastq(trimmed[1], out_rev)
 
-    ## ------------------------- ##
+        # Raise error if both files don't have the same length (something wrong with input files)
+        except ct.UnequalReadCountError:
+            print("Input files do not contain equal number of reads. Output cannot be trusted. Check your files.")
+            sys.exit(1)
+        except ValueError as err:
+            print('Invalid input. Reason: ' + str(err))
+            sys.exit(1)
 
-    ## -------- STDOUT --------- ##
-    # If trimming was successful
-    print('Congratulations! Your trimming was successful. \nYou can find your results in the', 
-        base_fw + '_trimmed.fastq and', 
-        base_rev + '_trimmed.fastq files and some additional info in the the',
-        base_fw + '.log file. \nPleasure working with you!')
-    ## ------------------------- ## 
\ No newline at end of file
+        if metrics is not None:
+            for stream in out_streams:
+                stream.flush()
+            metrics.update(stats, in_streams, out_streams, finished=True)
+
+        # Close
+        file_fw.close()
+        file_rev.close()
+        out_fw.close()
+        out_rev.close()
+        if config.keep_unpaired:
+            out_fw_unpaired.close()
+            out_rev_unpaired.close()
+        if rejects is not None:
+            rejects.close()
+            for stream in rejects.out_streams:
+                stream.close()
+
+        ## ----------------------------- ##
+
+        ## ---------- LOG FILE --------- ##
+        write_log(base_fw + '.log', [in_fwFile, in_revFile], config, USER_PHRED, trimmer, budget, rejects)
+        ## ----------------------------- ##
+
+        ## -------- STDOUT --------- ##
+        # If trimming was successful
+        print('Congratulations! Your trimming was successful. \nYou can find your results in the',
+            base_fw + '_trimmed.fastq and',
+            base_rev + '_trimmed.fastq files and some additional info in the the',
+            base_fw + '.log file. \nPleasure working with you!')
+        if config.keep_unpaired:
+            print('Reads whose mate was dropped are in the', base_fw + '_unpaired.fastq and',
+                base_rev + '_unpaired.fastq files.')
+        ## ------------------------- ##
+
+
+if __name__ == '__main__':
+    main()
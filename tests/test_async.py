@@ -0,0 +1,152 @@
+''' -----------------------------------------
+    Tests of the many files mode of the magicClipper NGS read trimmer (clipperAsync.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import asyncio
+import gzip
+import io
+import lzma
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import clipperAsync as casync
+import clipperFunctions as cf
+import clipperTrimmer as ct
+
+
+class TestFindInputFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.path = self.work_dir.name
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def touch(self, *names):
+        for name in names:
+            open(os.path.join(self.path, name), 'w').close()
+
+    def test_pairing(self):
+        self.touch('a_1.fastq', 'a_2.fastq', 'b_R1.fastq.gz', 'b_R2.fastq.gz', 'c_1.fastq', 'd.fastq',
+                   'a_1_trimmed.fastq', 'notes.txt')
+        jobs = [tuple(os.path.basename(name) for name in job) for job in casync.find_input_files(self.path)]
+        self.assertEqual(jobs, [('a_1.fastq', 'a_2.fastq'), ('b_R1.fastq.gz', 'b_R2.fastq.gz'), ('c_1.fastq',), ('d.fastq',)])
+
+    def test_reverse_only(self):
+        self.touch('e_2.fastq')
+        self.assertEqual(casync.find_input_files(self.path), [(os.path.join(self.path, 'e_2.fastq'),)])
+
+    def test_list_file(self):
+        list_file = os.path.join(self.path, 'files.txt')
+        with open(list_file, 'w') as outfile:
+            outfile.write('x_1.fastq\n\nx_2.fastq\ny.fastq\n')
+        self.assertEqual(casync.find_input_files(list_file), [('x_1.fastq', 'x_2.fastq'), ('y.fastq',)])
+        with open(list_file, 'w') as outfile:
+            outfile.write('x.txt\n')
+        with self.assertRaises(ValueError):
+            casync.find_input_files(list_file)
+
+    def test_empty_directory(self):
+        self.assertEqual(casync.find_input_files(self.path), [])
+
+
+class TestChunkReader(unittest.TestCase):
+    """
+    Chunks must give the same records as ct.read_fastq, wherever they are cut.
+    """
+
+    def setUp(self):
+        self.chunk_size = casync.CHUNK_SIZE
+
+    def tearDown(self):
+        casync.CHUNK_SIZE = self.chunk_size
+
+    def chunk_records(self, fastq):
+        async def read_all():
+            async def blocking(function, *args):
+                return function(*args)
+            reader = casync.ChunkReader(io.BytesIO(fastq))
+            found = []
+            while not reader.eof:
+                found += await reader.read(blocking)
+            return found
+        return [(record.header, record.seq, record.qual) for record in asyncio.run(read_all())]
+
+    def test_same_as_read_fastq(self):
+        fastq = b'@r1\nACGT\n+\n@@+I\n@r2\n\n+\n\n@r3\nAC\n+\n+@\n@r4\n\n+\n\n'
+        for data in (fastq, fastq.rstrip(b'\n'), fastq + b'@r5\nAC\n+\n', fastq + b'\n', b''):
+            expected = [(record.header, record.seq, record.qual) for record in ct.read_fastq(io.BytesIO(data))]
+            for chunk_size in (1, 2, 3, 5, 7, 1000):
+                casync.CHUNK_SIZE = chunk_size
+                self.assertEqual(self.chunk_records(data), expected, (data, chunk_size))
+
+    def test_zero_length_reads_kept(self):
+        self.assertEqual(len(self.chunk_records(b'@r1\n\n+\n\n@r2\n\n+\n\n')), 2)
+
+
+class TestOutputFiles(unittest.TestCase):
+
+    def test_output_file_name(self):
+        self.assertEqual(cf.output_file_name('reads_1.fastq', compression=''), 'reads_1_trimmed.fastq')
+        self.assertEqual(cf.output_file_name(os.path.join('run.v2', 'x.y_1.fastq.gz'), compression='gz'),
+                         os.path.join('run.v2', 'x.y_1_trimmed.fastq.gz'))
+        self.assertEqual(cf.output_file_name(os.path.join('.', 'reads.fastq.bz2'), '_unpaired', ''),
+                         os.path.join('.', 'reads_unpaired.fastq'))
+
+    def test_same_output_file(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            names = [os.path.join(work_dir, name) for name in ('a.fastq', 'a.fastq.gz', 'a_trimmed.fastq')]
+            for name in names:
+                open(name, 'w').close()
+            casync.check_output_files([casync.FileJob((names[0],), ''), casync.FileJob((names[1],), 'gz')])
+            with self.assertRaises(ValueError):
+                casync.check_output_files([casync.FileJob((names[0],), ''), casync.FileJob((names[1],), '')])
+            with self.assertRaises(ValueError):
+                casync.check_output_files([casync.FileJob((names[0],), ''), casync.FileJob((names[2],), '')])
+
+
+class TestManyFilesRunner(unittest.TestCase):
+
+    def test_corrupt_files(self):
+        # Corrupt compressed data fails its own file only, and the other files are trimmed
+        reads = b''.join(b'@r%d\n%s\n+\n%s\n' % (i, b'ACGT' * 10, b'#' + b'I' * 39) for i in range(2000))
+        with tempfile.TemporaryDirectory() as work_dir:
+            names = [os.path.join(work_dir, name) for name in ('good.fastq', 'bad_gz.fastq.gz', 'bad_xz.fastq.xz')]
+            with open(names[0], 'wb') as good:
+                good.write(reads)
+            for name, data in ((names[1], gzip.compress(reads)), (names[2], lzma.compress(reads))):
+                data = bytearray(data)
+                data[20:60] = b'\xff' * 40
+                with open(name, 'wb') as bad:
+                    bad.write(bytes(data))
+            jobs = [casync.FileJob((name,), '') for name in names]
+            casync.ManyFilesRunner(ct.TrimConfig(min_len=10)).run(jobs)
+            self.assertIsNone(jobs[0].error)
+            self.assertEqual(jobs[0].stats.read_count, 2000)
+            self.assertIsNotNone(jobs[1].error)
+            self.assertIsNotNone(jobs[2].error)
+
+
+class TestControlingOutputFile(unittest.TestCase):
+
+    def test_existing_output_elsewhere(self):
+        # The output goes next to the input, so it is looked for there, not in the working directory
+        with tempfile.TemporaryDirectory() as work_dir:
+            in_file = os.path.join(work_dir, 'reads.fastq')
+            open(in_file, 'w').close()
+            open(os.path.join(work_dir, 'reads_trimmed.fastq'), 'w').close()
+            with unittest.mock.patch('builtins.input', return_value='n') as asked:
+                with self.assertRaises(SystemExit):
+                    cf.controling_output_file(in_file, compression='')
+            asked.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
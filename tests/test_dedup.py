@@ -0,0 +1,78 @@
+''' -----------------------------------------
+    Tests of the duplicate filter of the magicClipper NGS read trimmer (clipperDedup.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import unittest
+
+import clipperDedup as dd
+import clipperTrimmer as ct
+
+
+class TestDuplicateFilter(unittest.TestCase):
+
+    def test_sequence_hash(self):
+        self.assertEqual(dd.sequence_hash(b'ACGT'), dd.sequence_hash('ACGT'))
+        self.assertNotEqual(dd.sequence_hash(b'ACGT', b'TT'), dd.sequence_hash(b'ACG', b'TTT'))
+        self.assertNotEqual(dd.sequence_hash(b''), 0)
+
+    def test_hash_set(self):
+        dup_filter = dd.DuplicateFilter(memory_mb=1)
+        values = [dd.sequence_hash(b'read%d' % i) for i in range(1000)]
+        self.assertFalse(any(dup_filter.is_duplicate(value) for value in values))
+        self.assertTrue(all(dup_filter.is_duplicate(value) for value in values))
+        self.assertEqual((dup_filter.mode, dup_filter.distinct, dup_filter.duplicates), ('hash set', 1000, 1000))
+        self.assertIsNone(dup_filter.capacity())
+        self.assertIsNone(dup_filter.fpr_warning())
+
+    def test_switch_to_bloom(self):
+        # 16 kB: a table of 1024 slots at most, then a Bloom filter in the rest of the memory
+        dup_filter = dd.DuplicateFilter(memory_mb=1/64)
+        values = [dd.sequence_hash(b'read%d' % i) for i in range(2000)]
+        for value in values[:700]:
+            dup_filter.is_duplicate(value)
+        self.assertEqual(dup_filter.mode, 'hash set')
+        for value in values[700:]:
+            dup_filter.is_duplicate(value)
+        self.assertEqual(dup_filter.mode, 'Bloom filter')
+        self.assertIsNone(dup_filter.table)
+        self.assertLessEqual(len(dup_filter.bits), 8 * 1024 + 1)
+
+        # No false negatives: reads stored before and after the switch are all found
+        self.assertTrue(all(dup_filter.is_duplicate(value) for value in values))
+        self.assertGreater(dup_filter.capacity(), 2000)
+        self.assertIsNone(dup_filter.fpr_warning())
+
+    def test_over_capacity(self):
+        dup_filter = dd.DuplicateFilter(memory_mb=1/64)
+        for i in range(20000):
+            dup_filter.is_duplicate(dd.sequence_hash(b'read%d' % i))
+        self.assertGreater(dup_filter.estimated_fpr(), dup_filter.fpr)
+        self.assertIn('WARNING', dup_filter.fpr_warning())
+
+
+class TestTrimmerDuplicates(unittest.TestCase):
+
+    def test_unpaired_survivors(self):
+        # The reverse mate is always too short, so every forward mate is kept unpaired
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=4, avg_quality=0, dedup=True, keep_unpaired=True))
+        rejected = []
+        trimmer.on_reject = lambda records, reason: rejected.append((records, reason))
+        fw, short = ct.FastqRecord(b'@fw', b'ACGTACGT', b'IIIIIIII'), ct.FastqRecord(b'@rev', b'AC', b'II')
+        self.assertEqual(trimmer.trim_pair_coordinates(fw, short, True), ((0, 8), None))
+        self.assertIsNone(trimmer.trim_pair_coordinates(fw, short, True))
+        self.assertEqual(trimmer.stats.unpaired_fw_reads, 1)
+        self.assertEqual(trimmer.stats.duplicate_reads, 1)
+        self.assertEqual(rejected[-1], ((fw, None), 'duplicate'))
+
+        # A reverse mate with the same sequence as a kept forward mate is not a duplicate
+        rev = ct.FastqRecord(b'@rev', b'ACGTACGT', b'IIIIIIII')
+        self.assertEqual(trimmer.trim_pair_coordinates(short, rev, True), (None, (0, 8)))
+        self.assertEqual(trimmer.stats.unpaired_rev_reads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
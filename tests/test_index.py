@@ -0,0 +1,94 @@
+''' -----------------------------------------
+    Tests of the FASTQ index of the magicClipper NGS read trimmer (clipperIndex.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import gzip
+import os
+import tempfile
+import unittest
+
+import clipperIndex as ci
+import clipperParallel as cpar
+import clipperTrimmer as ct
+
+
+def make_fastq(read_count):
+    return b''.join(b'@read%d\nACGTACGT\n+\n@+II@+II\n' % i for i in range(read_count))
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def write(self, name, data):
+        fastq_file = os.path.join(self.work_dir.name, name)
+        with open(fastq_file, 'wb') as outfile:
+            outfile.write(data)
+        return fastq_file
+
+    def check_ranges(self, fastq_file, index, read_count):
+        for parts in (1, 2, 3, 7):
+            headers = []
+            for start, end in ci.split_ranges(index, parts):
+                headers += [record.header for record in ci.read_range(fastq_file, index, start, end)]
+            self.assertEqual(headers, [b'@read%d' % i for i in range(read_count)])
+
+    def test_plain_file(self):
+        fastq_file = self.write('reads.fastq', make_fastq(25))
+        index = ci.build_index(fastq_file, every=4)
+        self.assertEqual(index['records'], 25)
+        self.assertEqual(len(index['offsets']), 7)
+        self.check_ranges(fastq_file, index, 25)
+
+    def test_records_from(self):
+        fastq_file = self.write('reads.fastq', make_fastq(25))
+        index = ci.build_index(fastq_file, every=4)
+        self.assertEqual(next(ci.read_records(fastq_file, index, 13)).header, b'@read13')
+
+    def test_gzip_members(self):
+        # One gzip member every 5 records, so that each is a restart point
+        records = make_fastq(20).splitlines(keepends=True)
+        members = [b''.join(records[i:i+20]) for i in range(0, len(records), 20)]
+        fastq_file = self.write('reads.fastq.gz', b''.join(gzip.compress(member) for member in members))
+        index = ci.write_index(fastq_file, every=5)
+        self.assertEqual(len(index['restart_points']), 4)
+        self.assertEqual(ci.load_index(fastq_file), index)
+        self.assertTrue(cpar.splittable(fastq_file, 4))
+        self.assertFalse(cpar.splittable(fastq_file, 5))
+        self.check_ranges(fastq_file, index, 20)
+
+    def test_empty_file(self):
+        for name, data in (('empty.fastq', b''), ('empty.fastq.gz', gzip.compress(b''))):
+            fastq_file = self.write(name, data)
+            index = ci.build_index(fastq_file)
+            self.assertEqual(index['records'], 0)
+            self.assertEqual(index['offsets'], [])
+            self.assertEqual(ci.split_ranges(index, 4), [])
+
+    def test_stale_index(self):
+        fastq_file = self.write('reads.fastq', make_fastq(5))
+        ci.write_index(fastq_file)
+        self.write('reads.fastq', make_fastq(6))
+        self.assertIsNone(ci.load_index(fastq_file))
+
+    def test_indexed_byte_ranges(self):
+        fastq_file = self.write('reads.fastq', make_fastq(30))
+        index = ci.write_index(fastq_file, every=3)
+        ranges, found_index = cpar.byte_ranges(fastq_file, 4)
+        self.assertEqual(found_index, index)
+        with open(fastq_file, 'rb') as infile:
+            for start, end in ranges:
+                infile.seek(start)
+                self.assertEqual(next(ct.read_fastq(infile)).header[:5], b'@read')
+
+
+if __name__ == '__main__':
+    unittest.main()
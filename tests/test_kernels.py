@@ -0,0 +1,169 @@
+''' -----------------------------------------
+    Tests of the kernels of the magicClipper NGS read trimmer (clipperKernels.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import importlib.util
+import random
+import unittest
+
+import clipperKernels as ck
+import clipperPlan as cp
+
+
+class TestWindowTrim(unittest.TestCase):
+
+    def tearDown(self):
+        ck.set_backend('python')
+
+    def test_window_trim(self):
+        qual = b'##' + b'I' * 10 + b'#####'
+        self.assertEqual(ck.window_trim(qual, 0, len(qual), 4, ord('5')), (0, 14))
+        self.assertEqual(ck.window_trim(list(qual), 0, len(qual), 4, ord('5')), (0, 14))
+        self.assertEqual(ck.window_trim(b'#####', 0, 5, 4, ord('5')), (5, 5))
+        self.assertEqual(ck.window_trim(b'', 0, 0, 4, ord('5')), (0, 0))
+
+    def test_stride_window_trim(self):
+        # Windows of 4 at 0, 4, 8... from the start, and ending at 20, 16, 12... from the end
+        qual = [2] * 5 + [30] * 10 + [2] * 5
+        self.assertEqual(ck.window_trim(qual, 0, 20, 4, 15, step=4), (4, 16))
+        self.assertEqual(ck.window_trim(qual, 0, 20, 4, 15), (3, 17))
+        # The windows at the other end are cut short at the end of the range
+        self.assertEqual(ck.window_trim([2] * 4 + [30] * 2, 0, 6, 4, 15, step=4), (4, 6))
+        self.assertEqual(ck.window_trim([30] * 2 + [2] * 4, 0, 6, 4, 15, step=4), (0, 2))
+        # Each end is scanned over the whole read: nothing is kept if they cross
+        self.assertEqual(ck.window_trim([2] * 7 + [30] * 3, 0, 10, 4, 15, step=4), (8, 10))
+        self.assertEqual(ck.window_trim([2] * 10, 0, 10, 4, 15, step=4), (10, 10))
+        self.assertEqual(ck.window_trim([20, 2, 2, 2, 50, 4, 4, 4, 2], 0, 9, 4, 15, step=4), (4, 4))
+        self.assertEqual(ck.window_trim([], 0, 0, 4, 15, step=4), (0, 0))
+
+    def test_stride_matches_trimmer_sw(self):
+        # The stride window trimming trimmer_SW.py had written in it before it used the kernel
+        def trimmer_sw(scores, window_size, quality):
+            leading = 0
+            for i in range(0, len(scores), window_size):
+                if sum(scores[i:i+window_size])/len(scores[i:i+window_size]) < quality:
+                    leading += window_size
+                else:
+                    break
+            trailing = 0
+            for i in range(0, len(scores), window_size):
+                window = scores[-window_size:] if i == 0 else scores[-window_size-i:-i]
+                if sum(window)/len(window) < quality:
+                    trailing += window_size
+                else:
+                    break
+            return scores[leading:-trailing] if trailing != 0 else scores[leading:]
+
+        generator = random.Random(3)
+        for i in range(3000):
+            scores = [generator.choice((2, 10, 20, 38)) for j in range(generator.randint(0, 30))]
+            window_size = generator.randint(2, 6)
+            start, end = ck.window_trim(scores, 0, len(scores), window_size, 15, step=window_size)
+            self.assertEqual(scores[start:end], trimmer_sw(scores, window_size, 15), scores)
+
+    def test_quality_trim_step(self):
+        step = cp.quality_trim_step(4, 20, 33)
+        qual = b'#' * 6 + b'I' * 10 + b'#' * 6
+        self.assertEqual(step(qual, 0, len(qual), []), ck.window_trim(qual, 0, len(qual), 4, 53) + (None,))
+
+    @unittest.skipIf(importlib.util.find_spec('numpy') is None, 'NumPy is not installed')
+    def test_backends_agree(self):
+        generator = random.Random(1)
+        for i in range(2000):
+            length = generator.randint(0, 40)
+            qual = bytes(generator.randint(33, 74) for j in range(length))
+            start = generator.randint(0, length)
+            end = generator.randint(start, length)
+            window_size, quality = generator.randint(1, 8), generator.randint(33, 70)
+            step = generator.choice((1, window_size))
+            found = []
+            for backend in ck.BACKENDS:
+                ck.set_backend(backend)
+                found.append(ck.window_trim(qual, start, end, window_size, quality, step))
+                found.append(ck.window_trim(list(qual), start, end, window_size, quality, step))
+            self.assertEqual(len(set(found)), 1, (qual, start, end, window_size, quality, step))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            ck.set_backend('cuda')
+
+
+class TestNTrim(unittest.TestCase):
+
+    def test_ends(self):
+        self.assertEqual(ck.n_trim(b'NNACGTNACNN'), (2, 9))
+        self.assertEqual(ck.n_trim(b'ACGT'), (0, 4))
+        self.assertEqual(ck.n_trim(b'NACGT'), (1, 5))
+        self.assertEqual(ck.n_trim(b'ACGTNNN'), (0, 4))
+        self.assertEqual(ck.n_trim(b'NNNN'), (4, 4))
+        self.assertEqual(ck.n_trim(b''), (0, 0))
+
+    def test_split(self):
+        self.assertEqual(ck.n_trim(b'NNACGTNACNN', split=True), (2, 6))
+        self.assertEqual(ck.n_trim(b'ACNACGTNNACGTTA', split=True), (9, 15))
+        self.assertEqual(ck.n_trim(b'ACGNACGNN', split=True), (0, 3))        # The first one if as long
+        self.assertEqual(ck.n_trim(b'ACGT', split=True), (0, 4))
+        self.assertEqual(ck.n_trim(b'NNNN', split=True), (4, 4))
+        self.assertEqual(ck.n_trim(b'', split=True), (0, 0))
+
+
+class TestPolyXTrim(unittest.TestCase):
+    G = ord('G')
+
+    def tearDown(self):
+        ck.set_backend('python')
+
+    def test_tail(self):
+        seq = b'ACGTACGTAC' + b'G' * 12
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 10, 1), 10)
+        self.assertEqual(ck.poly_x_trim(seq, 0, 15, self.G, 10, 1), 15)       # Only 5 G bases before 15
+        self.assertEqual(ck.poly_x_trim(b'ACTA' + b'G' * 9, 0, 13, self.G, 10, 1), 13)        # Tail of 9 only
+        self.assertEqual(ck.poly_x_trim(b'ACGT' + b'G' * 9, 0, 13, self.G, 10, 1), 2)         # The T is tolerated
+        self.assertEqual(ck.poly_x_trim(b'G' * 12, 0, 12, self.G, 10, 0), 0)
+
+    def test_mismatches(self):
+        # One A, 7 bases from the end of a 12 bases tail
+        seq = b'ACGTACGTAC' + b'GGGGGAGGGGGG'
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 10, 1), 10)
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 10, 0), len(seq))   # Tail of 6 only
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 5, 0), 16)
+        # A mismatch at the very end is removed with the tail
+        self.assertEqual(ck.poly_x_trim(b'A' * 10 + b'G' * 10 + b'T', 0, 21, self.G, 10, 1), 10)
+        # One more mismatch is allowed for every 10 bases of the tail
+        tail = bytearray(b'G' * 25)
+        tail[-5], tail[-21] = ord('A'), ord('T')
+        seq = b'CCCCC' + bytes(tail)
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 10, 1), 5)
+        tail[-15] = ord('A')
+        seq = b'CCCCC' + bytes(tail)
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 10, 1), 16)    # Stops at the 15th base
+        self.assertEqual(ck.poly_x_trim(seq, 0, len(seq), self.G, 20, 1), len(seq))
+
+    def test_batch(self):
+        seqs = [b'ACGTACGTAC' + b'G' * 12, b'ACGT' + b'A' * 12, b'ACGT' * 5, b'', b'G' * 3, b'ACGTACGTAC' + b'GGGGGAGGGGGG']
+        self.assertEqual(ck.poly_x_trim_batch(seqs, b'G', 10, 1), [10, 16, 20, 0, 3, 10])
+        self.assertEqual(ck.poly_x_trim_batch(seqs, b'GA', 10, 1), [10, 4, 20, 0, 3, 10])
+        self.assertEqual(ck.poly_x_trim_batch(seqs, b'G', 5, 0), [10, 16, 20, 0, 3, 16])
+        self.assertEqual(ck.poly_x_trim_batch([], b'G', 10, 1), [])
+
+    @unittest.skipIf(importlib.util.find_spec('numpy') is None, 'NumPy is not installed')
+    def test_backends_agree(self):
+        generator = random.Random(2)
+        seqs = [bytes(generator.choice(b'GGGGA' if generator.random() < 0.5 else b'ACGTN')
+                      for j in range(generator.randint(0, 60))) for i in range(3000)]
+        for bases, min_len, mismatches in ((b'G', 10, 1), (b'GA', 5, 0), (b'G', 1, 3), (b'N', 10, 2)):
+            found = []
+            for backend in ck.BACKENDS:
+                ck.set_backend(backend)
+                found.append(ck.poly_x_trim_batch(seqs, bases, min_len, mismatches))
+            self.assertEqual(found[0], found[1])
+            self.assertEqual(found[0], [min(ck.poly_x_trim(seq, 0, len(seq), base, min_len, mismatches) for base in bases)
+                                        for seq in seqs])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+''' -----------------------------------------
+    Tests of the metrics exporter of the magicClipper NGS read trimmer (clipperMetrics.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import io
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import clipperMetrics as cmet
+import clipperParallel as cpar
+import clipperTrimmer as ct
+
+
+def read_metrics(path):
+    with open(path) as metrics_file:
+        return [line for line in metrics_file.read().split('\n') if line and not line.startswith('#')]
+
+
+class TestMetricsWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.in_file = os.path.join(self.directory.name, 'reads.fastq')
+        with open(self.in_file, 'wb') as in_file:
+            in_file.write(b'A' * 1000)
+        self.path = os.path.join(self.directory.name, 'magicClipper.prom')
+        self.stats = ct.TrimStats()
+        self.clock = unittest.mock.patch('clipperMetrics.time.monotonic', return_value=100.0)
+        self.time = self.clock.start()
+        self.metrics = cmet.MetricsWriter(self.path, [self.in_file], interval=10)
+
+    def tearDown(self):
+        self.clock.stop()
+        self.directory.cleanup()
+
+    def test_metric_lines(self):
+        self.stats.read_count, self.stats.dropped_reads = 400, 30
+        self.stats.dropped_by_reason['too_short'] = 30
+        in_stream, out_stream = io.BytesIO(b'A' * 1000), io.BytesIO()
+        in_stream.seek(250)
+        out_stream.write(b'A' * 200)
+        self.time.return_value = 110.0
+        self.metrics.update(self.stats, [in_stream], [out_stream])
+
+        label = '{input="' + self.in_file + '"}'
+        self.assertEqual(read_metrics(self.path), [
+            'magicclipper_reads_processed_total' + label + ' 400',
+            'magicclipper_reads_kept_total' + label + ' 370',
+            'magicclipper_reads_dropped_total' + label[:-1] + ',reason="unknown_quality"} 0',
+            'magicclipper_reads_dropped_total' + label[:-1] + ',reason="too_short"} 30',
+            'magicclipper_reads_dropped_total' + label[:-1] + ',reason="low_quality"} 0',
+            'magicclipper_reads_dropped_total' + label[:-1] + ',reason="too_many_n"} 0',
+            'magicclipper_reads_dropped_total' + label[:-1] + ',reason="duplicate"} 0',
+            'magicclipper_bytes_in_total' + label + ' 250',
+            'magicclipper_bytes_out_total' + label + ' 200',
+            'magicclipper_reads_per_second' + label + ' 40.0',
+            'magicclipper_progress_ratio' + label + ' 0.25',
+            'magicclipper_eta_seconds' + label + ' 30.0'])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_interval(self):
+        self.time.return_value = 105.0
+        self.metrics.update(self.stats, [], [])
+        self.assertFalse(os.path.exists(self.path))         # Not written before the interval
+
+        self.stats.read_count = 100
+        self.time.return_value = 110.0
+        self.metrics.update(self.stats, [], [], bytes_in=500)
+        lines = read_metrics(self.path)
+        self.assertIn('magicclipper_bytes_in_total{input="' + self.in_file + '"} 500', lines)
+        self.assertIn('magicclipper_progress_ratio{input="' + self.in_file + '"} 0.5', lines)
+        self.assertIn('magicclipper_eta_seconds{input="' + self.in_file + '"} 10.0', lines)
+
+        # The speed is the one since the last write
+        self.stats.read_count = 400
+        self.time.return_value = 115.0
+        self.metrics.update(self.stats, [], [], bytes_in=600)
+        self.assertIn('magicclipper_bytes_in_total{input="' + self.in_file + '"} 500', read_metrics(self.path))
+        self.time.return_value = 120.0
+        self.metrics.update(self.stats, [], [], bytes_in=600)
+        self.assertIn('magicclipper_reads_per_second{input="' + self.in_file + '"} 30.0', read_metrics(self.path))
+
+    def test_finished(self):
+        self.stats.read_count = 500
+        self.time.return_value = 101.0
+        self.metrics.update(self.stats, [], [], finished=True, bytes_in=0)
+        lines = read_metrics(self.path)
+        # Written at once, with the average speed of the whole run
+        self.assertIn('magicclipper_reads_per_second{input="' + self.in_file + '"} 500.0', lines)
+        self.assertIn('magicclipper_progress_ratio{input="' + self.in_file + '"} 1', lines)
+        self.assertIn('magicclipper_eta_seconds{input="' + self.in_file + '"} 0', lines)
+
+    def test_eta_not_known(self):
+        self.time.return_value = 110.0
+        self.metrics.update(self.stats, [], [], bytes_in=0)
+        self.assertIn('magicclipper_eta_seconds{input="' + self.in_file + '"} -1', read_metrics(self.path))
+
+    def test_compressed_position(self):
+        # The position in the file on disk, not in the uncompressed data
+        compressed = io.BytesIO(b'A' * 100)
+        compressed.seek(40)
+        stream = unittest.mock.Mock(fileobj=compressed)
+        self.assertEqual(cmet.stream_position(stream), 40)
+        self.assertEqual(cmet.stream_position(compressed), 40)
+
+
+class TestParallelMetrics(unittest.TestCase):
+
+    def test_updated_per_range(self):
+        with tempfile.TemporaryDirectory() as directory:
+            in_file = os.path.join(directory, 'reads.fastq')
+            with open(in_file, 'wb') as fastq:
+                for i in range(200):
+                    fastq.write(b'@r%03d\nACGTACGTAC\n+\nIIIIIIIIII\n' % i)
+            metrics = unittest.mock.Mock(total_bytes=1000)
+            out_stream = io.BytesIO()
+            trimmer = ct.Trimmer(ct.TrimConfig(min_len=5))
+            cpar.trim_parallel(in_file, out_stream, trimmer, 2, metrics=metrics)
+
+        # One update per byte range, from the share of the input done so far
+        done = [call.kwargs['bytes_in'] for call in metrics.update.call_args_list]
+        self.assertEqual(len(done), 2 * cpar.RANGES_PER_PROCESS)
+        self.assertEqual(done, sorted(done))
+        self.assertEqual(done[-1], 1000)
+        self.assertEqual(out_stream.getvalue().count(b'\n'), 800)
+        self.assertEqual(trimmer.stats.read_count, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
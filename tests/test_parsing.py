@@ -0,0 +1,123 @@
+''' -----------------------------------------
+    Tests of the fastq parsing of the magicClipper NGS read trimmer: whole files,
+    read pairs and byte ranges (clipperTrimmer.py and clipperParallel.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import io
+import os
+import tempfile
+import unittest
+
+import clipperParallel as cpar
+import clipperTrimmer as ct
+
+
+## Quality lines that look like headers ('@') and separators ('+')
+TRICKY_FASTQ = (b'@read1\nACGTA\n+\n@@@@@\n'
+                b'@read2\nAC\n+\n+@\n'
+                b'@read3\nACGTACGT\n+read3\n@+@+IIII\n'
+                b'@read4\nGG\n+\n@+\n'
+                b'@read5\nA\n+\n+\n')
+
+## The second read has no bases (and no qualities)
+EMPTY_READ_FASTQ = b'@read1\nACGT\n+\nIIII\n@read2\n\n+\n\n@read3\nAC\n+\nII\n'
+
+
+def records(fastq):
+    return [(record.header, record.seq, record.qual) for record in ct.read_fastq(io.BytesIO(fastq))]
+
+
+class TestReadFastq(unittest.TestCase):
+
+    def test_tricky_quality_lines(self):
+        found = records(TRICKY_FASTQ)
+        self.assertEqual([header for header, seq, qual in found], [b'@read1', b'@read2', b'@read3', b'@read4', b'@read5'])
+        self.assertEqual(found[1], (b'@read2', b'AC', b'+@'))
+        self.assertEqual(found[2], (b'@read3', b'ACGTACGT', b'@+@+IIII'))
+
+    def test_empty_file(self):
+        self.assertEqual(records(b''), [])
+        self.assertEqual(list(ct.read_fastq(io.BytesIO(b''), reuse=True)), [])
+
+    def test_zero_length_read(self):
+        found = records(EMPTY_READ_FASTQ)
+        self.assertEqual(len(found), 3)
+        self.assertEqual(found[1], (b'@read2', b'', b''))
+
+    def test_zero_length_read_reused(self):
+        found = [(record.header, record.seq, record.qual)
+                 for record in ct.read_fastq(io.BytesIO(EMPTY_READ_FASTQ), reuse=True)]
+        self.assertEqual(found, records(EMPTY_READ_FASTQ))
+
+    def test_incomplete_last_record(self):
+        self.assertEqual(len(records(TRICKY_FASTQ + b'@read6\nAC\n+\n')), 5)
+
+    def test_no_final_line_break(self):
+        self.assertEqual(records(TRICKY_FASTQ.rstrip(b'\n')), records(TRICKY_FASTQ))
+
+    def test_pairs(self):
+        pairs = list(ct.read_fastq_pairs(io.BytesIO(TRICKY_FASTQ), io.BytesIO(TRICKY_FASTQ)))
+        self.assertEqual(len(pairs), 5)
+        self.assertEqual(pairs[3][0], pairs[3][1])
+
+    def test_pairs_unequal(self):
+        with self.assertRaises(ct.UnequalReadCountError):
+            list(ct.read_fastq_pairs(io.BytesIO(TRICKY_FASTQ), io.BytesIO(EMPTY_READ_FASTQ)))
+        with self.assertRaises(ct.UnequalReadCountError):
+            list(ct.read_fastq_pairs(io.BytesIO(b''), io.BytesIO(EMPTY_READ_FASTQ)))
+
+
+class TestByteRanges(unittest.TestCase):
+    """
+    A file split at any byte must give every record exactly once.
+    """
+
+    def split_records(self, fastq, split):
+        stream = io.BytesIO(fastq)
+        found = []
+        for start, end in ((0, split), (split, len(fastq))):
+            start = cpar.find_record_start(stream, start)
+            found += [(record.header, record.seq, record.qual) for record in cpar.read_fastq_range(stream, start, end)]
+        return found
+
+    def test_every_split_point(self):
+        for fastq in (TRICKY_FASTQ, EMPTY_READ_FASTQ):
+            expected = records(fastq)
+            for split in range(len(fastq) + 1):
+                self.assertEqual(self.split_records(fastq, split), expected, 'split at byte {}'.format(split))
+
+    def test_record_start(self):
+        stream = io.BytesIO(TRICKY_FASTQ)
+        # Inside read1, the next record start is read2 and not its '@@@@@' quality line
+        self.assertEqual(cpar.find_record_start(stream, 1), TRICKY_FASTQ.index(b'@read2'))
+        self.assertEqual(stream.tell(), TRICKY_FASTQ.index(b'@read2'))
+        # Past the last record
+        self.assertEqual(cpar.find_record_start(stream, len(TRICKY_FASTQ) - 1), len(TRICKY_FASTQ))
+
+    def test_empty_file(self):
+        self.assertEqual(self.split_records(b'', 0), [])
+
+    def test_byte_ranges_of_file(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            fastq_file = os.path.join(work_dir, 'reads.fastq')
+            with open(fastq_file, 'wb') as outfile:
+                outfile.write(TRICKY_FASTQ * 50)
+            ranges, index = cpar.byte_ranges(fastq_file, 7)
+            self.assertIsNone(index)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], os.path.getsize(fastq_file))
+
+            found = []
+            with open(fastq_file, 'rb') as infile:
+                for start, end in ranges:
+                    start = cpar.find_record_start(infile, start)
+                    found += [record.header for record in cpar.read_fastq_range(infile, start, end)]
+            self.assertEqual(len(found), 250)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+''' -----------------------------------------
+    Tests of the preview mode of the magicClipper NGS read trimmer (clipperPreview.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import io
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import clipperPreview as cpv
+import clipperTrimmer as ct
+
+
+def fastq_bytes(count, prefix=b'r'):
+    # Every 4th read has the lowest quality, and is dropped
+    return b''.join(b'@%s%05d\nACGTACGTAC\n+\n%s\n' % (prefix, i, b'##########' if i % 4 == 0 else b'IIIIIIIIII')
+                    for i in range(count))
+
+
+def read_number(record):
+    return int(record.header[2:])
+
+
+class TestSampler(unittest.TestCase):
+
+    def test_limit(self):
+        sampler = cpv.Sampler([io.BytesIO(fastq_bytes(10))], limit=3)
+        self.assertEqual([read_number(record) for record in sampler], [0, 1, 2])
+        self.assertEqual((sampler.seen, sampler.sampled, sampler.eof), (3, 3, False))
+
+        sampler = cpv.Sampler([io.BytesIO(fastq_bytes(10))], limit=20)
+        self.assertEqual(len(list(sampler)), 10)
+        self.assertEqual((sampler.seen, sampler.eof), (10, True))
+
+    def test_fraction(self):
+        samples = []
+        for seed in (3, 3, 4):
+            sampler = cpv.Sampler([io.BytesIO(fastq_bytes(5000))], fraction=0.1, seed=seed)
+            samples.append([read_number(record) for record in sampler])
+            self.assertEqual((sampler.seen, sampler.sampled, sampler.eof), (5000, len(samples[-1]), True))
+        self.assertEqual(samples[0], samples[1])
+        self.assertNotEqual(samples[0], samples[2])
+        self.assertEqual(samples[0], sorted(set(samples[0])))
+        self.assertAlmostEqual(len(samples[0]) / 5000, 0.1, delta=0.015)
+
+        # The first N reads of the random subset
+        sampler = cpv.Sampler([io.BytesIO(fastq_bytes(5000))], limit=5, fraction=0.1, seed=3)
+        self.assertEqual([read_number(record) for record in sampler], samples[0][:5])
+
+    def test_paired(self):
+        sampler = cpv.Sampler([io.BytesIO(fastq_bytes(6, b'f')), io.BytesIO(fastq_bytes(6, b'v'))], limit=2)
+        self.assertEqual([(fw.header, rev.header) for fw, rev in sampler], [(b'@f00000', b'@v00000'), (b'@f00001', b'@v00001')])
+        with self.assertRaises(ct.UnequalReadCountError):
+            list(cpv.Sampler([io.BytesIO(fastq_bytes(6)), io.BytesIO(fastq_bytes(5))]))
+
+    def test_jump(self):
+        # Long runs of skipped reads of a plain file are jumped over, to a record start
+        with tempfile.TemporaryDirectory() as directory:
+            in_file = os.path.join(directory, 'reads.fastq')
+            with open(in_file, 'wb') as fastq:
+                fastq.write(fastq_bytes(20000))
+            with open(in_file, 'rb') as stream:
+                sampler = cpv.Sampler([stream], fraction=0.002, seed=1)
+                sampled = [(read_number(record), record.seq) for record in sampler]
+                total = sampler.estimated_total(in_file)
+        self.assertTrue(sampler.jumped)
+        self.assertFalse(sampler.eof)
+        self.assertTrue(all(seq == b'ACGTACGTAC' for number, seq in sampled))
+        self.assertEqual([number for number, seq in sampled], sorted(set(number for number, seq in sampled)))
+        self.assertEqual(total, 20000)                  # Records of the same size
+
+    def test_max_scan(self):
+        # A fraction alone stops at MAX_SCAN records of an input that can't be jumped in
+        with unittest.mock.patch('clipperPreview.MAX_SCAN', 100):
+            sampler = cpv.Sampler([io.BytesIO(fastq_bytes(1000))], fraction=0.2, seed=1)
+            sampled = list(sampler)
+        self.assertTrue(sampler.stopped)
+        self.assertLess(sampler.seen, 100)
+        self.assertEqual(len(sampled), sampler.sampled)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_bins(self):
+        self.assertEqual(cpv.histogram([1, 5, 12, 35], 10), [(0, 2), (10, 1), (20, 0), (30, 1)])
+        self.assertEqual(cpv.histogram([27.5, 29.9], 5), [(25, 2)])
+        self.assertEqual(cpv.histogram([], 10), [])
+        self.assertEqual(cpv.histogram_lines([], 10), ['  (no reads kept)'])
+        self.assertEqual(cpv.histogram_lines([1, 5, 12], 10),
+                         ['     0-9     66.67 % ' + '#' * cpv.BAR_WIDTH, '    10-19    33.33 % ' + '#' * (cpv.BAR_WIDTH // 2)])
+        self.assertEqual(cpv.summary_line([3, 1, 2, 10]), '  min 1, median 3, mean 4.0, max 10')
+
+
+class TestPreview(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.in_file = os.path.join(self.directory.name, 'reads.fastq')
+        with open(self.in_file, 'wb') as fastq:
+            fastq.write(fastq_bytes(8))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def preview(self, **kwargs):
+        with open(self.in_file, 'rb') as stream:
+            return cpv.preview([self.in_file], [stream], ct.Trimmer(ct.TrimConfig(min_len=5)), **kwargs)
+
+    def test_projected(self):
+        lines = self.preview(limit=4)
+        self.assertEqual(lines[1:9], ['Sample: first 4 reads',
+                                      'Reads trimmed: 4 (out of 4 read from the input)',
+                                      'Reads in the input: 8 (estimated)',
+                                      '\n*** Projected for the full run ***',
+                                      'Kept: 75.0 % (about 6 reads)',
+                                      'Dropped: 25.0 % (about 2 reads)',
+                                      '  too_short: 25.0 %',
+                                      'Reads trimmed: 25.0 %'])
+        self.assertEqual(lines[10], '  min 10, median 10, mean 10.0, max 10')
+        self.assertEqual(lines[13], '  min 40.0, median 40.0, mean 40.0, max 40.0')
+
+    def test_whole_input(self):
+        lines = self.preview()
+        self.assertEqual(lines[1:4], ['Sample: all reads', 'Reads trimmed: 8 (out of 8 read from the input)',
+                                      'Reads in the input: 8'])
+        self.assertEqual(self.preview(fraction=0.5, seed=2)[1], 'Sample: random 50.0 % of the reads (seed 2)')
+
+    def test_empty_sample(self):
+        with open(self.in_file, 'wb'):
+            pass
+        self.assertEqual(self.preview()[-1], 'No reads in the sample.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+''' -----------------------------------------
+    Tests of the rejected reads output of the magicClipper NGS read trimmer (clipperRejects.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import io
+import unittest
+
+import clipperRejects as crej
+import clipperTrimmer as ct
+
+
+def record(name, seq, qual=None):
+    return ct.FastqRecord(name, seq, qual if qual is not None else b'I' * len(seq))
+
+
+def written(stream):
+    return [ct.FastqRecord(header, seq, qual) for header, seq, plus, qual in
+            zip(*[iter(stream.getvalue().split(b'\n')[:-1])] * 4)]
+
+
+class TestRejectWriter(unittest.TestCase):
+
+    def test_tagged_reads(self):
+        out_fw, out_rev = io.BytesIO(), io.BytesIO()
+        rejects = crej.RejectWriter([out_fw, out_rev])
+        rejects((record(b'@a', b'ACGT'), record(b'@b', b'TT')), 'too_short')
+        rejects((None, record(b'@c', b'GG')), 'low_quality')
+        self.assertEqual(written(out_fw), [record(b'@a reason=too_short', b'ACGT')])
+        self.assertEqual(written(out_rev), [record(b'@b reason=too_short', b'TT'), record(b'@c reason=low_quality', b'GG')])
+        self.assertEqual((rejects.counts['too_short'], rejects.counts['low_quality']), (1, 1))
+
+    def test_unpaired_mate_not_rejected(self):
+        # The reverse mate is too short: the forward one is kept as unpaired, and only the reverse one is rejected
+        out_fw, out_rev = io.BytesIO(), io.BytesIO()
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=4, avg_quality=0, keep_unpaired=True))
+        trimmer.on_reject = crej.RejectWriter([out_fw, out_rev])
+        fw, rev = record(b'@fw', b'ACGTACGT'), record(b'@rev', b'AC')
+        self.assertEqual(trimmer.trim_pair_unpaired(fw, rev), (fw, None))
+        self.assertEqual(written(out_fw), [])
+        self.assertEqual(written(out_rev), [record(b'@rev reason=too_short', b'AC')])
+
+        # Without -U, both mates of the dropped pair are rejected
+        out_fw, out_rev = io.BytesIO(), io.BytesIO()
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=4, avg_quality=0))
+        trimmer.on_reject = crej.RejectWriter([out_fw, out_rev])
+        self.assertIsNone(trimmer.trim_pair(fw, rev))
+        self.assertEqual(len(written(out_fw)), 1)
+        self.assertEqual(len(written(out_rev)), 1)
+
+
+class TestRejectSampler(unittest.TestCase):
+
+    def test_sample_size(self):
+        out = io.BytesIO()
+        rejects = crej.RejectSampler([out], 3, seed=7)
+        for i in range(100):
+            rejects((record(b'@r%d' % i, b'AC'),), 'too_short')
+        rejects((record(b'@n', b'NN'),), 'too_many_n')
+        self.assertEqual(written(out), [])         # Only written when closed
+        rejects.close()
+        headers = [read.header for read in written(out)]
+        self.assertEqual(len(headers), 4)
+        self.assertEqual(headers[3], b'@n reason=too_many_n')
+        self.assertTrue(all(header.endswith(b' reason=too_short') for header in headers[:3]))
+        self.assertEqual(len(set(headers)), 4)
+        self.assertEqual((rejects.counts['too_short'], rejects.counts['too_many_n']), (100, 1))
+
+    def test_same_seed_same_sample(self):
+        samples = []
+        for seed in (1, 1, 2):
+            out = io.BytesIO()
+            rejects = crej.RejectSampler([out], 5, seed)
+            for i in range(50):
+                rejects((record(b'@r%d' % i, b'AC'),), 'too_short')
+            rejects.close()
+            samples.append(out.getvalue())
+        self.assertEqual(samples[0], samples[1])
+        self.assertNotEqual(samples[0], samples[2])
+
+    def test_uniform(self):
+        # Every dropped read has the same chance (size/n) to be in the sample
+        reads = [(record(b'@r%d' % i, b'AC'),) for i in range(10)]
+        chosen = [0] * 10
+        for seed in range(3000):
+            rejects = crej.RejectSampler([io.BytesIO()], 3, seed)
+            for read in reads:
+                rejects(read, 'too_short')
+            for sampled in rejects.samples['too_short']:
+                chosen[reads.index(sampled)] += 1
+        for count in chosen:
+            self.assertAlmostEqual(count / 3000, 0.3, delta=0.04)
+
+
+if __name__ == '__main__':
+    unittest.main()
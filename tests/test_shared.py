@@ -0,0 +1,95 @@
+''' -----------------------------------------
+    Tests of the shared memory slots of the magicClipper NGS read trimmer (clipperShared.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import io
+import unittest
+
+import clipperMemory as cmem
+import clipperShared as cshared
+import clipperTrimmer as ct
+
+
+def record(seq, qual):
+    return ct.FastqRecord(b'@read', seq, qual)
+
+
+class TestSlotRing(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = cshared.SlotRing(2, slot_size=64, slot_reads=4)
+
+    def tearDown(self):
+        self.ring.close(unlink=True)
+
+    def test_pack_unpack(self):
+        records = [record(b'ACGT', b'IIII'), record(b'', b''), record(b'GG', b'@+')]
+        self.ring.pack(1, records)
+        self.ring.pack(0, records[::-1])
+        self.assertEqual(list(self.ring.unpack(1, 3)), [(r.seq, r.qual) for r in records])
+        self.assertEqual(list(self.ring.unpack(0, 3)), [(r.seq, r.qual) for r in records[::-1]])
+
+    def test_opened_by_name(self):
+        self.ring.pack(0, [record(b'ACGT', b'IIII')])
+        other = cshared.SlotRing(2, slot_size=64, slot_reads=4, names=self.ring.names())
+        try:
+            self.assertEqual(list(other.unpack(0, 1)), [(b'ACGT', b'IIII')])
+        finally:
+            other.close()
+
+    def test_batches(self):
+        records = [record(b'A' * 10, b'I' * 10) for i in range(7)]
+        sizes = [len(batch) for batch in cshared.batches(records, self.ring, paired=False)]
+        self.assertEqual(sizes, [3, 3, 1])         # 64 bytes hold 3 reads of 20 bytes
+        pairs = [(read, read) for read in records[:4]]
+        self.assertEqual([len(batch) for batch in cshared.batches(pairs, self.ring, paired=True)], [1, 1, 1, 1])
+
+    def test_read_longer_than_slot(self):
+        with self.assertRaises(ValueError):
+            list(cshared.batches([record(b'A' * 40, b'I' * 40)], self.ring, paired=False))
+        with self.assertRaises(ValueError):
+            list(cshared.batches([record(b'A', b'I'), record(b'A' * 40, b'I' * 40)], self.ring, paired=False))
+
+    def test_budget(self):
+        budget = cmem.MemoryBudget(100)
+        budget.batch_size = 4 * cmem.MIN_BATCH
+        self.assertEqual(cshared.ring_size(3), (6, cshared.SLOT_SIZE, cshared.SLOT_READS))
+        slots, slot_size, slot_reads = cshared.ring_size(3, budget)
+        self.assertEqual((slots, slot_reads), (3, 4 * cmem.MIN_BATCH // 3))
+        self.assertLessEqual(slot_size, cshared.SLOT_SIZE)
+
+        # Smaller batches once the budget backed off
+        budget.batch_size = 4
+        records = [record(b'A', b'I') for i in range(7)]
+        self.assertEqual([len(batch) for batch in cshared.batches(records, self.ring, False, budget)], [2, 2, 2, 1])
+        pairs = [(read, read) for read in records[:3]]
+        self.assertEqual([len(batch) for batch in cshared.batches(pairs, self.ring, True, budget)], [1, 1, 1])
+
+    def test_no_reads(self):
+        self.assertEqual(list(cshared.batches([], self.ring, paired=False)), [])
+
+
+class TestTrimShared(unittest.TestCase):
+
+    def test_unpaired_outputs(self):
+        # Pair 1 is kept, the reverse mate of pair 2 and the forward mate of pair 3 are dropped
+        fastq_fw = b'@p1/1\nACGTAC\n+\nIIIIII\n@p2/1\nGGGGGG\n+\n##IIII\n@p3/1\nCCCCCC\n+\n######\n'
+        fastq_rev = b'@p1/2\nTTTTTT\n+\nIIIIII\n@p2/2\nAAAAAA\n+\n######\n@p3/2\nACACAC\n+\nIIII##\n'
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=4, avg_quality=20, leading_quality=20,
+                                           trailing_quality=20, keep_unpaired=True))
+        out_streams = [io.BytesIO() for i in range(4)]
+        cshared.trim_shared([io.BytesIO(fastq_fw), io.BytesIO(fastq_rev)], out_streams, trimmer, 2)
+        self.assertEqual([stream.getvalue() for stream in out_streams],
+                         [b'@p1/1\nACGTAC\n+\nIIIIII\n', b'@p1/2\nTTTTTT\n+\nIIIIII\n',
+                          b'@p2/1\nGGGG\n+\nIIII\n', b'@p3/2\nACAC\n+\nIIII\n'])
+        stats = trimmer.stats
+        self.assertEqual((stats.read_count, stats.dropped_reads), (3, 2))
+        self.assertEqual((stats.unpaired_fw_reads, stats.unpaired_rev_reads), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
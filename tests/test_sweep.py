@@ -0,0 +1,86 @@
+''' -----------------------------------------
+    Tests of the parameter sweep of the magicClipper NGS read trimmer (clipperSweep.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import random
+import unittest
+
+import clipperSweep as csw
+import clipperTrimmer as ct
+
+
+def record(seq, qual):
+    return ct.FastqRecord(b'@read', seq, qual)
+
+
+class TestParseSweep(unittest.TestCase):
+
+    def test_grid(self):
+        config = ct.TrimConfig()
+        self.assertEqual(csw.parse_sweep('AQ=20,10,15,10 ML=30', config), ([10, 15, 20], [4], [30]))
+        self.assertEqual(csw.parse_sweep('windowsize=5,4 MINLEN=36,', config), ([15], [4, 5], [36]))
+        self.assertEqual(csw.parse_sweep('', config), ([15], [4], [36]))
+
+    def test_invalid(self):
+        config = ct.TrimConfig()
+        for sweep_string in ('Q=10', 'AQ=', 'AQ=-1', 'W=a'):
+            with self.assertRaises(ValueError):
+                csw.parse_sweep(sweep_string, config)
+        with self.assertRaises(ValueError):
+            csw.Sweep(ct.TrimConfig(steps='MINLEN:10'), [15], [4], [36])
+        with self.assertRaises(ValueError):
+            csw.Sweep(ct.TrimConfig(dedup=True), [15], [4], [36])
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_counts(self):
+        config = ct.TrimConfig(leading_quality=20)
+        sweep = csw.Sweep(config, [20, 30], [4], [5, 9])
+        sweep.add(record(b'ACGTACGTAC', b'##IIIIIIII'))     # 8 bases of quality 40 left
+        sweep.add(record(b'ACGTACGTAC', b'IIIIII5555'))     # Qualities 40 and 20, the last window is cut for AQ=30
+        sweep.add(record(b'ACGTAC', b'######'))             # Dropped for every combination
+        self.assertEqual(sweep.read_count, 3)
+        self.assertEqual(sweep.results, {(4, 20, 5): [2, 18, 72.0], (4, 20, 9): [1, 10, 32.0],
+                                         (4, 30, 5): [2, 16, 75.0], (4, 30, 9): [0, 0, 0]})
+        self.assertEqual(sweep.table(), [
+            '     W     AQ     ML   Kept reads   Kept %     Kept bases Avg quality',
+            '     4     20      5            2    66.67             18       36.00',
+            '     4     20      9            1    33.33             10       32.00',
+            '     4     30      5            2    66.67             16       37.50',
+            '     4     30      9            0     0.00              0        0.00'])
+
+    def test_pairs(self):
+        # A pair is kept only if both reads are
+        sweep = csw.Sweep(ct.TrimConfig(), [15], [4], [4, 8])
+        sweep.add(record(b'ACGTACGTAC', b'IIIIIIIIII'), record(b'ACGTAC', b'IIIIII'))
+        self.assertEqual(sweep.results, {(4, 15, 4): [1, 16, 80.0], (4, 15, 8): [0, 0, 0]})
+        self.assertEqual(sweep.table(2)[1], '     4     15      4            1   100.00             16       40.00')
+
+    def test_same_as_trimmer(self):
+        # Every combination keeps the same reads as a Trimmer with its settings
+        generator = random.Random(5)
+        reads = [record(bytes(generator.choice(b'ACGTN' if generator.random() < 0.1 else b'ACGT') for i in range(40)),
+                        bytes(generator.choice(b'#+5?I') for i in range(40))) for j in range(500)]
+        avg_qualities, window_sizes, min_lens = [10, 20, 30], [1, 4, 6], [10, 25]
+        settings = {'leading_quality': 5, 'trailing_quality': 5, 'max_n': 1, 'trim_n': 'ends',
+                    'poly_x': 'G', 'poly_x_min_len': 5}
+        sweep = csw.Sweep(ct.TrimConfig(**settings), avg_qualities, window_sizes, min_lens)
+        for read in reads:
+            sweep.add(read)
+
+        for (window_size, avg_quality, min_len), (kept, bases, qual_sum) in sweep.results.items():
+            trimmer = ct.Trimmer(ct.TrimConfig(window_size=window_size, avg_quality=avg_quality,
+                                               min_len=min_len, **settings))
+            trimmed = [trimmer.trim(read) for read in reads]
+            trimmed = [read for read in trimmed if read is not None]
+            self.assertEqual((kept, bases), (len(trimmed), sum(len(read.seq) for read in trimmed)))
+            self.assertAlmostEqual(qual_sum, sum(sum(read.qual) / len(read.qual) - 33 for read in trimmed))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+''' -----------------------------------------
+    Tests of the read trimming of the magicClipper NGS read trimmer
+    (clipperTrimmer.py and clipperPlan.py).
+
+    Run from the repository root with:  python -m pytest -q
+    -----------------------------------------
+'''
+
+## Required modules
+import random
+import unittest
+
+import clipperFunctions as cf
+import clipperPlan as cp
+import clipperTrimmer as ct
+
+
+def record(seq, qual, name=b'@read'):
+    return ct.FastqRecord(name, seq, qual)
+
+
+class TestZeroLengthReads(unittest.TestCase):
+    """
+    Reads without bases are parsed, then dropped as too short and counted.
+    """
+
+    def check_dropped(self, config):
+        trimmer = ct.Trimmer(config)
+        self.assertIsNone(trimmer.trim(record(b'', b'')))
+        self.assertEqual(trimmer.stats.read_count, 1)
+        self.assertEqual(trimmer.stats.dropped_reads, 1)
+        self.assertEqual(trimmer.stats.dropped_by_reason['too_short'], 1)
+
+    def test_default_settings(self):
+        self.check_dropped(ct.TrimConfig())
+
+    def test_no_length_filter(self):
+        self.check_dropped(ct.TrimConfig(min_len=0, avg_quality=0))
+        self.check_dropped(ct.TrimConfig(min_len=0, avg_quality=0, window_size=1))
+
+    def test_steps(self):
+        self.check_dropped(ct.TrimConfig(steps='SLIDINGWINDOW:4:15'))
+        self.check_dropped(ct.TrimConfig(steps='LEADING:3 TRAILING:3'))
+        self.check_dropped(ct.TrimConfig(steps='CROP:10'))
+
+    def test_pair(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=0, avg_quality=0))
+        self.assertIsNone(trimmer.trim_pair(record(b'ACGT', b'IIII'), record(b'', b'')))
+        self.assertEqual(trimmer.stats.dropped_by_reason['too_short'], 1)
+        fw, rev = trimmer.trim_pair_unpaired(record(b'ACGT', b'IIII'), record(b'', b''))
+        self.assertEqual(fw.seq, b'ACGT')
+        self.assertIsNone(rev)
+
+    def test_trimmed_to_nothing(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=0, avg_quality=0, window_size=1, base_quality=3))
+        self.assertIsNone(trimmer.trim(record(b'ACGT', b'####')))
+        self.assertEqual(trimmer.stats.dropped_by_reason['too_short'], 1)
+
+    def test_low_average_quality(self):
+        # With an average quality filter, an empty read fails it (average quality 0)
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=0))
+        self.assertIsNone(trimmer.trim(record(b'', b'')))
+        self.assertEqual(trimmer.stats.dropped_by_reason['low_quality'], 1)
+
+
+class TestTrimPlan(unittest.TestCase):
+
+    def test_parse_steps(self):
+        self.assertEqual(cp.parse_steps('LEADING:3 slidingwindow:4:15 MINLEN:36'),
+                         [('LEADING', [3]), ('SLIDINGWINDOW', [4, 15]), ('MINLEN', [36])])
+        for step_string in ('LEADING', 'LEADING:3:4', 'UNKNOWN:3', 'SLIDINGWINDOW:0:15', 'CROP:-1', 'CROP:x'):
+            with self.assertRaises(ValueError):
+                cp.parse_steps(step_string)
+
+    def test_steps_to_string(self):
+        step_string = 'HEADCROP:2 LEADING:3 SLIDINGWINDOW:4:15 MINLEN:36 TOPHRED64'
+        self.assertEqual(cp.steps_to_string(cp.parse_steps(step_string)), step_string)
+
+    def test_merged_steps(self):
+        plan = cp.TrimPlan(cp.parse_steps('HEADCROP:1 CROP:10 LEADING:3 TRAILING:5 LEADING:10 MINLEN:5 AVGQUAL:20'), '33')
+        self.assertEqual([kind for kind, setting in plan.kinds], ['crop', 'trim', 'filter'])
+        self.assertEqual(plan.kinds[2], ('filter', 5))
+        # LEADING:10 wins over LEADING:3, on the bases left by the crops
+        self.assertEqual(plan.trim_qualities(b'I' + b'*' * 2 + b'I' * 9 + b'#')[1:3], (3, 11))
+
+    def test_sliding_window(self):
+        plan = cp.TrimPlan(cp.parse_steps('SLIDINGWINDOW:4:20'), '33')
+        qual = b'I' * 10 + b'#' * 10        # Quality 40 then 2
+        # The windows at 7 and 8 still average 20 or more, the one at 9 (IIII###) does not
+        self.assertEqual(plan.trim_qualities(qual), (21.0, 0, 9, 40.0, None, ()))
+        self.assertEqual(plan.trim_qualities(b'I' * 20), (40.0, 0, 20, 40.0, None, ()))
+        self.assertEqual(plan.trim_qualities(b'#' * 4 + b'I' * 16)[1:3], (0, 0))
+
+    def test_sliding_window_shorter_than_window(self):
+        plan = cp.TrimPlan(cp.parse_steps('SLIDINGWINDOW:4:20'), '33')
+        self.assertEqual(plan.trim_qualities(b'III')[4], 'too_short')
+
+    def test_invalid_quality(self):
+        self.assertIsNone(cp.TrimPlan(cp.parse_steps('MINLEN:1'), '64').trim_qualities(b'!!!!'))
+
+    def test_output_phred(self):
+        plan = cp.TrimPlan(cp.parse_steps('TOPHRED64'), '33')
+        self.assertEqual(b'!I'.translate(plan.output_table()), b'@h')
+        self.assertIsNone(cp.TrimPlan([], '33').output_table())
+
+    def test_prefilter(self):
+        plan = cp.TrimPlan(cp.parse_steps('CROP:45 MAXN:2 QUALITYTRIM:4:15 MINLEN:36'), '33')
+        self.assertEqual(plan.prefilter(b'A' * 20, b'I' * 20), (40.0, 0, 20, 0, 'too_short', ()))
+        self.assertEqual(plan.prefilter(b'A' * 40 + b'NNN', b'I' * 43), (40.0, 0, 43, 0, 'too_many_n', ()))
+        self.assertIsNone(plan.prefilter(b'A' * 45 + b'NNN', b'I' * 48))        # The N bases are cropped
+        self.assertEqual(plan.prefilter(b'A' * 20, b'I' * 19 + b' '), 'unknown')
+        self.assertIsNone(plan.prefilter(b'A' * 40, b'I' * 40))
+
+    def test_prefilter_matches_plan(self):
+        # A Trimmer gives the same reads and stats with and without the early reject
+        generator = random.Random(4)
+        reads = []
+        for i in range(3000):
+            length = generator.randint(0, 60)
+            seq = bytes(generator.choice(b'ACGTN' if generator.random() < 0.3 else b'ACGT') for j in range(length))
+            qual = bytes(generator.choice(b'#+5?I' if generator.random() < 0.95 else b'#5I ') for j in range(length))
+            reads.append(record(seq, qual))
+        for settings in ({}, {'leading': 3, 'trailing': 2, 'max_n': 0}, {'steps': 'HEADCROP:5 LEADING:10 MINLEN:30'},
+                         {'steps': 'CROP:40 MAXN:1 SLIDINGWINDOW:4:20 MINLEN:25'}, {'steps': 'TRAILING:20 MINLEN:20 AVGQUAL:25'}):
+            trimmers = [ct.Trimmer(ct.TrimConfig(**settings)) for i in range(2)]
+            trimmers[1].plan.use_prefilter = False
+            self.assertTrue(trimmers[0].plan.use_prefilter)
+            for read in reads:
+                self.assertEqual(trimmers[0].trim(read), trimmers[1].trim(read), (settings, read))
+            for name in ct.TrimStats.__slots__:
+                self.assertEqual(getattr(trimmers[0].stats, name), getattr(trimmers[1].stats, name), (settings, name))
+
+class TestNTrimming(unittest.TestCase):
+
+    def test_coordinates(self):
+        read = record(b'NNACGTACGTNACNN', b'!!IIIIIIII!II!!')
+        for trim_n, expected in (('', None), ('ends', (2, 13)), ('split', (2, 10))):
+            trimmer = ct.Trimmer(ct.TrimConfig(min_len=2, avg_quality=0, max_n=1, trim_n=trim_n))
+            self.assertEqual(trimmer.trim_coordinates(read), expected)
+
+
+class TestUnpaired(unittest.TestCase):
+
+    def test_surviving_mate(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=5, avg_quality=20, leading_quality=20, keep_unpaired=True))
+        good, bad = record(b'ACGTACGT', b'##IIIIII'), record(b'ACGTACGT', b'########')
+        self.assertEqual(trimmer.trim_pair_coordinates(good, bad, True), ((2, 8), None))
+        self.assertEqual(trimmer.trim_pair_coordinates(bad, good, True), (None, (2, 8)))
+        self.assertIsNone(trimmer.trim_pair_coordinates(bad, bad, True))
+        self.assertEqual(trimmer.trim_pair_coordinates(good, good, True), ((2, 8), (2, 8)))
+        fw, rev = trimmer.trim_pair_unpaired(good, bad)
+        self.assertEqual((fw.seq, fw.qual, rev), (b'GTACGT', b'IIIIII', None))
+        self.assertEqual(trimmer.trim_pair_unpaired(bad, bad), (None, None))
+
+        stats = trimmer.stats
+        # Pairs with a single surviving mate count as dropped pairs
+        self.assertEqual((stats.read_count, stats.dropped_reads), (6, 5))
+        self.assertEqual((stats.unpaired_fw_reads, stats.unpaired_rev_reads), (2, 1))
+        self.assertEqual(stats.trimmed_read_len_sum, 12)
+
+    def test_without_keep_unpaired(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(min_len=5, avg_quality=20))
+        self.assertIsNone(trimmer.trim_pair(record(b'ACGTACGT', b'IIIIIIII'), record(b'ACGTACGT', b'########')))
+        self.assertEqual(trimmer.stats.unpaired_fw_reads, 0)
+
+
+class TestTrimCache(unittest.TestCase):
+
+    def test_counts(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(cache_size=2, min_len=4))
+        quals = {'A': b'I' * 10, 'B': b'#' + b'I' * 9, 'C': b'I' * 9 + b'#'}
+        for name in 'AABACB':
+            trimmer.trim(record(b'ACGTACGTAC', quals[name]))
+        # The least recently used quality string (B) is forgotten when C comes in
+        self.assertEqual(trimmer.cache_counts(), (2, 4))
+
+        trimmer.clear_cache()
+        self.assertEqual(trimmer.cache_counts(), (2, 4))
+        trimmer.trim(record(b'ACGTACGTAC', quals['A']))
+        self.assertEqual(trimmer.cache_counts(), (2, 5))
+
+    def test_no_cache(self):
+        trimmer = ct.Trimmer(ct.TrimConfig())
+        trimmer.trim(record(b'ACGT', b'IIII'))
+        trimmer.clear_cache()
+        self.assertEqual(trimmer.cache_counts(), (0, 0))
+
+    def test_same_as_without_cache(self):
+        generator = random.Random(5)
+        quals = [bytes(generator.choice(b'#+5?I') for j in range(generator.randint(0, 50))) for i in range(50)]
+        trimmers = [ct.Trimmer(ct.TrimConfig(cache_size=size, min_len=20)) for size in (0, 64)]
+        for i in range(2000):
+            qual = generator.choice(quals)
+            read = record(bytes(generator.choice(b'ACGTN') for j in range(len(qual))), qual)
+            self.assertEqual(trimmers[0].trim(read), trimmers[1].trim(read))
+        for name in ct.TrimStats.__slots__:
+            self.assertEqual(getattr(trimmers[0].stats, name), getattr(trimmers[1].stats, name), name)
+        # Reads dropped by the early reject never look the cache up, and each quality string is only trimmed once
+        hits, misses = trimmers[1].cache_counts()
+        self.assertLess(hits + misses, 2000)
+        self.assertEqual(misses, len({qual for qual in quals if len(qual) >= 20}))
+
+
+class TestQualityBinning(unittest.TestCase):
+
+    def test_parse_bin_edges(self):
+        self.assertEqual(cf.parse_bin_edges('0,10,20,30'), [(0, 9, 4), (10, 19, 14), (20, 29, 24), (30, 41, 35)])
+        self.assertEqual(cf.parse_bin_edges('illumina'), cf.ILLUMINA_BINS)
+        for edges in ('10,5', '5,5', '0,42', '-1,3', '0,x'):
+            with self.assertRaises(ValueError):
+                cf.parse_bin_edges(edges)
+
+    def test_bin_table(self):
+        # Scores 0, 10, 20, 30, 40 and 41; scores 0 and 1 are not in an Illumina bin
+        self.assertEqual(b'!+5?IJ'.translate(cf.quality_bin_table('33', cf.ILLUMINA_BINS)), b'!07BII')
+        self.assertEqual(b'@JT^hi'.translate(cf.quality_bin_table('64', cf.ILLUMINA_BINS)), b'@OVahh')
+        self.assertEqual('!+5?IJ'.translate(cf.quality_bin_table('33', cf.parse_bin_edges('0,10,20,30'))), '%/9DDD')
+
+    def test_trimmer(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(bin_qualities='illumina', min_len=4))
+        kept = trimmer.trim(record(b'ACGTACGTAC', b'I' * 8 + b'55'))
+        self.assertEqual((kept.seq, kept.qual), (b'ACGTACGTAC', b'I' * 8 + b'77'))
+        # Trimming is done on the unbinned scores: 14 is below 15, even if its bin (10-19) is written as 15
+        self.assertIsNone(trimmer.trim(record(b'ACGTACGTAC', b'/' * 10)))
+        self.assertEqual(trimmer.stats.trimmed_read_qual_sum, (8 * 40 + 2 * 20) / 10)
+
+    def test_binning_and_output_phred(self):
+        trimmer = ct.Trimmer(ct.TrimConfig(bin_qualities='illumina', steps='MINLEN:1 TOPHRED64'))
+        self.assertEqual(trimmer.trim(record(b'AC', b'I5')).qual, b'hV')
+
+
+if __name__ == '__main__':
+    unittest.main()
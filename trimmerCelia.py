@@ -132,7 +132,7 @@ if in_revFile == '':
                 # Keep track of dropped read
                 dropped_reads += 1                
                 # Reset
-                line_count, fastqForward = 0, []
+                line_count, fastq_fw = 0, []
                 # Read new lines
                 line_fw = file_fw.readline()    
                 # Continue to next read without printing
@@ -381,7 +381,7 @@ else:
 
             ## STEP 6: Print trimmed reads onto outfile 
             tf.print_read(fastq_fw[0], read_fw, qual_str_fw, out_fw)
-            tf.print_read(fastq_fw[0], read_fw, qual_str_fw, out_rev)
+            tf.print_read(fastq_rev[0], read_rev, qual_str_rev, out_rev)
             
             ## Stats for trimmed reads
             # Average length of all kept reads
@@ -150,7 +150,7 @@ if in_revFile == '':
                 # Keep track of dropped read
                 dropped_reads += 1                
                 # Reset
-                line_count, fastqForward = 0, []
+                line_count, fastq_fw = 0, []
                 # Read new lines
                 line_fw = file_fw.readline()    
                 # Continue to next read without printing
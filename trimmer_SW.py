@@ -1,3 +1,8 @@
+## -- My modules -- ##
+import clipperKernels as ck
+## ---------------- ##
+
+
 ## -- My files -- ##
 #fileForward = open('testfile_1.fastq', 'r')
 #fileReverse = open('testfile_2.fastq', 'r')
@@ -69,34 +74,11 @@ def phred_control(fastqFile):
 		line = fastqFile.readline()[:-1]
 
 def quality_score(quality_str):
-    
-    ph64 = {'@': 0,'A': 1,'B': 2,'C': 3, 'D': 4,'E': 5,'F': 6,'G': 7,'H': 8,'I': 9,
-        'J': 10,'K': 11,'L': 12,'M': 13,'N': 14,'O': 15,'P': 16,'Q': 17,'R': 18,
-        'S': 19,'T': 20,'U': 21,'V': 22,'W': 23,'X': 24,'Y': 25,'Z': 26,'[': 27,
-        '\\': 28,']': 29,'^': 30,'_': 31,'`': 32,'a': 33,'b': 34,'c': 35,'d': 36,
-        'e': 37, 'f': 38,'g': 39,'h': 40,'i': 41}
-
-    ph33 = {'!': 0,'"': 1,'#': 2,'$': 3,'%': 4,'&': 5,"'": 6,'(': 7,')': 8,
-        '*': 9,'+': 10,',': 11,'-': 12,'.': 13,'/': 14,'0': 15,'1': 16,
-        '2': 17,'3': 18,'4': 19,'5': 20,'6': 21,'7': 22,'8': 23,'9': 24,
-        ':': 25,';': 26,'<': 27,'=': 28,'>': 29,'?': 30,'@': 31,'A': 32,
-        'B': 33,'C': 34,'D': 35,'E': 36,'F': 37,'G': 38,'H': 39,'I': 40,
-        'J': 41}
-    
-    quality_scores = []
+    """Decoding a quality string with the shared kernels (see clipperKernels.py)"""
+    quality_scores = ck.quality_score(quality_str, phred[-2:])
 
-    # If Phred64   
-    if phred == 'phred64':
-        for i in range(len(quality_str)):
-            quality_scores.append(int(ph64[quality_str[i]]))
-    
-    #If Phred33
-    elif phred == 'phred33':
-        for i in range(len(quality_str)):
-            quality_scores.append(int(ph33[quality_str[i]]))
-   
     # If string contains unknows characters
-    else:
+    if quality_scores == 'unknown':
         print("There are unknown characters in the quality string of your read. This read will be ommited from the analysis.")
     
     return quality_scores
@@ -145,48 +127,14 @@ while (lineForward or lineReverse) != '':
         qualityScoreForward = quality_score(qualityStringForward)
 
         ## STEP 1: Remove leading and trailing bases, given user input
-        if TRAILING != 0:
-            qualityScoreForward = qualityScoreForward[LEADING:-TRAILING]
-            qualityStringForward = qualityStringForward[LEADING:-TRAILING]
-            readForward = readForward[LEADING:-TRAILING]
-        else: 
-            qualityScoreForward = qualityScoreForward[LEADING:]
-            qualityStringForward = qualityStringForward[LEADING:]
-            readForward = readForward[LEADING:]      
-        
-        ## STEP 2: Remove leading and trailing bases, based on quality
-        # Count number of leading bases to remove
-        leadingPopped = 0  
-        avgWin = 0    
-        for i in range(0, len(readForward), WIN_SIZE):
-            avgWin = sum(qualityScoreForward[i:i+WIN_SIZE])/len(qualityScoreForward[i:i+WIN_SIZE])
-            if avgWin < AVG_QUALITY:
-                leadingPopped += 4
-                avgWin = 0
-            else:
-                break
-
-        # Count number of trailing bases to remove
-        trailingPopped = 0
-        avgWin = 0
-        for i in range(0, len(readForward), WIN_SIZE):
-            if i==0:
-                avgWin = sum(qualityScoreForward[-WIN_SIZE:])/len(qualityScoreForward[-WIN_SIZE:])
-            else:
-                avgWin = sum(qualityScoreForward[-WIN_SIZE-i:-i])/len(qualityScoreForward[-WIN_SIZE-i:-i])
-            if avgWin < AVG_QUALITY:
-                trailingPopped += 4
-                avgWin = 0
-            else:
-                break
+        readForward, qualityStringForward, qualityScoreForward = ck.end_trim(readForward, qualityStringForward, qualityScoreForward, LEADING, TRAILING)
+
+        ## STEP 2: Remove leading and trailing bases, based on quality - Mean of stride window (see clipperKernels.py)
+        start, end = ck.window_trim(qualityScoreForward, 0, len(qualityScoreForward), WIN_SIZE, AVG_QUALITY, step=WIN_SIZE)
 
         # Trim the read and the encoded quality string accordingly
-        if trailingPopped != 0:
-            readForward = readForward[leadingPopped:-trailingPopped] 
-            qualityStringForward = qualityStringForward[leadingPopped:-trailingPopped]
-        else: 
-            readForward = readForward[leadingPopped:]
-            qualityStringForward = qualityStringForward[leadingPopped:]
+        readForward = readForward[start:end]
+        qualityStringForward = qualityStringForward[start:end]
 
 
 
@@ -197,49 +145,14 @@ while (lineForward or lineReverse) != '':
         qualityScoreReverse = quality_score(qualityStringReverse)
 
         ## STEP 1: Remove leading and trailing bases, given user input
-        if TRAILING != 0:
-            qualityScoreReverse = qualityScoreReverse[LEADING:-TRAILING]
-            qualityStringReverse = qualityStringReverse[LEADING:-TRAILING]
-            readReverse = readReverse[LEADING:-TRAILING]
-        else: 
-            qualityScoreReverse = qualityScoreReverse[LEADING:]
-            qualityStringReverse = qualityStringReverse[LEADING:]
-            readReverse = readReverse[LEADING:]
-
-
-        ## STEP 2: Remove leading and trailing bases, based on quality - Mean of Sliding Window
-        # Count number of leading bases to remove
-        leadingPopped = 0 
-        avgWin = 0     
-        for i in range(0, len(readReverse), WIN_SIZE):
-            avgWin = sum(qualityScoreReverse[i:i+WIN_SIZE])/len(qualityScoreReverse[i:i+WIN_SIZE])
-            if avgWin < AVG_QUALITY:
-                leadingPopped += 4
-                avgWin = 0
-            else:
-                break
-
-        # Count number of trailing bases to remove
-        trailingPopped = 0
-        avgWin = 0
-        for i in range(0, len(readReverse), WIN_SIZE):
-            if i==0:
-                avgWin = sum(qualityScoreReverse[-WIN_SIZE:])/len(qualityScoreReverse[-WIN_SIZE:])
-            else:
-                avgWin = sum(qualityScoreReverse[-WIN_SIZE-i:-i])/len(qualityScoreReverse[-WIN_SIZE-i:-i])
-            if avgWin < AVG_QUALITY:
-                trailingPopped += 4
-                avgWin = 0
-            else:
-                break
+        readReverse, qualityStringReverse, qualityScoreReverse = ck.end_trim(readReverse, qualityStringReverse, qualityScoreReverse, LEADING, TRAILING)
+
+        ## STEP 2: Remove leading and trailing bases, based on quality - Mean of stride window (see clipperKernels.py)
+        start, end = ck.window_trim(qualityScoreReverse, 0, len(qualityScoreReverse), WIN_SIZE, AVG_QUALITY, step=WIN_SIZE)
 
         # Trim the read and the encoded quality string accordingly
-        if trailingPopped != 0:
-            readReverse = readReverse[leadingPopped:-trailingPopped] 
-            qualityStringReverse = qualityStringReverse[leadingPopped:-trailingPopped]
-        else: 
-            readReverse = readReverse[leadingPopped:]
-            qualityStringReverse = qualityStringReverse[leadingPopped:]
+        readReverse = readReverse[start:end]
+        qualityStringReverse = qualityStringReverse[start:end]
 
 
         ## STEP 3: Drop reads that become too short after trimming
@@ -271,16 +184,10 @@ while (lineForward or lineReverse) != '':
         
         ## STEP 4: Drop reads with low average quality
         # Average quality in the forward read
-        sumQualityForward = 0
-        for elem in qualityScoreForward:
-            sumQualityForward += elem
-        avgQualityForward = sumQualityForward/len(qualityScoreForward)
+        avgQualityForward = ck.average_quality(qualityScoreForward)
 
         # Average quality in the reverse read
-        sumQualityReverse = 0
-        for elem in qualityScoreReverse:
-            sumQualityReverse += elem
-        avgQualityReverse = sumQualityReverse/len(qualityScoreReverse)
+        avgQualityReverse = ck.average_quality(qualityScoreReverse)
 
         # Drop trimmed reads with low average quality
         if (avgQualityForward < AVG_QUALITY) or (avgQualityReverse < AVG_QUALITY):